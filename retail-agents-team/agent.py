@@ -70,6 +70,7 @@ root_agent = Agent(
        - Multi-location inventory tracking
        - Delivery time estimates
        - Restock notifications
+       - Cart-wide availability checks before checkout
     
     🛒 shopping_agent
        - Shopping cart management
@@ -88,6 +89,7 @@ root_agent = Agent(
     - For product browsing: product_search_agent → inventory_agent
     - For informed purchases: product_search_agent → review_text_analysis_agent → inventory_agent
     - For cart operations: shopping_agent (may consult inventory_agent)
+    - Before checkout: inventory_agent checks all cart items with one bulk availability check
     - For post-purchase: customer_support_agent
     - For complex queries: Coordinate multiple agents as needed
     
@@ -11,7 +11,11 @@ from .tools import (
     get_inventory_by_region,
     check_demand_forecast,
     get_seasonal_inventory_analysis,
-    get_inventory_statistics
+    get_inventory_statistics,
+    check_bulk_inventory,
+    plan_inventory_restock,
+    get_sales_anomalies,
+    get_rebalancing_plan
 )
 
 root_agent = Agent(
@@ -57,25 +61,29 @@ root_agent = Agent(
     3. **get_low_stock_alerts(threshold, region, category, size)**:
        - Identify products below stock threshold (default: 10 units)
        - Categorize by severity: critical (0), high, medium
+       - Alert totals and severity counts cover every matching product, even beyond `size`
        - Returns: Prioritized list of products needing restock
        - Use when: "Which products need restocking?" or "Show low stock alerts"
 
-    4. **get_inventory_by_region(region, category, size)**:
+    4. **get_inventory_by_region(region, category, size, include_items)**:
        - Get comprehensive regional inventory view
-       - Aggregates by stores, categories, and totals
-       - Returns: Regional statistics and store-level data
+       - Exact totals, store count and category breakdown from aggregations
+       - Returns: Regional statistics; raw records only when include_items=True
        - Use when: "What's inventory like in the North region?" or "Regional stock overview"
 
-    5. **check_demand_forecast(product_id, category, region, size)**:
+    5. **check_demand_forecast(product_id, category, region, size, forecast_source, horizon_days)**:
        - Compare current inventory vs. demand forecasts
        - Identify shortage gaps and restock needs
+       - forecast_source="model" uses forecasts fitted on the daily Units Sold history
+         (moving average, exponential smoothing or seasonal naive, best per product/store),
+         summed over horizon_days (1-90)
        - Returns: Forecast analysis with recommendations
        - Use when: "Will we have enough stock?" or "Do we need to reorder?"
 
-    6. **get_seasonal_inventory_analysis(seasonality, region, size)**:
+    6. **get_seasonal_inventory_analysis(seasonality, region, size, include_products)**:
        - Analyze inventory for seasonal products (Summer/Winter/Spring/Fall)
-       - Calculate readiness scores (inventory vs. demand)
-       - Returns: Seasonal preparedness and category breakdown
+       - Calculate exact readiness scores (inventory vs. demand) over the whole season
+       - Returns: Seasonal preparedness with category and region breakdowns
        - Use when: "Are we ready for summer?" or "Winter inventory status"
 
     7. **get_inventory_statistics()**:
@@ -84,13 +92,49 @@ root_agent = Agent(
        - Returns: Dashboard-style overview of entire inventory
        - Use when: "Give me inventory overview" or "Overall stock statistics"
 
+    8. **check_bulk_inventory(product_ids, store_id, region)**:
+       - Check stock for many products in one query (e.g., every item in a cart)
+       - Same stock_status classification as check_product_inventory
+       - Returns: Per-product status, unavailable products, all_available flag
+       - Use when: "Is everything in my cart available?" or before checkout
+
+    9. **plan_inventory_restock(product_id, category, region, cover_days, top_n, file_name)**:
+       - Build a restock plan over every matching product/store, not just one page of results
+       - Computes shortage, days of cover and suggested order quantity (net of units on order)
+       - Returns: Plan totals, top priority rows, and optionally a full CSV/Parquet export (download path)
+       - Use when: "What should we reorder this week?" or "Export a restock plan for Electronics"
+
+    10. **get_sales_anomalies(region, category, store_id, direction, min_score, top_n)**:
+       - Find product/store pairs whose latest-day Units Sold is abnormal vs. their recent history
+       - Scores: rolling z-score and robust (median absolute deviation) score; direction spike/drop/both
+       - Returns: Anomaly counts and the strongest anomalies with expected vs. actual units
+       - Use when: "Any unusual sales today?" or "Which stores had a sales drop in the South?"
+
+    11. **get_rebalancing_plan(category, region, product_id, cover_days, cross_region, top_n)**:
+       - Suggest transfers from overstocked stores to stores short of the same product
+       - Stays within a region unless cross_region=True; largest surpluses fill largest shortages first
+       - Returns: Transfer list (from/to store, quantity), coverage of the shortage, remaining need
+       - Use when: "Can we cover these low-stock stores from other stores?" or "Rebalance Electronics in the North"
+
+    **Current Stock vs. History**:
+    - By default every tool reads the latest-state snapshot (one record per Product ID + Store ID),
+      which answers "how many are in stock now" without scanning daily history
+    - Pass history=True for questions about past records or trends over time; every tool accepts it
+      except get_sales_anomalies() and get_rebalancing_plan(), which always read the daily history and
+      the latest snapshot respectively
+    - If a response has snapshot_pending=True, the snapshot is still being built and totals include every
+      day of history; say so when reporting current stock
+
     **Best Practices**:
 
     - Always start with check_product_inventory() for specific product queries
+    - Use check_bulk_inventory() instead of repeated check_product_inventory() calls for multiple products
     - Use get_low_stock_alerts() proactively to identify restocking needs
     - Combine regional filters when user specifies location
     - Present stock status clearly: in_stock, moderate_stock, low_stock, out_of_stock, critical
     - Provide actionable recommendations based on demand forecasts
+    - Use plan_inventory_restock() for reorder plans across a whole category or region
+    - When get_low_stock_alerts() flags stores, check get_rebalancing_plan() before recommending new orders
     - Highlight urgent alerts (out of stock, critical low stock)
     - Use get_inventory_statistics() for executive-level summaries
     - Consider seasonal patterns when analyzing inventory needs
@@ -114,6 +158,10 @@ root_agent = Agent(
         get_inventory_by_region,
         check_demand_forecast,
         get_seasonal_inventory_analysis,
-        get_inventory_statistics
+        get_inventory_statistics,
+        check_bulk_inventory,
+        plan_inventory_restock,
+        get_sales_anomalies,
+        get_rebalancing_plan
     ]
 )
@@ -0,0 +1,223 @@
+"""
+Sales Anomaly Detection
+Flags product/store pairs whose latest daily `Units Sold` is abnormal.
+
+The daily series of every product/store pair (see forecasting.DailySeries) is
+scored in one vectorized pass: the latest day is compared with the trailing
+ANOMALY_WINDOW days of the same series using
+
+- z_score: (units - rolling mean) / rolling standard deviation
+- robust_score: (units - rolling median) / (1.4826 × median absolute deviation)
+
+Both scales are floored at MIN_SCALE units so flat, low-volume series do not
+produce infinite scores. Results are precomputed per index and recomputed every
+INVENTORY_ANOMALY_REFRESH_SECONDS in a background thread, so the tool answers
+from memory; the previous scores keep answering until the new ones are ready.
+Only the very first call for an index waits on the computation. After a failed
+recompute the previous scores are served for INVENTORY_ANOMALY_RETRY_SECONDS
+before trying again.
+"""
+
+import os
+import time
+import logging
+import warnings
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .snapshot import SOURCE_INDEX
+from .columnar import InventoryColumnStore, to_number
+from .forecasting import DailySeries, build_daily_series
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.getenv("INVENTORY_ANOMALY_REFRESH_SECONDS", "900"))
+RETRY_SECONDS = float(os.getenv("INVENTORY_ANOMALY_RETRY_SECONDS", "300"))
+ANOMALY_WINDOW = int(os.getenv("INVENTORY_ANOMALY_WINDOW_DAYS", "28"))
+MIN_OBSERVATIONS = 7
+MIN_SCALE = 1.0
+
+
+class SalesAnomalyDetector:
+    """Latest-day anomaly scores for every product/store series of one index."""
+
+    def __init__(self, series: DailySeries, window: int = ANOMALY_WINDOW):
+        self.series = series
+        self.window = window
+        self.computed_at: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.units = np.empty(0, dtype=np.float32)
+        self.mean = np.empty(0, dtype=np.float32)
+        self.median = np.empty(0, dtype=np.float32)
+        self.z_score = np.empty(0, dtype=np.float32)
+        self.robust_score = np.empty(0, dtype=np.float32)
+        self.valid = np.empty(0, dtype=bool)
+
+    def compute(self) -> "SalesAnomalyDetector":
+        """Score the latest day of every series against its trailing window."""
+        started = time.perf_counter()
+        values = self.series.values
+        history = values[:, max(values.shape[1] - 1 - self.window, 0):-1]
+        today = values[:, -1]
+
+        with warnings.catch_warnings():
+            # Series without observations in the window produce all-NaN slices
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(history, axis=1)
+            std = np.nanstd(history, axis=1)
+            median = np.nanmedian(history, axis=1)
+            mad = np.nanmedian(np.abs(history - median[:, None]), axis=1)
+
+        self.units = today
+        self.mean = mean
+        self.median = median
+        self.z_score = (today - mean) / np.maximum(np.nan_to_num(std), MIN_SCALE)
+        self.robust_score = (today - median) / np.maximum(np.nan_to_num(1.4826 * mad), MIN_SCALE)
+        self.valid = ~np.isnan(today) & ((~np.isnan(history)).sum(axis=1) >= MIN_OBSERVATIONS)
+
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.refreshed_at = time.monotonic()
+        logger.info(
+            f"Scored {int(self.valid.sum())} of {self.series.series_count} sales series for anomalies "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return self
+
+    def top_anomalies(
+        self,
+        region: Optional[str] = None,
+        category: Optional[str] = None,
+        store_id: Optional[str] = None,
+        direction: str = "both",
+        min_score: float = 3.5,
+        top_n: int = 20
+    ) -> Dict[str, Any]:
+        """Rank the flagged series by absolute robust score."""
+        rows = self.series.select(category=category, region=region, store_id=store_id)
+        rows = rows[self.valid[rows]]
+        scores = self.robust_score[rows]
+
+        if direction == "spike":
+            flagged = scores >= min_score
+        elif direction == "drop":
+            flagged = scores <= -min_score
+        else:
+            flagged = np.abs(scores) >= min_score
+
+        rows = rows[flagged]
+        order = np.argsort(-np.abs(self.robust_score[rows]), kind="stable")[:top_n]
+
+        anomalies = []
+        for row in rows[order]:
+            anomalies.append({
+                "product_id": self.series.product[row],
+                "store_id": self.series.store[row],
+                "category": self.series.category[row],
+                "region": self.series.region[row],
+                "units_sold": to_number(self.units[row]),
+                "expected_units": to_number(round(float(self.median[row]), 2)),
+                "rolling_mean": round(float(self.mean[row]), 2),
+                "z_score": round(float(self.z_score[row]), 2),
+                "robust_score": round(float(self.robust_score[row]), 2),
+                "direction": "spike" if self.robust_score[row] > 0 else "drop"
+            })
+
+        return {
+            "date": self.series.day_label(self.series.day_count - 1),
+            "window_days": self.window,
+            "series_evaluated": int(len(scores)),
+            "total_anomalies": int(flagged.sum()),
+            "spikes": int((scores >= min_score).sum()),
+            "drops": int((scores <= -min_score).sum()),
+            "anomalies": anomalies,
+            "min_score": min_score,
+            "filters_applied": {
+                "region": region,
+                "category": category,
+                "store_id": store_id,
+                "direction": direction
+            },
+            "computed_at": self.computed_at
+        }
+
+
+# ============================================================================
+# Detector Registry
+# ============================================================================
+
+_detector_lock = threading.Lock()
+_detectors: Dict[str, SalesAnomalyDetector] = {}
+_failed_at: Dict[str, float] = {}
+_recomputing: Dict[str, threading.Thread] = {}
+
+
+def _compute_detector(
+    es: Elasticsearch,
+    index: str,
+    engine: Optional[InventoryColumnStore]
+) -> SalesAnomalyDetector:
+    series = build_daily_series(es, index, engine=engine, lookback_days=ANOMALY_WINDOW + 1)
+    return SalesAnomalyDetector(series).compute()
+
+
+def _recompute(es: Elasticsearch, index: str, engine: Optional[InventoryColumnStore]) -> None:
+    try:
+        detector = _compute_detector(es, index, engine)
+        with _detector_lock:
+            _detectors[index] = detector
+            _failed_at.pop(index, None)
+    except Exception as e:
+        logger.warning(f"Anomaly score recompute failed for {index}, serving the previous scores: {str(e)}")
+        with _detector_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _detector_lock:
+            _recomputing.pop(index, None)
+
+
+def get_anomaly_detector(
+    es: Elasticsearch,
+    index: str = SOURCE_INDEX,
+    engine: Optional[InventoryColumnStore] = None
+) -> SalesAnomalyDetector:
+    """
+    Return the precomputed anomaly scores for an index.
+
+    The first call computes them synchronously. Once they are older than
+    INVENTORY_ANOMALY_REFRESH_SECONDS a background thread recomputes them while
+    the current scores keep being returned.
+
+    Args:
+        es: Elasticsearch client
+        index: Daily inventory index
+        engine: Optional columnar engine to build the series from
+
+    Returns:
+        Scored SalesAnomalyDetector
+    """
+    with _detector_lock:
+        detector = _detectors.get(index)
+        if detector is None:
+            detector = _compute_detector(es, index, engine)
+            _detectors[index] = detector
+            return detector
+
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _recomputing
+            and now - detector.refreshed_at >= REFRESH_SECONDS
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _recomputing[index] = threading.Thread(
+                target=_recompute,
+                args=(es, index, engine),
+                name=f"anomalies-{index}",
+                daemon=True
+            )
+            _recomputing[index].start()
+        return detector
@@ -0,0 +1,490 @@
+"""
+Columnar Inventory Engine
+Optional in-process engine holding retail_store_inventory as typed NumPy columns.
+
+The whole inventory history (a few million rows) fits in memory as column arrays:
+numeric fields as float32, `Date` as int64 epoch milliseconds, and Product ID,
+Store ID, Region, Category and Seasonality dictionary-encoded to int32 codes.
+A per-(Product ID, Store ID) index of the latest row provides the current-stock
+view, so the analytical inventory tools are answered with vectorized operations
+instead of cluster round trips.
+
+Enable it with INVENTORY_ENGINE=columnar. The engine loads once, then every
+INVENTORY_ENGINE_REFRESH_SECONDS re-reads only records at or after its `Date`
+watermark and replaces the rows of the watermark day, so rows ingested later for
+that day are picked up without duplicating the ones already held.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .pit_scan import scan_documents
+from .snapshot import SOURCE_INDEX
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.getenv("INVENTORY_ENGINE_REFRESH_SECONDS", "60"))
+
+NUMERIC_FIELDS = {
+    "inventory": "Inventory Level",
+    "units_sold": "Units Sold",
+    "units_ordered": "Units Ordered",
+    "demand": "Demand Forecast",
+    "price": "Price",
+    "discount": "Discount"
+}
+
+CATEGORICAL_FIELDS = {
+    "product": "Product ID",
+    "store": "Store ID",
+    "region": "Region",
+    "category": "Category",
+    "seasonality": "Seasonality"
+}
+
+
+def to_number(value: Any) -> Any:
+    """Convert NumPy scalars to plain Python numbers for JSON responses."""
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class _Dictionary:
+    """Dictionary encoding for a string column."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, items: List[Any]) -> np.ndarray:
+        out = np.empty(len(items), dtype=np.int32)
+        for i, item in enumerate(items):
+            key = "Unknown" if item is None else str(item)
+            code = self.codes.get(key)
+            if code is None:
+                code = len(self.values)
+                self.codes[key] = code
+                self.values.append(key)
+            out[i] = code
+        return out
+
+    def match(self, value: str, ignore_case: bool = False) -> np.ndarray:
+        """Codes whose value equals the given value."""
+        if ignore_case:
+            wanted = value.lower()
+            return np.array([c for v, c in self.codes.items() if v.lower() == wanted], dtype=np.int32)
+        code = self.codes.get(value)
+        return np.array([] if code is None else [code], dtype=np.int32)
+
+
+class InventoryColumnStore:
+    """In-memory column store for one inventory index."""
+
+    def __init__(self, index: str = SOURCE_INDEX):
+        self.index = index
+        self.dictionaries = {name: _Dictionary() for name in CATEGORICAL_FIELDS}
+        self.columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=np.float32) for name in NUMERIC_FIELDS}
+        self.columns.update({name: np.empty(0, dtype=np.int32) for name in CATEGORICAL_FIELDS})
+        self.columns["date"] = np.empty(0, dtype=np.int64)
+        self.latest = np.empty(0, dtype=np.int64)
+        self.watermark: Optional[int] = None
+        self.refreshed_at = 0.0
+
+    # ------------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------------
+
+    @property
+    def row_count(self) -> int:
+        return len(self.columns["date"])
+
+    def load(self, es: Elasticsearch, page_size: int = 5000) -> int:
+        """
+        Load rows at or after the watermark (everything on first load).
+
+        Rows of the watermark day are re-read and replace the held ones. Pages are
+        collected per column and concatenated once, and the columns are only swapped
+        after the scan completed.
+        """
+        query = {"range": {"Date": {"gte": self.watermark, "format": "epoch_millis"}}} \
+            if self.watermark is not None else None
+
+        started = time.perf_counter()
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name in self.columns}
+        loaded = 0
+        for hits in scan_documents(
+            es,
+            self.index,
+            query=query,
+            source=list(NUMERIC_FIELDS.values()) + list(CATEGORICAL_FIELDS.values()),
+            docvalue_fields=[{"field": "Date", "format": "epoch_millis"}],
+            page_size=page_size
+        ):
+            for name, values in self._encode(hits).items():
+                chunks[name].append(values)
+            loaded += len(hits)
+
+        if loaded:
+            keep = self.columns["date"] < self.watermark if self.watermark is not None \
+                else np.ones(self.row_count, dtype=bool)
+            self.columns = {
+                name: np.concatenate([values[keep]] + chunks[name])
+                for name, values in self.columns.items()
+            }
+            self._rebuild_indexes()
+        self.refreshed_at = time.monotonic()
+        logger.info(
+            f"Columnar inventory engine loaded {loaded} rows in {time.perf_counter() - started:.1f}s "
+            f"({self.row_count} total)"
+        )
+        return loaded
+
+    def _encode(self, hits: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Typed column arrays for one page of hits."""
+        sources = [hit['_source'] for hit in hits]
+        new_columns = {
+            name: np.array([s.get(field) or 0 for s in sources], dtype=np.float32)
+            for name, field in NUMERIC_FIELDS.items()
+        }
+        new_columns.update({
+            name: self.dictionaries[name].encode([s.get(field) for s in sources])
+            for name, field in CATEGORICAL_FIELDS.items()
+        })
+        new_columns["date"] = np.array(
+            [int(float(hit.get('fields', {}).get('Date', [0])[0])) for hit in hits],
+            dtype=np.int64
+        )
+        return new_columns
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild the latest-row-per-(product, store) index and the watermark."""
+        dates = self.columns["date"]
+        pair = self.columns["product"].astype(np.int64) * max(len(self.dictionaries["store"].values), 1) \
+            + self.columns["store"]
+        order = np.lexsort((dates, pair))
+        sorted_pair = pair[order]
+        is_last = np.ones(len(order), dtype=bool)
+        is_last[:-1] = sorted_pair[1:] != sorted_pair[:-1]
+        self.latest = order[is_last]
+        self.watermark = int(dates.max()) if len(dates) else None
+
+    # ------------------------------------------------------------------------
+    # Selection helpers
+    # ------------------------------------------------------------------------
+
+    def select_rows(
+        self,
+        history: bool,
+        region: Optional[str] = None,
+        category: Optional[str] = None,
+        product_id: Optional[str] = None,
+        seasonality: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Row positions matching the filters, for reading `columns` directly.
+
+        Args:
+            history: Select from every row instead of the latest row per product/store
+            region: Region to filter by
+            category: Category to filter by (case-insensitive)
+            product_id: Product ID to filter by
+            seasonality: Seasonality to filter by
+
+        Returns:
+            Array of row positions into the column arrays
+        """
+        rows = np.arange(self.row_count) if history else self.latest
+        for name, value, ignore_case in (
+            ("region", region, False),
+            ("category", category, True),
+            ("product", product_id, False),
+            ("seasonality", seasonality, False)
+        ):
+            if value:
+                codes = self.dictionaries[name].match(value, ignore_case=ignore_case)
+                rows = rows[np.isin(self.columns[name][rows], codes)]
+        return rows
+
+    def _decode(self, name: str, row: int) -> str:
+        return self.dictionaries[name].values[self.columns[name][row]]
+
+    def _date(self, row: int) -> str:
+        return str(np.datetime64(int(self.columns["date"][row]), "ms").astype("datetime64[D]"))
+
+    def _grouped_sums(self, name: str, rows: np.ndarray, fields: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Per-value sums of the given columns plus row counts, via bincount."""
+        codes = self.columns[name][rows]
+        size = len(self.dictionaries[name].values)
+        counts = np.bincount(codes, minlength=size)
+        sums = {
+            key: np.bincount(codes, weights=self.columns[column][rows], minlength=size)
+            for key, column in fields.items()
+        }
+        return {
+            self.dictionaries[name].values[code]: {
+                **{key: to_number(round(float(values[code]), 2)) for key, values in sums.items()},
+                "count": int(counts[code])
+            }
+            for code in np.flatnonzero(counts)
+        }
+
+    # ------------------------------------------------------------------------
+    # Tool implementations
+    # ------------------------------------------------------------------------
+
+    def low_stock_alerts(
+        self,
+        threshold: int = 10,
+        region: Optional[str] = None,
+        category: Optional[str] = None,
+        size: int = 100,
+        history: bool = False
+    ) -> Dict[str, Any]:
+        rows = self.select_rows(history, region=region, category=category)
+        inventory = self.columns["inventory"]
+        rows = rows[inventory[rows] <= threshold]
+        levels = inventory[rows]
+
+        critical = levels == 0
+        high = ~critical & (levels <= threshold / 2)
+        medium = ~critical & ~high
+
+        shown = rows[np.argsort(levels, kind="stable")[:size]]
+        alerts = []
+        for row in shown:
+            level = inventory[row]
+            severity = "critical" if level == 0 else "high" if level <= threshold / 2 else "medium"
+            alerts.append({
+                "severity": severity,
+                "product_id": self._decode("product", row),
+                "store_id": self._decode("store", row),
+                "category": self._decode("category", row),
+                "region": self._decode("region", row),
+                "inventory_level": to_number(level),
+                "units_sold": to_number(self.columns["units_sold"][row]),
+                "demand_forecast": to_number(self.columns["demand"][row]),
+                "date": self._date(row)
+            })
+
+        return {
+            "threshold": threshold,
+            "total_alerts": int(len(rows)),
+            "alerts_shown": len(alerts),
+            "critical_alerts": int(critical.sum()),
+            "high_alerts": int(high.sum()),
+            "low_stock_alerts": int(medium.sum()),
+            "alerts": alerts,
+            "filters_applied": {
+                "region": region,
+                "category": category
+            },
+            "engine": "columnar"
+        }
+
+    def inventory_by_region(
+        self,
+        region: str,
+        category: Optional[str] = None,
+        size: int = 100,
+        history: bool = False,
+        include_items: bool = False
+    ) -> Dict[str, Any]:
+        rows = self.select_rows(history, region=region, category=category)
+        store_codes = np.unique(self.columns["store"][rows])
+        categories = self._grouped_sums("category", rows, {"inventory": "inventory", "sold": "units_sold"})
+
+        result = {
+            "region": region,
+            "total_inventory": to_number(self.columns["inventory"][rows].sum(dtype=np.float64)),
+            "total_units_sold": to_number(self.columns["units_sold"][rows].sum(dtype=np.float64)),
+            "store_count": int(len(store_codes)),
+            "stores": [self.dictionaries["store"].values[code] for code in store_codes],
+            "categories": categories,
+            "total_results": int(len(rows)),
+            "engine": "columnar"
+        }
+        if include_items:
+            result["inventory_items"] = [
+                {
+                    "product_id": self._decode("product", row),
+                    "store_id": self._decode("store", row),
+                    "category": self._decode("category", row),
+                    "inventory_level": to_number(self.columns["inventory"][row]),
+                    "units_sold": to_number(self.columns["units_sold"][row]),
+                    "price": to_number(self.columns["price"][row]),
+                    "date": self._date(row)
+                }
+                for row in rows[:size]
+            ]
+        return result
+
+    def demand_forecast(
+        self,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        region: Optional[str] = None,
+        size: int = 50,
+        history: bool = False
+    ) -> Dict[str, Any]:
+        rows = self.select_rows(history, region=region, category=category, product_id=product_id)
+        shortage = self.columns["demand"][rows] - self.columns["inventory"][rows]
+        needs_restock = shortage > 0
+
+        forecasts = []
+        for row, row_shortage, row_needs in zip(rows[:size], shortage[:size], needs_restock[:size]):
+            forecasts.append({
+                "product_id": self._decode("product", row),
+                "store_id": self._decode("store", row),
+                "category": self._decode("category", row),
+                "region": self._decode("region", row),
+                "current_inventory": to_number(self.columns["inventory"][row]),
+                "demand_forecast": to_number(self.columns["demand"][row]),
+                "shortage": to_number(max(0.0, float(row_shortage))),
+                "needs_restock": bool(row_needs),
+                "units_sold": to_number(self.columns["units_sold"][row]),
+                "units_ordered": to_number(self.columns["units_ordered"][row]),
+                "date": self._date(row)
+            })
+        restock_needed = [f for f in forecasts if f["needs_restock"]]
+
+        return {
+            "total_products": len(forecasts),
+            "restock_required": len(restock_needed),
+            "total_matching": int(len(rows)),
+            "total_restock_required": int(needs_restock.sum()),
+            "forecasts": forecasts,
+            "restock_recommendations": restock_needed,
+            "filters_applied": {
+                "product_id": product_id,
+                "category": category,
+                "region": region
+            },
+            "engine": "columnar"
+        }
+
+    def seasonal_analysis(
+        self,
+        seasonality: str,
+        region: Optional[str] = None,
+        size: int = 100,
+        history: bool = False,
+        include_products: bool = False
+    ) -> Dict[str, Any]:
+        rows = self.select_rows(history, region=region, seasonality=seasonality)
+        total_inventory = float(self.columns["inventory"][rows].sum(dtype=np.float64))
+        total_demand = float(self.columns["demand"][rows].sum(dtype=np.float64))
+        readiness = round(total_inventory / total_demand * 100, 2) if total_demand > 0 else 0
+
+        def breakdown(name: str) -> Dict[str, Dict[str, Any]]:
+            return {
+                key: {
+                    "inventory": values["inventory"],
+                    "demand": values["demand"],
+                    "products": values["count"],
+                    "readiness_score": round(values["inventory"] / values["demand"] * 100, 2)
+                    if values["demand"] > 0 else 0
+                }
+                for key, values in self._grouped_sums(
+                    name, rows, {"inventory": "inventory", "demand": "demand"}
+                ).items()
+            }
+
+        result = {
+            "seasonality": seasonality,
+            "region": region,
+            "total_inventory": to_number(total_inventory),
+            "total_demand_forecast": to_number(total_demand),
+            "readiness_score": readiness,
+            "readiness_status": "Ready" if readiness >= 100 else "Needs Restocking",
+            "categories": breakdown("category"),
+            "regions": breakdown("region"),
+            "total_results": int(len(rows)),
+            "engine": "columnar"
+        }
+        if include_products:
+            result["products"] = [
+                {
+                    "product_id": self._decode("product", row),
+                    "store_id": self._decode("store", row),
+                    "category": self._decode("category", row),
+                    "region": self._decode("region", row),
+                    "inventory_level": to_number(self.columns["inventory"][row]),
+                    "demand_forecast": to_number(self.columns["demand"][row]),
+                    "units_sold": to_number(self.columns["units_sold"][row]),
+                    "price": to_number(self.columns["price"][row]),
+                    "discount": to_number(self.columns["discount"][row]),
+                    "date": self._date(row)
+                }
+                for row in rows[:size]
+            ]
+        return result
+
+    def statistics(self, history: bool = False) -> Dict[str, Any]:
+        rows = self.select_rows(history)
+        inventory = self.columns["inventory"][rows]
+        category_counts = np.bincount(self.columns["category"][rows], minlength=len(self.dictionaries["category"].values))
+        region_counts = np.bincount(self.columns["region"][rows], minlength=len(self.dictionaries["region"].values))
+
+        return {
+            "total_products": int(len(rows)),
+            "total_inventory": int(inventory.sum(dtype=np.float64)),
+            "total_units_sold": int(self.columns["units_sold"][rows].sum(dtype=np.float64)),
+            "total_units_ordered": int(self.columns["units_ordered"][rows].sum(dtype=np.float64)),
+            "unique_stores": int(len(np.unique(self.columns["store"][rows]))),
+            "average_inventory_per_product": round(float(inventory.mean()), 2) if len(rows) else 0,
+            "average_price": round(float(self.columns["price"][rows].mean()), 2) if len(rows) else 0,
+            "low_stock_products": int((inventory <= 10).sum()),
+            "out_of_stock_products": int((inventory == 0).sum()),
+            "categories": [
+                {"category": self.dictionaries["category"].values[code], "product_count": int(category_counts[code])}
+                for code in np.argsort(-category_counts, kind="stable") if category_counts[code] > 0
+            ],
+            "regions": [
+                {"region": self.dictionaries["region"].values[code], "product_count": int(region_counts[code])}
+                for code in np.argsort(-region_counts, kind="stable") if region_counts[code] > 0
+            ],
+            "engine": "columnar"
+        }
+
+
+# ============================================================================
+# Engine Registry
+# ============================================================================
+
+_engine_lock = threading.Lock()
+_engines: Dict[str, InventoryColumnStore] = {}
+
+
+def columnar_engine_enabled() -> bool:
+    return os.getenv("INVENTORY_ENGINE", "elasticsearch").lower() == "columnar"
+
+
+def get_inventory_engine(es: Elasticsearch, index: str = SOURCE_INDEX) -> InventoryColumnStore:
+    """
+    Return the loaded column store for an index, refreshing it incrementally
+    when it is older than INVENTORY_ENGINE_REFRESH_SECONDS.
+
+    Args:
+        es: Elasticsearch client
+        index: Inventory index to mirror
+
+    Returns:
+        Ready-to-query InventoryColumnStore
+    """
+    with _engine_lock:
+        engine = _engines.get(index)
+        if engine is None:
+            engine = InventoryColumnStore(index)
+            engine.load(es)
+            _engines[index] = engine
+        elif time.monotonic() - engine.refreshed_at >= REFRESH_SECONDS:
+            engine.load(es)
+        return engine
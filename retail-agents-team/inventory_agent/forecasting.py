@@ -0,0 +1,478 @@
+"""
+Demand Forecasting Engine
+Fits per product/store demand models on the daily `Units Sold` history.
+
+Every product/store pair becomes one row of a dense series × day matrix (days
+without a record are NaN). Three models are fitted for all series at once with
+array operations:
+
+- moving_average: mean of the last FORECAST_WINDOW observed days
+- exponential_smoothing: simple exponential smoothing, alpha chosen per series
+  from a grid by one-step-ahead squared error
+- seasonal_naive: the value observed one week earlier
+
+The model with the lowest one-step-ahead mean absolute error is kept for each
+series. Fitted parameters are cached per index and refit every
+INVENTORY_FORECAST_REFRESH_SECONDS in a background thread, so forecasts are
+served from memory; the previous fit keeps answering until the new one is ready.
+Only the very first call for an index waits on the fit. After a failed refit
+the previous fit is served for INVENTORY_FORECAST_RETRY_SECONDS before trying
+again.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .pit_scan import scan_documents
+from .snapshot import SOURCE_INDEX
+from .columnar import InventoryColumnStore, to_number
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.getenv("INVENTORY_FORECAST_REFRESH_SECONDS", "3600"))
+RETRY_SECONDS = float(os.getenv("INVENTORY_FORECAST_RETRY_SECONDS", "300"))
+LOOKBACK_DAYS = int(os.getenv("INVENTORY_FORECAST_LOOKBACK_DAYS", "365"))
+FORECAST_WINDOW = 7
+SEASON_LENGTH = 7
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9], dtype=np.float32)
+MODELS = ("moving_average", "exponential_smoothing", "seasonal_naive")
+
+DAY_MS = 86400000
+
+
+# ============================================================================
+# Daily Series
+# ============================================================================
+
+class DailySeries:
+    """Daily Units Sold for every product/store pair as a [series, day] matrix."""
+
+    def __init__(
+        self,
+        product: np.ndarray,
+        store: np.ndarray,
+        category: np.ndarray,
+        region: np.ndarray,
+        inventory: np.ndarray,
+        values: np.ndarray,
+        first_day: int
+    ):
+        self.product = product
+        self.store = store
+        self.category = category
+        self.region = region
+        self.inventory = inventory
+        self.values = values
+        self.first_day = first_day
+
+    @property
+    def series_count(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def day_count(self) -> int:
+        return self.values.shape[1]
+
+    def day_label(self, offset: int) -> str:
+        """ISO date of a day column."""
+        return str(np.datetime64(self.first_day + offset, "D"))
+
+    def select(
+        self,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        region: Optional[str] = None,
+        store_id: Optional[str] = None
+    ) -> np.ndarray:
+        """Series indices matching the filters (category ignores case)."""
+        mask = np.ones(self.series_count, dtype=bool)
+        if product_id:
+            mask &= self.product == product_id
+        if store_id:
+            mask &= self.store == store_id
+        if region:
+            mask &= self.region == region
+        if category:
+            mask &= np.char.lower(self.category.astype(str)) == category.lower()
+        return np.flatnonzero(mask)
+
+
+def _assemble_series(
+    product: np.ndarray,
+    store: np.ndarray,
+    category: np.ndarray,
+    region: np.ndarray,
+    inventory: np.ndarray,
+    units_sold: np.ndarray,
+    dates: np.ndarray,
+    lookback_days: int
+) -> DailySeries:
+    days = dates // DAY_MS
+    last_day = int(days.max()) if len(days) else 0
+    first_day = max(int(days.min()) if len(days) else 0, last_day - lookback_days + 1)
+
+    pair_keys = np.char.add(np.char.add(product.astype(str), "::"), store.astype(str))
+    unique_keys, first_row, series_index = np.unique(pair_keys, return_index=True, return_inverse=True)
+
+    # Latest Inventory Level per series: last row after sorting by (series, date)
+    order = np.lexsort((dates, series_index))
+    is_last = np.ones(len(order), dtype=bool)
+    is_last[:-1] = series_index[order][1:] != series_index[order][:-1]
+    latest_inventory = np.zeros(len(unique_keys), dtype=np.float32)
+    latest_inventory[series_index[order][is_last]] = inventory[order][is_last]
+
+    values = np.full((len(unique_keys), last_day - first_day + 1), np.nan, dtype=np.float32)
+    in_window = days >= first_day
+    values[series_index[in_window], days[in_window] - first_day] = units_sold[in_window]
+
+    return DailySeries(
+        product=product[first_row],
+        store=store[first_row],
+        category=category[first_row],
+        region=region[first_row],
+        inventory=latest_inventory,
+        values=values,
+        first_day=first_day
+    )
+
+
+def build_daily_series(
+    es: Elasticsearch,
+    index: str = SOURCE_INDEX,
+    engine: Optional[InventoryColumnStore] = None,
+    lookback_days: int = LOOKBACK_DAYS,
+    page_size: int = 5000
+) -> DailySeries:
+    """
+    Build the series × day Units Sold matrix.
+
+    Uses the columnar engine's arrays when one is given, otherwise scans the
+    last `lookback_days` of the daily history index once with a point-in-time.
+
+    Args:
+        es: Elasticsearch client
+        index: Daily inventory index
+        engine: Optional loaded InventoryColumnStore for the same index
+        lookback_days: Number of most recent days to keep
+        page_size: Records per request when scanning
+
+    Returns:
+        DailySeries
+    """
+    if engine is not None:
+        def decode(name: str) -> np.ndarray:
+            return np.array(engine.dictionaries[name].values, dtype=object)[engine.columns[name]]
+
+        return _assemble_series(
+            decode("product"),
+            decode("store"),
+            decode("category"),
+            decode("region"),
+            engine.columns["inventory"],
+            engine.columns["units_sold"],
+            engine.columns["date"],
+            lookback_days
+        )
+
+    # Only scan the days that are kept
+    max_date = es.search(
+        index=index,
+        body={"size": 0, "aggs": {"max_date": {"max": {"field": "Date"}}}}
+    )['aggregations']['max_date'].get('value')
+    query = None
+    if max_date is not None:
+        first_day = int(max_date) // DAY_MS - lookback_days + 1
+        query = {"range": {"Date": {"gte": first_day * DAY_MS, "format": "epoch_millis"}}}
+
+    fields = {"Product ID": [], "Store ID": [], "Category": [], "Region": []}
+    inventory: List[float] = []
+    units_sold: List[float] = []
+    dates: List[int] = []
+    for hits in scan_documents(
+        es,
+        index,
+        query=query,
+        source=list(fields) + ["Inventory Level", "Units Sold"],
+        docvalue_fields=[{"field": "Date", "format": "epoch_millis"}],
+        page_size=page_size
+    ):
+        for hit in hits:
+            source = hit['_source']
+            for field, values in fields.items():
+                value = source.get(field)
+                values.append("Unknown" if value is None else str(value))
+            inventory.append(source.get('Inventory Level') or 0)
+            units_sold.append(source.get('Units Sold') or 0)
+            dates.append(int(float(hit.get('fields', {}).get('Date', [0])[0])))
+
+    return _assemble_series(
+        np.array(fields["Product ID"], dtype=object),
+        np.array(fields["Store ID"], dtype=object),
+        np.array(fields["Category"], dtype=object),
+        np.array(fields["Region"], dtype=object),
+        np.array(inventory, dtype=np.float32),
+        np.array(units_sold, dtype=np.float32),
+        np.array(dates, dtype=np.int64),
+        lookback_days
+    )
+
+
+# ============================================================================
+# Vectorized Models
+# ============================================================================
+
+def _rolling_mean_predictions(values: np.ndarray, window: int) -> np.ndarray:
+    """One-step-ahead moving-average prediction for every day (NaN-aware)."""
+    observed = ~np.isnan(values)
+    filled = np.where(observed, values, 0).astype(np.float64)
+    sums = np.concatenate([np.zeros((len(values), 1)), np.cumsum(filled, axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(values), 1)), np.cumsum(observed, axis=1)], axis=1)
+
+    # Prediction for day t uses days [t - window, t)
+    upper = np.arange(values.shape[1])
+    lower = np.maximum(upper - window, 0)
+    window_sums = sums[:, upper] - sums[:, lower]
+    window_counts = counts[:, upper] - counts[:, lower]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+
+def _exponential_smoothing(values: np.ndarray):
+    """
+    Fit simple exponential smoothing for every series and every alpha in ALPHAS.
+
+    Only running error sums are kept per (alpha, series), so memory does not
+    grow with the length of the history.
+
+    Returns:
+        Tuple of (best alpha, final level, one-step mean absolute error) per series
+    """
+    n, days = values.shape
+    levels = np.full((len(ALPHAS), n), np.nan, dtype=np.float32)
+    squared_errors = np.zeros((len(ALPHAS), n), dtype=np.float64)
+    absolute_errors = np.zeros((len(ALPHAS), n), dtype=np.float64)
+    scored = np.zeros(n, dtype=np.int64)
+    alphas = ALPHAS[:, None]
+
+    for t in range(days):
+        y = values[:, t]
+        observed = ~np.isnan(y)
+        has_level = ~np.isnan(levels[0])
+        error = np.where(observed & has_level, y - levels, 0)
+        squared_errors += error ** 2
+        absolute_errors += np.abs(error)
+        scored += observed & has_level
+        updated = np.where(has_level, levels + alphas * error, y)
+        levels = np.where(observed, updated, levels)
+
+    best = np.argmin(squared_errors, axis=0)
+    series = np.arange(n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mae = np.where(scored > 0, absolute_errors[best, series] / scored, np.inf)
+    return ALPHAS[best], levels[best, series], mae
+
+
+def _seasonal_naive_predictions(values: np.ndarray) -> np.ndarray:
+    predictions = np.full(values.shape, np.nan, dtype=np.float32)
+    predictions[:, SEASON_LENGTH:] = values[:, :-SEASON_LENGTH]
+    return predictions
+
+
+def _mean_absolute_error(values: np.ndarray, predictions: np.ndarray) -> np.ndarray:
+    errors = np.abs(values - predictions)
+    scored = ~np.isnan(errors)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(scored.any(axis=1), np.where(scored, errors, 0).sum(axis=1) / scored.sum(axis=1), np.inf)
+
+
+class DemandForecaster:
+    """Fitted forecast models for every product/store series of one index."""
+
+    def __init__(self, series: DailySeries, window: int = FORECAST_WINDOW):
+        self.series = series
+        self.window = window
+        self.fitted_at = 0.0
+        self.alpha = np.empty(0, dtype=np.float32)
+        self.level = np.empty(0, dtype=np.float32)
+        self.moving_average = np.empty(0, dtype=np.float32)
+        self.season = np.empty((0, SEASON_LENGTH), dtype=np.float32)
+        self.mae = np.empty((len(MODELS), 0))
+        self.model = np.empty(0, dtype=np.int8)
+
+    def fit(self) -> "DemandForecaster":
+        """Fit all models for all series and pick the best model per series."""
+        started = time.perf_counter()
+        values = self.series.values
+
+        self.alpha, self.level, es_mae = _exponential_smoothing(values)
+        self.mae = np.stack([
+            _mean_absolute_error(values, _rolling_mean_predictions(values, self.window)),
+            es_mae,
+            _mean_absolute_error(values, _seasonal_naive_predictions(values))
+        ])
+        self.model = np.argmin(self.mae, axis=0).astype(np.int8)
+
+        tail = values[:, -self.window:]
+        observed = ~np.isnan(tail)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.moving_average = np.where(
+                observed.any(axis=1), np.where(observed, tail, 0).sum(axis=1) / observed.sum(axis=1), 0
+            ).astype(np.float32)
+
+        # Last full week, aligned so column k is the value for day (T - SEASON_LENGTH + k)
+        season = np.full((self.series.series_count, SEASON_LENGTH), np.nan, dtype=np.float32)
+        width = min(SEASON_LENGTH, self.series.day_count)
+        season[:, SEASON_LENGTH - width:] = values[:, self.series.day_count - width:]
+        self.season = np.where(np.isnan(season), self.moving_average[:, None], season)
+        self.level = np.where(np.isnan(self.level), self.moving_average, self.level)
+
+        self.fitted_at = time.monotonic()
+        logger.info(
+            f"Fitted demand models for {self.series.series_count} series x {self.series.day_count} days "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return self
+
+    def forecast(self, rows: np.ndarray, horizon: int = 1) -> np.ndarray:
+        """
+        Forecast daily demand for the next `horizon` days.
+
+        Args:
+            rows: Series indices
+            horizon: Number of days ahead
+
+        Returns:
+            Array [len(rows), horizon] of forecast units per day
+        """
+        steps = np.arange(horizon)
+        flat = np.repeat(self.moving_average[rows][:, None], horizon, axis=1)
+        smoothed = np.repeat(self.level[rows][:, None], horizon, axis=1)
+        seasonal = self.season[rows][:, steps % SEASON_LENGTH]
+        model = self.model[rows][:, None]
+        result = np.where(model == 0, flat, np.where(model == 1, smoothed, seasonal))
+        return np.maximum(result, 0)
+
+    def demand_forecast(
+        self,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        region: Optional[str] = None,
+        size: int = 50,
+        horizon_days: int = 1
+    ) -> Dict[str, Any]:
+        """Model-based equivalent of check_demand_forecast."""
+        series = self.series
+        rows = series.select(product_id=product_id, category=category, region=region)
+        demand = self.forecast(rows, horizon_days).sum(axis=1)
+        inventory = series.inventory[rows]
+        shortage = np.maximum(demand - inventory, 0)
+        needs_restock = shortage > 0
+
+        forecasts = []
+        for i, row in enumerate(rows[:size]):
+            model = int(self.model[row])
+            forecasts.append({
+                "product_id": series.product[row],
+                "store_id": series.store[row],
+                "category": series.category[row],
+                "region": series.region[row],
+                "current_inventory": to_number(inventory[i]),
+                "demand_forecast": round(float(demand[i]), 2),
+                "shortage": round(float(shortage[i]), 2),
+                "needs_restock": bool(needs_restock[i]),
+                "forecast_model": MODELS[model],
+                "forecast_mae": round(float(self.mae[model, row]), 2) if np.isfinite(self.mae[model, row]) else None
+            })
+
+        return {
+            "total_products": len(forecasts),
+            "restock_required": sum(1 for f in forecasts if f["needs_restock"]),
+            "total_matching": int(len(rows)),
+            "total_restock_required": int(needs_restock.sum()),
+            "forecasts": forecasts,
+            "restock_recommendations": [f for f in forecasts if f["needs_restock"]],
+            "filters_applied": {
+                "product_id": product_id,
+                "category": category,
+                "region": region
+            },
+            "forecast_source": "model",
+            "horizon_days": horizon_days,
+            "history_through": series.day_label(series.day_count - 1),
+            "model_usage": {name: int((self.model[rows] == i).sum()) for i, name in enumerate(MODELS)}
+        }
+
+
+# ============================================================================
+# Forecaster Registry
+# ============================================================================
+
+_forecaster_lock = threading.Lock()
+_forecasters: Dict[str, DemandForecaster] = {}
+_failed_at: Dict[str, float] = {}
+_refitting: Dict[str, threading.Thread] = {}
+
+
+def _refit(es: Elasticsearch, index: str, engine: Optional[InventoryColumnStore]) -> None:
+    try:
+        forecaster = DemandForecaster(build_daily_series(es, index, engine=engine)).fit()
+        with _forecaster_lock:
+            _forecasters[index] = forecaster
+            _failed_at.pop(index, None)
+    except Exception as e:
+        logger.warning(f"Demand model refit failed for {index}, serving the previous fit: {str(e)}")
+        with _forecaster_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _forecaster_lock:
+            _refitting.pop(index, None)
+
+
+def get_demand_forecaster(
+    es: Elasticsearch,
+    index: str = SOURCE_INDEX,
+    engine: Optional[InventoryColumnStore] = None
+) -> DemandForecaster:
+    """
+    Return the fitted forecaster for an index.
+
+    The first call fits synchronously. Once the fit is older than
+    INVENTORY_FORECAST_REFRESH_SECONDS a background thread refits it while the
+    current fit keeps being returned.
+
+    Args:
+        es: Elasticsearch client
+        index: Daily inventory index
+        engine: Optional columnar engine to build the series from
+
+    Returns:
+        Fitted DemandForecaster
+    """
+    with _forecaster_lock:
+        forecaster = _forecasters.get(index)
+        if forecaster is None:
+            forecaster = DemandForecaster(build_daily_series(es, index, engine=engine)).fit()
+            _forecasters[index] = forecaster
+            return forecaster
+
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _refitting
+            and now - forecaster.fitted_at >= REFRESH_SECONDS
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _refitting[index] = threading.Thread(
+                target=_refit,
+                args=(es, index, engine),
+                name=f"forecast-{index}",
+                daemon=True
+            )
+            _refitting[index].start()
+        return forecaster
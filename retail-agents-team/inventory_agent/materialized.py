@@ -0,0 +1,146 @@
+"""
+Materialized Inventory Rollups
+Caches expensive whole-index aggregation results until the underlying data changes.
+
+Each rollup is stored with a fingerprint of its index: the primary document count and
+indexing operation total from the index stats, plus the snapshot sync counter from
+the mapping `_meta` when present. Upserts that replace documents by id leave the
+count unchanged but still move the indexing total and the sync counter. Callers
+always get the stored result immediately. At most once per
+INVENTORY_ROLLUP_CHECK_SECONDS a background thread resolves the index to read,
+re-reads the fingerprint and, only if it changed, recomputes the rollup and swaps
+it in (stale-while-revalidate). Only the very first call for an index waits on
+the aggregation.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = float(os.getenv("INVENTORY_ROLLUP_CHECK_SECONDS", "30"))
+
+
+def data_fingerprint(es: Elasticsearch, index: str) -> Dict[str, Any]:
+    """
+    Cheap change detector for an index: index stats and the snapshot sync counter.
+
+    Args:
+        es: Elasticsearch client
+        index: Index to fingerprint
+
+    Returns:
+        Dictionary with index, doc_count, index_total and sync_count
+    """
+    primaries = es.indices.stats(index=index, metric="docs,indexing")['_all']['primaries']
+    mapping = es.indices.get_mapping(index=index)
+    meta = next(iter(mapping.values()))['mappings'].get('_meta', {})
+    return {
+        "index": index,
+        "doc_count": primaries['docs']['count'],
+        "index_total": primaries['indexing']['index_total'],
+        "sync_count": meta.get('sync_count')
+    }
+
+
+class _Rollup:
+    """Stored result of one rollup for one index."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.result: Optional[Dict[str, Any]] = None
+        self.fingerprint: Optional[Dict[str, Any]] = None
+        self.computed_at: Optional[str] = None
+        self.checked_at = 0.0
+        self.revalidating = False
+
+    def store(self, result: Dict[str, Any], fingerprint: Dict[str, Any]) -> None:
+        self.result = result
+        self.fingerprint = fingerprint
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.checked_at = time.monotonic()
+
+
+_registry_lock = threading.Lock()
+_rollups: Dict[Tuple[str, str], _Rollup] = {}
+
+
+def _revalidate(
+    rollup: _Rollup,
+    es: Elasticsearch,
+    index: str,
+    compute: Callable[[Elasticsearch, str], Dict[str, Any]],
+    resolve_index: Optional[Callable[[Elasticsearch, str], str]]
+) -> None:
+    try:
+        if resolve_index:
+            index = resolve_index(es, index)
+        fingerprint = data_fingerprint(es, index)
+        if fingerprint != rollup.fingerprint:
+            result = compute(es, index)
+            with rollup.lock:
+                rollup.store(result, fingerprint)
+            logger.info(f"Recomputed materialized rollup for {index}: {fingerprint}")
+    except Exception as e:
+        logger.warning(f"Materialized rollup revalidation failed for {index}: {str(e)}")
+    finally:
+        with rollup.lock:
+            rollup.checked_at = time.monotonic()
+            rollup.revalidating = False
+
+
+def get_materialized(
+    es: Elasticsearch,
+    name: str,
+    index: str,
+    compute: Callable[[Elasticsearch, str], Dict[str, Any]],
+    check_seconds: float = CHECK_SECONDS,
+    resolve_index: Optional[Callable[[Elasticsearch, str], str]] = None
+) -> Dict[str, Any]:
+    """
+    Return a materialized rollup, computing it only on first use or after the index changed.
+
+    Args:
+        es: Elasticsearch client
+        name: Rollup name (one stored result per name and index)
+        index: Index the rollup is computed from
+        compute: Function (es, index) -> result; exceptions propagate on first use
+        check_seconds: Minimum seconds between change checks
+        resolve_index: Optional function (es, index) -> index to read. It is only called
+            when the rollup is first computed or revalidated, so work it does (such as a
+            snapshot sync) stays off the path that serves the stored result.
+
+    Returns:
+        The rollup result plus a "materialized" block with its fingerprint and age
+    """
+    with _registry_lock:
+        rollup = _rollups.setdefault((name, index), _Rollup())
+
+    with rollup.lock:
+        if rollup.result is None:
+            source = resolve_index(es, index) if resolve_index else index
+            fingerprint = data_fingerprint(es, source)
+            rollup.store(compute(es, source), fingerprint)
+        elif not rollup.revalidating and time.monotonic() - rollup.checked_at >= check_seconds:
+            rollup.revalidating = True
+            threading.Thread(
+                target=_revalidate,
+                args=(rollup, es, index, compute, resolve_index),
+                name=f"rollup-{name}",
+                daemon=True
+            ).start()
+
+        return {
+            **rollup.result,
+            "materialized": {
+                "computed_at": rollup.computed_at,
+                "fingerprint": rollup.fingerprint,
+                "revalidating": rollup.revalidating
+            }
+        }
@@ -0,0 +1,73 @@
+"""
+Point-in-Time Scanning
+Helpers for walking every matching inventory document with bounded memory.
+"""
+
+import logging
+from typing import Dict, List, Any, Optional, Iterator
+
+from elasticsearch import Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+
+def scan_documents(
+    es: Elasticsearch,
+    index: str,
+    query: Optional[Dict[str, Any]] = None,
+    source: Optional[List[str]] = None,
+    sort: Optional[List[Dict[str, Any]]] = None,
+    docvalue_fields: Optional[List[Any]] = None,
+    page_size: int = 1000,
+    keep_alive: str = "2m"
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield pages of hits for every document matching the query.
+
+    Uses a point-in-time with search_after, so the scan sees a consistent view of
+    the index and only one page is held in memory at a time.
+
+    Args:
+        es: Elasticsearch client
+        index: Index to scan
+        query: Query DSL (default: match_all)
+        source: _source fields to return
+        sort: Sort order; `_shard_doc` is appended as tiebreaker
+        docvalue_fields: Doc value fields to return (e.g. dates as epoch_millis)
+        page_size: Hits per page
+        keep_alive: Point-in-time keep-alive between pages
+
+    Yields:
+        Lists of raw Elasticsearch hits
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+    search_after = None
+    try:
+        while True:
+            search_body = {
+                "size": page_size,
+                "query": query or {"match_all": {}},
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": list(sort or []) + [{"_shard_doc": "asc"}],
+                "track_total_hits": False
+            }
+            if source is not None:
+                search_body["_source"] = source
+            if docvalue_fields:
+                search_body["docvalue_fields"] = docvalue_fields
+            if search_after is not None:
+                search_body["search_after"] = search_after
+
+            response = es.search(body=search_body)
+            pit_id = response.get('pit_id', pit_id)
+            hits = response['hits']['hits']
+            if not hits:
+                break
+
+            yield hits
+            search_after = hits[-1]['sort']
+    finally:
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"Failed to close point-in-time: {str(e)}")
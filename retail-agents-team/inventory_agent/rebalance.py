@@ -0,0 +1,108 @@
+"""
+Inventory Rebalancing
+Suggests store-to-store transfers that cover shortages from surplus stock.
+
+Each product/store record gets a target stock of `Demand Forecast × cover_days`.
+Stores above target have a surplus; stores below it, net of units already on
+order, have a need. Within every group of the same product (and region, unless
+cross-region transfers are allowed) surpluses are matched to needs greedily,
+largest first.
+
+The matching runs for all groups at once: donors and recipients of a group are
+laid out as consecutive intervals on a shared number line (surplus units on one
+side, needed units on the other), and every overlap of a donor interval with a
+recipient interval is one transfer. This is the greedy "fill the largest need
+from the largest surplus" assignment without a Python loop over stores.
+"""
+
+from typing import Dict, Any
+
+import numpy as np
+
+
+def _group_codes(columns: Dict[str, np.ndarray], cross_region: bool) -> np.ndarray:
+    keys = columns["product_id"].astype(str)
+    if not cross_region:
+        keys = np.char.add(np.char.add(keys, "::"), columns["region"].astype(str))
+    return np.unique(keys, return_inverse=True)[1].ravel()
+
+
+def _intervals(group: np.ndarray, amount: np.ndarray, rows: np.ndarray, base: np.ndarray):
+    """Lay out rows as [start, end) intervals within their group's span, largest amount first."""
+    rows = rows[np.lexsort((-amount[rows], group[rows]))]
+    amounts = amount[rows]
+    ends = np.cumsum(amounts)
+    group_start = np.zeros(len(rows), dtype=np.int64)
+    if len(rows):
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = group[rows][1:] != group[rows][:-1]
+        starts_of_group = np.flatnonzero(first)
+        run_lengths = np.diff(np.append(starts_of_group, len(rows)))
+        offsets = (ends - amounts)[starts_of_group]
+        group_start = np.repeat(offsets, run_lengths)
+    starts = base[group[rows]] + (ends - amounts) - group_start
+    return rows, starts, starts + amounts
+
+
+def compute_rebalancing_plan(
+    columns: Dict[str, np.ndarray],
+    cover_days: float = 7.0,
+    cross_region: bool = False
+) -> Dict[str, Any]:
+    """
+    Match surplus stock to shortages within each product group.
+
+    Args:
+        columns: Latest per-store rows (see restock.load_restock_inputs*)
+        cover_days: Days of forecast demand each store should hold
+        cross_region: Allow transfers between regions
+
+    Returns:
+        Dictionary of transfer arrays (donor, recipient, quantity) plus need/surplus totals
+    """
+    inventory = columns["current_inventory"]
+    target = columns["demand_forecast"] * cover_days
+    surplus = np.floor(np.maximum(inventory - target, 0)).astype(np.int64)
+    on_order = columns.get("units_ordered", np.zeros(len(inventory)))
+    need = np.ceil(np.maximum(target - inventory - on_order, 0)).astype(np.int64)
+
+    group = _group_codes(columns, cross_region)
+    group_count = int(group.max()) + 1 if len(group) else 0
+    span = np.maximum(
+        np.bincount(group, weights=surplus, minlength=group_count),
+        np.bincount(group, weights=need, minlength=group_count)
+    ).astype(np.int64)
+    base = np.concatenate([[0], np.cumsum(span)[:-1]]).astype(np.int64)
+
+    donors, donor_start, donor_end = _intervals(group, surplus, np.flatnonzero(surplus > 0), base)
+    recipients, recipient_start, recipient_end = _intervals(group, need, np.flatnonzero(need > 0), base)
+
+    # Every boundary on the shared line starts a segment owned by at most one donor and one recipient
+    points = np.unique(np.concatenate([donor_start, donor_end, recipient_start, recipient_end]))
+    if not len(donors) or not len(recipients):
+        donor_rows = recipient_rows = quantity = np.empty(0, dtype=np.int64)
+    else:
+        seg_start, seg_end = points[:-1], points[1:]
+        d = np.searchsorted(donor_end, seg_start, side="right")
+        r = np.searchsorted(recipient_end, seg_start, side="right")
+        covered = (d < len(donors)) & (r < len(recipients))
+        d, r = np.minimum(d, len(donors) - 1), np.minimum(r, len(recipients) - 1)
+        covered &= (donor_start[d] <= seg_start) & (recipient_start[r] <= seg_start)
+
+        # Consecutive segments of the same pair are one transfer
+        pair = d[covered].astype(np.int64) * max(len(recipients), 1) + r[covered]
+        unique_pairs, inverse = np.unique(pair, return_inverse=True)
+        quantity = np.bincount(inverse, weights=(seg_end - seg_start)[covered]).astype(np.int64)
+        donor_rows = donors[unique_pairs // max(len(recipients), 1)]
+        recipient_rows = recipients[unique_pairs % max(len(recipients), 1)]
+
+    order = np.argsort(-quantity, kind="stable")
+    received = np.bincount(recipient_rows, weights=quantity, minlength=len(inventory))
+    return {
+        "donor": donor_rows[order],
+        "recipient": recipient_rows[order],
+        "quantity": quantity[order],
+        "need": need,
+        "surplus": surplus,
+        "received": received
+    }
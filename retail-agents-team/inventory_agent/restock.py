@@ -0,0 +1,235 @@
+"""
+Restock Planning Engine
+Vectorized restock plans over every matching product/store inventory record.
+
+Rows are pulled once (with a point-in-time scan, or straight from the columnar
+engine when it is enabled) into NumPy arrays. Shortages, days of cover and
+suggested order quantities are then computed for all rows at once, ranked, and
+optionally exported in full as CSV or Parquet.
+
+The agent tool only writes plans into INVENTORY_EXPORT_DIR: resolve_export_path()
+accepts a bare file name and rejects absolute paths and `..`, and the tool
+returns the file's path relative to that directory for download.
+"""
+
+import os
+import csv
+import logging
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .pit_scan import scan_documents
+from .columnar import InventoryColumnStore
+
+logger = logging.getLogger(__name__)
+
+TEXT_COLUMNS = {
+    "product_id": "Product ID",
+    "store_id": "Store ID",
+    "category": "Category",
+    "region": "Region"
+}
+
+NUMERIC_COLUMNS = {
+    "current_inventory": "Inventory Level",
+    "demand_forecast": "Demand Forecast",
+    "units_sold": "Units Sold",
+    "units_ordered": "Units Ordered"
+}
+
+EXPORT_DIR = os.getenv("INVENTORY_EXPORT_DIR", "exports")
+
+PLAN_COLUMNS = list(TEXT_COLUMNS) + list(NUMERIC_COLUMNS) + [
+    "shortage", "days_of_cover", "suggested_order", "priority_rank"
+]
+
+
+def load_restock_inputs(
+    es: Elasticsearch,
+    index: str,
+    filters: List[Dict[str, Any]],
+    page_size: int = 5000
+) -> Dict[str, np.ndarray]:
+    """
+    Scan every record matching the filters into column arrays.
+
+    Args:
+        es: Elasticsearch client
+        index: Index to scan (snapshot or history)
+        filters: Bool filter clauses
+        page_size: Records per request
+
+    Returns:
+        Dictionary of column name -> array
+    """
+    text: Dict[str, List[Any]] = {name: [] for name in TEXT_COLUMNS}
+    numeric: Dict[str, List[Any]] = {name: [] for name in NUMERIC_COLUMNS}
+
+    for hits in scan_documents(
+        es,
+        index,
+        query={"bool": {"filter": filters}},
+        source=list(TEXT_COLUMNS.values()) + list(NUMERIC_COLUMNS.values()),
+        page_size=page_size
+    ):
+        for hit in hits:
+            source = hit['_source']
+            for name, field in TEXT_COLUMNS.items():
+                text[name].append(source.get(field))
+            for name, field in NUMERIC_COLUMNS.items():
+                numeric[name].append(source.get(field) or 0)
+
+    columns = {name: np.array(values, dtype=object) for name, values in text.items()}
+    columns.update({name: np.array(values, dtype=np.float64) for name, values in numeric.items()})
+    return columns
+
+
+def load_restock_inputs_from_engine(
+    engine: InventoryColumnStore,
+    history: bool = False,
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    region: Optional[str] = None
+) -> Dict[str, np.ndarray]:
+    """Take the restock input columns from the in-memory columnar engine."""
+    rows = engine.select_rows(history, region=region, category=category, product_id=product_id)
+    columns = {
+        name: np.array(engine.dictionaries[code_name].values, dtype=object)[engine.columns[code_name][rows]]
+        for name, code_name in (
+            ("product_id", "product"),
+            ("store_id", "store"),
+            ("category", "category"),
+            ("region", "region")
+        )
+    }
+    columns.update({
+        "current_inventory": engine.columns["inventory"][rows].astype(np.float64),
+        "demand_forecast": engine.columns["demand"][rows].astype(np.float64),
+        "units_sold": engine.columns["units_sold"][rows].astype(np.float64),
+        "units_ordered": engine.columns["units_ordered"][rows].astype(np.float64)
+    })
+    return columns
+
+
+def compute_restock_plan(columns: Dict[str, np.ndarray], cover_days: float = 7.0) -> Dict[str, np.ndarray]:
+    """
+    Compute shortages, days of cover and suggested orders for every row.
+
+    `Demand Forecast` is treated as expected daily demand. The suggested order
+    tops stock up to `cover_days` of demand, net of units already on order.
+    Rows are ranked by fewest days of cover, then largest shortage.
+
+    Args:
+        columns: Input columns from load_restock_inputs*
+        cover_days: Days of demand the restocked inventory should cover
+
+    Returns:
+        Plan columns sorted by priority
+    """
+    inventory = columns["current_inventory"]
+    demand = columns["demand_forecast"]
+
+    shortage = np.maximum(demand - inventory, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(demand > 0, inventory / demand, np.inf)
+    suggested_order = np.ceil(np.maximum(demand * cover_days - inventory - columns["units_ordered"], 0))
+
+    order = np.lexsort((-shortage, days_of_cover))
+    plan = {name: values[order] for name, values in columns.items()}
+    plan.update({
+        "shortage": shortage[order],
+        "days_of_cover": days_of_cover[order],
+        "suggested_order": suggested_order[order],
+        "priority_rank": np.arange(1, len(order) + 1)
+    })
+    return plan
+
+
+def plan_rows(plan: Dict[str, np.ndarray], start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Convert a slice of the plan into JSON-friendly records."""
+    total = len(plan["priority_rank"])
+    stop = total if stop is None else min(stop, total)
+    records = []
+    for i in range(start, stop):
+        record = {}
+        for name in PLAN_COLUMNS:
+            value = plan[name][i]
+            if name in TEXT_COLUMNS:
+                record[name] = value
+            elif name == "days_of_cover":
+                record[name] = None if np.isinf(value) else round(float(value), 2)
+            else:
+                record[name] = int(value) if float(value).is_integer() else round(float(value), 2)
+        records.append(record)
+    return records
+
+
+def resolve_export_path(file_name: str, export_dir: str = EXPORT_DIR) -> str:
+    """
+    Absolute path for a plan file inside the export directory.
+
+    Args:
+        file_name: Bare file name (no directories)
+        export_dir: Directory plans are written to (created if missing)
+
+    Returns:
+        Absolute destination path
+
+    Raises:
+        ValueError: If the name is empty, absolute, contains directories or `..`
+    """
+    if not file_name or os.path.isabs(file_name) or file_name in (".", "..") \
+            or "/" in file_name or "\\" in file_name:
+        raise ValueError("file_name must be a bare file name without directories or '..'")
+
+    root = os.path.realpath(export_dir)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if os.path.dirname(path) != root:
+        raise ValueError("file_name must stay inside the export directory")
+
+    os.makedirs(root, exist_ok=True)
+    return path
+
+
+def export_restock_plan(plan: Dict[str, np.ndarray], output_path: str) -> str:
+    """
+    Write the full plan to CSV, or Parquet when the path ends in .parquet.
+
+    Args:
+        plan: Plan columns from compute_restock_plan
+        output_path: Destination file
+
+    Returns:
+        The written path
+    """
+    if output_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table({
+            name: plan[name].tolist() if name in TEXT_COLUMNS else
+            np.where(np.isinf(plan[name]), np.nan, plan[name]) if name == "days_of_cover" else plan[name]
+            for name in PLAN_COLUMNS
+        })
+        pq.write_table(table, output_path)
+        return output_path
+
+    columns = []
+    for name in PLAN_COLUMNS:
+        values = plan[name]
+        if name in TEXT_COLUMNS or name == "priority_rank":
+            columns.append(values.tolist())
+        elif name == "days_of_cover":
+            columns.append(["" if np.isinf(v) else v for v in np.round(values, 2).tolist()])
+        elif np.array_equal(values, np.floor(values)):
+            columns.append(values.astype(np.int64).tolist())
+        else:
+            columns.append(np.round(values, 2).tolist())
+
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(PLAN_COLUMNS)
+        writer.writerows(zip(*columns))
+    return output_path
@@ -0,0 +1,285 @@
+"""
+Inventory Latest Snapshot
+Maintains a latest-state copy of retail_store_inventory keyed by Product ID + Store ID.
+
+The source index holds one document per product/store/day, so "what is in stock now"
+questions would otherwise scan the whole history. The snapshot index keeps only the
+most recent record of every product/store pair and is updated incrementally: each
+refresh reads source records at or after the stored `Date` watermark, picks the latest
+record per pair with a composite aggregation and upserts it. Upserts use noop
+detection, so re-reading unchanged records of the watermark day writes nothing.
+
+The watermark lives in the snapshot index mapping `_meta`, so it survives restarts and
+is shared by every process using the same cluster. A `sync_count` next to it is bumped
+after every refresh that changed a record, so readers can tell the snapshot changed
+even when the upserts left the document count and newest `Date` as they were.
+
+The first build reindexes the whole history. Run it ahead of time from the command
+line; otherwise the first tool call starts it in a background thread and the tools
+query the source index until it completes, flagging their responses with
+`snapshot_pending`. After a failed refresh the tools keep serving the existing
+snapshot for INVENTORY_SNAPSHOT_RETRY_SECONDS before trying again; they only fall
+back to the source index when no snapshot has been built yet.
+
+Usage (from the retail-agents-team directory):
+    python -m inventory_agent.snapshot [--full]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from typing import Dict, Any, Optional
+
+from elasticsearch import Elasticsearch, helpers
+
+logger = logging.getLogger(__name__)
+
+SOURCE_INDEX = "retail_store_inventory"
+SNAPSHOT_INDEX = os.getenv("INVENTORY_SNAPSHOT_INDEX", "retail_store_inventory_latest")
+SYNC_INTERVAL_SECONDS = float(os.getenv("INVENTORY_SNAPSHOT_SYNC_SECONDS", "60"))
+RETRY_SECONDS = float(os.getenv("INVENTORY_SNAPSHOT_RETRY_SECONDS", "300"))
+
+_sync_lock = threading.Lock()
+_last_sync: Dict[str, float] = {}
+_failed_at: Dict[str, float] = {}
+_building: Dict[str, threading.Thread] = {}
+_ready: Dict[str, bool] = {}
+
+
+def _snapshot_doc_id(source: Dict[str, Any]) -> str:
+    return f"{source.get('Product ID')}::{source.get('Store ID')}"
+
+
+def _get_meta(es: Elasticsearch, snapshot_index: str) -> Dict[str, Any]:
+    mapping = es.indices.get_mapping(index=snapshot_index)
+    return next(iter(mapping.values()))['mappings'].get('_meta', {})
+
+
+def _get_watermark(es: Elasticsearch, snapshot_index: str) -> Optional[str]:
+    return _get_meta(es, snapshot_index).get('watermark')
+
+
+def _create_snapshot_index(es: Elasticsearch, source_index: str, snapshot_index: str) -> None:
+    """Create the snapshot index with the same field mapping as the source index."""
+    mapping = es.indices.get_mapping(index=source_index)
+    properties = next(iter(mapping.values()))['mappings'].get('properties', {})
+    es.indices.create(
+        index=snapshot_index,
+        mappings={
+            "_meta": {"source_index": source_index, "watermark": None},
+            "properties": properties
+        }
+    )
+    logger.info(f"Created inventory snapshot index {snapshot_index}")
+
+
+def refresh_inventory_snapshot(
+    es: Elasticsearch,
+    source_index: str = SOURCE_INDEX,
+    snapshot_index: str = SNAPSHOT_INDEX,
+    full: bool = False,
+    page_size: int = 1000
+) -> Dict[str, Any]:
+    """
+    Bring the latest-state snapshot up to date with the source index.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Daily inventory index
+        snapshot_index: Latest-state index to maintain
+        full: Ignore the watermark and rebuild from the full history
+        page_size: Composite aggregation page size
+
+    Returns:
+        Dictionary containing the number of upserted and changed pairs and the new watermark
+    """
+    if not es.indices.exists(index=snapshot_index):
+        _create_snapshot_index(es, source_index, snapshot_index)
+        full = True
+
+    watermark = None if full else _get_watermark(es, snapshot_index)
+    query = {"range": {"Date": {"gte": watermark}}} if watermark else {"match_all": {}}
+
+    max_date = es.search(
+        index=source_index,
+        body={"size": 0, "query": query, "aggs": {"max_date": {"max": {"field": "Date"}}}}
+    )['aggregations']['max_date']
+    if max_date.get('value') is None:
+        return {"upserted": 0, "changed": 0, "watermark": watermark}
+
+    upserted = 0
+    changed = 0
+    after_key = None
+    while True:
+        composite = {
+            "size": page_size,
+            "sources": [
+                {"product": {"terms": {"field": "Product ID"}}},
+                {"store": {"terms": {"field": "Store ID"}}}
+            ]
+        }
+        if after_key:
+            composite["after"] = after_key
+
+        response = es.search(
+            index=source_index,
+            body={
+                "size": 0,
+                "query": query,
+                "aggs": {
+                    "pairs": {
+                        "composite": composite,
+                        "aggs": {
+                            "latest": {
+                                "top_hits": {"size": 1, "sort": [{"Date": {"order": "desc"}}]}
+                            }
+                        }
+                    }
+                }
+            }
+        )
+        pairs = response['aggregations']['pairs']
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": snapshot_index,
+                "_id": _snapshot_doc_id(bucket['latest']['hits']['hits'][0]['_source']),
+                "doc": bucket['latest']['hits']['hits'][0]['_source'],
+                "doc_as_upsert": True
+            }
+            for bucket in pairs['buckets']
+        ]
+        for ok, item in helpers.streaming_bulk(es, actions):
+            upserted += 1
+            if item['update'].get('result') != "noop":
+                changed += 1
+
+        after_key = pairs.get('after_key')
+        if not after_key or not pairs['buckets']:
+            break
+
+    new_watermark = max_date.get('value_as_string') or max_date['value']
+    es.indices.refresh(index=snapshot_index)
+    meta = _get_meta(es, snapshot_index)
+    es.indices.put_mapping(
+        index=snapshot_index,
+        meta={
+            "source_index": source_index,
+            "watermark": new_watermark,
+            "sync_count": (meta.get('sync_count') or 0) + (1 if changed else 0)
+        }
+    )
+
+    logger.info(
+        f"Inventory snapshot refreshed: {upserted} product/store pairs ({changed} changed), "
+        f"watermark {new_watermark}"
+    )
+    return {"upserted": upserted, "changed": changed, "watermark": new_watermark, "full_rebuild": full}
+
+
+def _snapshot_ready(es: Elasticsearch, snapshot_index: str) -> bool:
+    """True once a full build has completed (the watermark is only written at the end)."""
+    return es.indices.exists(index=snapshot_index) and _get_watermark(es, snapshot_index) is not None
+
+
+def _initial_build(es: Elasticsearch, source_index: str, snapshot_index: str) -> None:
+    try:
+        refresh_inventory_snapshot(es, source_index, snapshot_index, full=True)
+        with _sync_lock:
+            _ready[snapshot_index] = True
+            _last_sync[snapshot_index] = time.monotonic()
+            _failed_at.pop(snapshot_index, None)
+    except Exception as e:
+        logger.warning(f"Initial inventory snapshot build failed: {str(e)}")
+        with _sync_lock:
+            _failed_at[snapshot_index] = time.monotonic()
+    finally:
+        with _sync_lock:
+            _building.pop(snapshot_index, None)
+
+
+def ensure_inventory_snapshot(
+    es: Elasticsearch,
+    source_index: str = SOURCE_INDEX,
+    snapshot_index: str = SNAPSHOT_INDEX
+) -> str:
+    """
+    Return the index the inventory tools should query for current stock.
+
+    Refreshes the snapshot at most once per INVENTORY_SNAPSHOT_SYNC_SECONDS. The
+    source index is only returned while no snapshot exists: during the first
+    build and after it failed. Once a snapshot exists, a failed refresh keeps
+    serving it and retries after INVENTORY_SNAPSHOT_RETRY_SECONDS.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Daily inventory index
+        snapshot_index: Latest-state index
+
+    Returns:
+        Name of the index to query
+    """
+    with _sync_lock:
+        now = time.monotonic()
+        if snapshot_index in _building:
+            return source_index
+        fallback = snapshot_index if _ready.get(snapshot_index) else source_index
+        failed = _failed_at.get(snapshot_index)
+        if failed is not None and now - failed < RETRY_SECONDS:
+            return fallback
+        last = _last_sync.get(snapshot_index)
+        if last is not None and now - last < SYNC_INTERVAL_SECONDS:
+            return snapshot_index
+        try:
+            if not _ready.get(snapshot_index):
+                if not _snapshot_ready(es, snapshot_index):
+                    _building[snapshot_index] = threading.Thread(
+                        target=_initial_build,
+                        args=(es, source_index, snapshot_index),
+                        name=f"snapshot-{snapshot_index}",
+                        daemon=True
+                    )
+                    _building[snapshot_index].start()
+                    return source_index
+                _ready[snapshot_index] = True
+            refresh_inventory_snapshot(es, source_index, snapshot_index)
+            _last_sync[snapshot_index] = now
+            _failed_at.pop(snapshot_index, None)
+            return snapshot_index
+        except Exception as e:
+            _failed_at[snapshot_index] = now
+            fallback = snapshot_index if _ready.get(snapshot_index) else source_index
+            logger.warning(
+                f"Inventory snapshot refresh failed, querying {fallback} "
+                f"for {RETRY_SECONDS:.0f}s: {str(e)}"
+            )
+            return fallback
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or update the latest-state inventory snapshot")
+    parser.add_argument("--index", default=SOURCE_INDEX, help="Daily inventory index")
+    parser.add_argument("--snapshot-index", default=SNAPSHOT_INDEX, help="Latest-state index")
+    parser.add_argument("--full", action="store_true", help="Rebuild from the full history")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    result = refresh_inventory_snapshot(es, args.index, args.snapshot_index, full=args.full)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,30 @@ Functions for managing and querying retail store inventory using Elasticsearch.
 """
 
 import os
+import json
+import time
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 from datetime import datetime
+import numpy as np
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
+from .snapshot import SOURCE_INDEX, ensure_inventory_snapshot
+from .columnar import InventoryColumnStore, columnar_engine_enabled, get_inventory_engine
+from .pit_scan import scan_documents
+from .restock import (
+    load_restock_inputs,
+    load_restock_inputs_from_engine,
+    compute_restock_plan,
+    plan_rows,
+    export_restock_plan,
+    resolve_export_path,
+    EXPORT_DIR
+)
+from .forecasting import get_demand_forecaster
+from .materialized import get_materialized
+from .anomalies import get_anomaly_detector
+from .rebalance import compute_rebalancing_plan
 
 # Load environment variables
 load_dotenv()
@@ -43,25 +62,73 @@ def get_elasticsearch_client() -> Optional[Elasticsearch]:
         logger.error(f"Failed to connect to Elasticsearch: {str(e)}")
         return None
 
+def _resolve_index(es: Elasticsearch, index: str, history: bool) -> str:
+    """
+    Pick the index to query: the latest-state snapshot for the default inventory
+    index, or the requested index as-is for history queries and custom indices.
+    """
+    if history or index != SOURCE_INDEX:
+        return index
+    return ensure_inventory_snapshot(es, source_index=index)
+
+def _snapshot_pending(target: str, history: bool) -> Dict[str, bool]:
+    """
+    Flag for tool responses: latest-state questions answered from the daily
+    history because the snapshot does not exist yet, so totals span every day.
+    """
+    if not history and target == SOURCE_INDEX:
+        return {"snapshot_pending": True}
+    return {}
+
+def _columnar_engine(es: Elasticsearch, index: str) -> Optional[InventoryColumnStore]:
+    """
+    Return the in-memory columnar engine when INVENTORY_ENGINE=columnar is set
+    for the default inventory index, or None to query Elasticsearch directly.
+    """
+    if not columnar_engine_enabled() or index != SOURCE_INDEX:
+        return None
+    try:
+        return get_inventory_engine(es, index)
+    except Exception as e:
+        logger.warning(f"Columnar inventory engine unavailable, querying Elasticsearch: {str(e)}")
+        return None
+
 # ============================================================================
 # Inventory Query Functions
 # ============================================================================
 
+def _stock_status(total_inventory: float) -> str:
+    """Classify a product's total stock level."""
+    if total_inventory == 0:
+        return "out_of_stock"
+    elif total_inventory < 10:
+        return "low_stock"
+    elif total_inventory < 50:
+        return "moderate_stock"
+    return "in_stock"
+
+
 def check_product_inventory(
     product_id: str,
     store_id: Optional[str] = None,
     region: Optional[str] = None,
-    index: str = "retail_store_inventory"
+    index: str = "retail_store_inventory",
+    history: bool = False
 ) -> Dict[str, Any]:
     """
     Check real-time inventory levels for a specific product.
     Can filter by store ID or region for location-specific availability.
     
+    Inventory is aggregated server-side: one bucket per store holding the latest
+    record by Date, so totals cover every record in the index and the response
+    size depends only on the number of stores, not on the length of the history.
+    
     Args:
         product_id: Product ID to check inventory for
         store_id: Optional store ID to check specific location
         region: Optional region filter (e.g., "North", "South", "East", "West")
         index: Elasticsearch index name
+        history: Query the full daily history instead of the latest snapshot
     
     Returns:
         Dictionary containing inventory levels, stock status, and location details
@@ -82,25 +149,38 @@ def check_product_inventory(
         if region:
             filters.append({"term": {"Region": region}})
         
-        retriever_object = {
-            "standard": {
-                "query": {
-                    "bool": {
-                        "filter": filters
+        search_body = {
+            "size": 0,
+            "track_total_hits": True,
+            "query": {
+                "bool": {
+                    "filter": filters
+                }
+            },
+            "aggs": {
+                "stores": {
+                    "terms": {"field": "Store ID", "size": 1000},
+                    "aggs": {
+                        "latest": {
+                            "top_hits": {
+                                "size": 1,
+                                "sort": [{"Date": {"order": "desc"}}],
+                                "_source": [
+                                    "Store ID", "Region", "Category", "Inventory Level",
+                                    "Units Sold", "Units Ordered", "Price", "Discount", "Date"
+                                ]
+                            }
+                        }
                     }
                 }
             }
         }
         
-        response = es.search(
-            index=index,
-            retriever=retriever_object,
-            size=100
-        )
-        
-        hits = response['hits']['hits']
+        target = _resolve_index(es, index, history)
+        response = es.search(index=target, body=search_body)
+        record_count = response['hits']['total']['value']
         
-        if not hits:
+        if record_count == 0:
             return {
                 "product_id": product_id,
                 "store_id": store_id,
@@ -109,47 +189,49 @@ def check_product_inventory(
                 "message": "No inventory records found for this product"
             }
         
-        # Aggregate inventory data
+        stores_agg = response['aggregations']['stores']
+        if stores_agg.get('sum_other_doc_count', 0) > 0:
+            logger.warning(f"Product {product_id} has more stores than the terms size, totals are partial")
+        
+        # Current stock is the latest record of every store
         total_inventory = 0
         locations = []
+        regions = {}
         
-        for hit in hits:
-            source = hit['_source']
+        for bucket in stores_agg['buckets']:
+            source = bucket['latest']['hits']['hits'][0]['_source']
             inventory_level = source.get('Inventory Level', 0)
             total_inventory += inventory_level
             
+            location_region = source.get('Region')
+            regions[location_region] = regions.get(location_region, 0) + inventory_level
+            
             locations.append({
-                "store_id": source.get('Store ID'),
-                "region": source.get('Region'),
+                "store_id": source.get('Store ID', bucket['key']),
+                "region": location_region,
                 "inventory_level": inventory_level,
                 "units_sold": source.get('Units Sold', 0),
                 "units_ordered": source.get('Units Ordered', 0),
                 "price": source.get('Price', 0),
                 "discount": source.get('Discount', 0),
                 "date": source.get('Date'),
-                "category": source.get('Category')
+                "category": source.get('Category'),
+                "record_count": bucket['doc_count']
             })
         
-        # Determine stock status
-        if total_inventory == 0:
-            stock_status = "out_of_stock"
-        elif total_inventory < 10:
-            stock_status = "low_stock"
-        elif total_inventory < 50:
-            stock_status = "moderate_stock"
-        else:
-            stock_status = "in_stock"
-        
         return {
             "product_id": product_id,
             "total_inventory": total_inventory,
-            "stock_status": stock_status,
+            "stock_status": _stock_status(total_inventory),
             "location_count": len(locations),
             "locations": locations,
+            "inventory_by_region": regions,
+            "records_scanned": record_count,
             "filters_applied": {
                 "store_id": store_id,
                 "region": region
-            }
+            },
+            **_snapshot_pending(target, history)
         }
         
     except Exception as e:
@@ -161,13 +243,144 @@ def check_product_inventory(
         }
 
 
+def check_bulk_inventory(
+    product_ids: List[str],
+    store_id: Optional[str] = None,
+    region: Optional[str] = None,
+    index: str = "retail_store_inventory",
+    history: bool = False
+) -> Dict[str, Any]:
+    """
+    Check stock availability for many products at once, e.g. every item in a cart.
+    Uses a single aggregated query instead of one check_product_inventory call per product,
+    with the same per-product stock_status classification.
+    
+    Args:
+        product_ids: List of product IDs to check
+        store_id: Optional store ID to check specific location
+        region: Optional region filter (e.g., "North", "South", "East", "West")
+        index: Elasticsearch index name
+        history: Query the full daily history instead of the latest snapshot
+    
+    Returns:
+        Dictionary containing stock status per product and a cart-level summary
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY"
+        }
+    
+    if not product_ids:
+        return {
+            "error": "At least one product ID is required",
+            "message": "Please specify the product_ids to check"
+        }
+    
+    try:
+        unique_ids = list(dict.fromkeys(product_ids))
+        filters = [{"terms": {"Product ID": unique_ids}}]
+        
+        if store_id:
+            filters.append({"term": {"Store ID": store_id}})
+        if region:
+            filters.append({"term": {"Region": region}})
+        
+        search_body = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": filters
+                }
+            },
+            "aggs": {
+                "products": {
+                    "terms": {"field": "Product ID", "size": len(unique_ids)},
+                    "aggs": {
+                        "stores": {
+                            "terms": {"field": "Store ID", "size": 1000},
+                            "aggs": {
+                                "latest": {
+                                    "top_hits": {
+                                        "size": 1,
+                                        "sort": [{"Date": {"order": "desc"}}],
+                                        "_source": ["Store ID", "Region", "Inventory Level", "Date"]
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+        
+        target = _resolve_index(es, index, history)
+        response = es.search(index=target, body=search_body)
+        
+        found = {}
+        for product_bucket in response['aggregations']['products']['buckets']:
+            total_inventory = 0
+            stores_in_stock = []
+            for store_bucket in product_bucket['stores']['buckets']:
+                source = store_bucket['latest']['hits']['hits'][0]['_source']
+                inventory_level = source.get('Inventory Level', 0)
+                total_inventory += inventory_level
+                if inventory_level > 0:
+                    stores_in_stock.append(source.get('Store ID', store_bucket['key']))
+            
+            found[product_bucket['key']] = {
+                "product_id": product_bucket['key'],
+                "total_inventory": total_inventory,
+                "stock_status": _stock_status(total_inventory),
+                "location_count": len(product_bucket['stores']['buckets']),
+                "stores_in_stock": stores_in_stock
+            }
+        
+        products = []
+        unavailable = []
+        for pid in unique_ids:
+            if pid in found:
+                products.append(found[pid])
+                if found[pid]["stock_status"] == "out_of_stock":
+                    unavailable.append(pid)
+            else:
+                products.append({
+                    "product_id": pid,
+                    "status": "not_found",
+                    "message": "No inventory records found for this product"
+                })
+                unavailable.append(pid)
+        
+        return {
+            "total_products": len(unique_ids),
+            "all_available": not unavailable,
+            "unavailable_products": unavailable,
+            "products": products,
+            "filters_applied": {
+                "store_id": store_id,
+                "region": region
+            },
+            **_snapshot_pending(target, history)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error checking bulk inventory: {str(e)}")
+        return {
+            "error": "Bulk inventory check failed",
+            "message": str(e),
+            "product_ids": product_ids
+        }
+
+
 def search_inventory_by_category(
     category: str,
     region: Optional[str] = None,
     min_inventory: Optional[int] = None,
     max_inventory: Optional[int] = None,
     index: str = "retail_store_inventory",
-    size: int = 50
+    size: int = 50,
+    history: bool = False
 ) -> Dict[str, Any]:
     """
     Search inventory by product category with optional filters.
@@ -179,6 +392,7 @@ def search_inventory_by_category(
         max_inventory: Maximum inventory level filter
         index: Elasticsearch index name
         size: Maximum number of results to return
+        history: Query the full daily history instead of the latest snapshot
     
     Returns:
         Dictionary containing matching inventory records
@@ -220,8 +434,9 @@ def search_inventory_by_category(
             }
         }
         
+        target = _resolve_index(es, index, history)
         response = es.search(
-            index=index,
+            index=target,
             retriever=retriever_object,
             size=size
         )
@@ -257,7 +472,8 @@ def search_inventory_by_category(
                 "region": region,
                 "min_inventory": min_inventory,
                 "max_inventory": max_inventory
-            }
+            },
+            **_snapshot_pending(target, history)
         }
         
     except Exception as e:
@@ -269,22 +485,74 @@ def search_inventory_by_category(
         }
 
 
+def _low_stock_filters(
+    threshold: int,
+    region: Optional[str],
+    category: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Query filters shared by the paged and streaming low stock alert scans."""
+    filters = [{
+        "range": {
+            "Inventory Level": {"lte": threshold}
+        }
+    }]
+    
+    if region:
+        filters.append({"term": {"Region": region}})
+    if category:
+        filters.append({"multi_match": {
+            "query": category,
+            "fields": ["Category"]
+        }})
+    return filters
+
+
+def _low_stock_alert(source: Dict[str, Any], threshold: int) -> Dict[str, Any]:
+    """Build an alert record and categorize its severity."""
+    inventory = source.get('Inventory Level', 0)
+    
+    if inventory == 0:
+        severity = "critical"
+    elif inventory <= threshold / 2:
+        severity = "high"
+    else:
+        severity = "medium"
+    
+    return {
+        "severity": severity,
+        "product_id": source.get('Product ID'),
+        "store_id": source.get('Store ID'),
+        "category": source.get('Category'),
+        "region": source.get('Region'),
+        "inventory_level": inventory,
+        "units_sold": source.get('Units Sold', 0),
+        "demand_forecast": source.get('Demand Forecast', 0),
+        "date": source.get('Date')
+    }
+
+
 def get_low_stock_alerts(
     threshold: int = 10,
     region: Optional[str] = None,
     category: Optional[str] = None,
     index: str = "retail_store_inventory",
-    size: int = 100
+    size: int = 100,
+    history: bool = False
 ) -> Dict[str, Any]:
     """
     Identify products with low stock levels that need attention.
     
+    Alert totals and severity counts are exact aggregations over every matching
+    record; `size` only limits how many of the lowest-stock alerts are listed.
+    Use iter_low_stock_alerts() to walk the full list.
+    
     Args:
         threshold: Inventory level threshold for low stock alert (default: 10)
         region: Optional region filter
         category: Optional category filter
         index: Elasticsearch index name
         size: Maximum number of results
+        history: Query the full daily history instead of the latest snapshot
     
     Returns:
         Dictionary containing low stock products and alert details
@@ -294,73 +562,52 @@ def get_low_stock_alerts(
         return {"error": "Elasticsearch client not configured"}
     
     try:
-        filters = [{
-            "range": {
-                "Inventory Level": {"lte": threshold}
-            }
-        }]
-        
-        if region:
-            filters.append({"term": {"Region": region}})
-        if category:
-            filters.append({"multi_match": {
-                "query": category,
-                "fields": ["Category"]
-            }})
+        engine = _columnar_engine(es, index)
+        if engine:
+            return engine.low_stock_alerts(threshold, region, category, size, history)
         
         # Use standard search body instead of retriever + sort combination
         search_body = {
             "query": {
                 "bool": {
-                    "filter": filters
+                    "filter": _low_stock_filters(threshold, region, category)
                 }
             },
             "size": size,
-            "sort": [{"Inventory Level": {"order": "asc"}}]
+            "track_total_hits": True,
+            "sort": [{"Inventory Level": {"order": "asc"}}],
+            "aggs": {
+                "severity": {
+                    "filters": {
+                        "filters": {
+                            "critical": {"term": {"Inventory Level": 0}},
+                            "high": {"range": {"Inventory Level": {"gt": 0, "lte": threshold / 2}}},
+                            "medium": {"range": {"Inventory Level": {"gt": threshold / 2}}}
+                        }
+                    }
+                }
+            }
         }
         
-        response = es.search(index=index, body=search_body)
-        
-        alerts = []
-        critical_count = 0
-        low_count = 0
+        target = _resolve_index(es, index, history)
+        response = es.search(index=target, body=search_body)
+        severity = response['aggregations']['severity']['buckets']
         
-        for hit in response['hits']['hits']:
-            source = hit['_source']
-            inventory = source.get('Inventory Level', 0)
-            
-            # Categorize alert severity
-            if inventory == 0:
-                severity = "critical"
-                critical_count += 1
-            elif inventory <= threshold / 2:
-                severity = "high"
-            else:
-                severity = "medium"
-                low_count += 1
-            
-            alerts.append({
-                "severity": severity,
-                "product_id": source.get('Product ID'),
-                "store_id": source.get('Store ID'),
-                "category": source.get('Category'),
-                "region": source.get('Region'),
-                "inventory_level": inventory,
-                "units_sold": source.get('Units Sold', 0),
-                "demand_forecast": source.get('Demand Forecast', 0),
-                "date": source.get('Date')
-            })
+        alerts = [_low_stock_alert(hit['_source'], threshold) for hit in response['hits']['hits']]
         
         return {
             "threshold": threshold,
-            "total_alerts": len(alerts),
-            "critical_alerts": critical_count,
-            "low_stock_alerts": low_count,
+            "total_alerts": response['hits']['total']['value'],
+            "alerts_shown": len(alerts),
+            "critical_alerts": severity['critical']['doc_count'],
+            "high_alerts": severity['high']['doc_count'],
+            "low_stock_alerts": severity['medium']['doc_count'],
             "alerts": alerts,
             "filters_applied": {
                 "region": region,
                 "category": category
-            }
+            },
+            **_snapshot_pending(target, history)
         }
         
     except Exception as e:
@@ -371,20 +618,118 @@ def get_low_stock_alerts(
         }
 
 
+def iter_low_stock_alerts(
+    threshold: int = 10,
+    region: Optional[str] = None,
+    category: Optional[str] = None,
+    index: str = "retail_store_inventory",
+    history: bool = False,
+    page_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream every low stock alert, lowest inventory first.
+    
+    Walks all matching records with point-in-time pagination, so memory use is
+    bounded by page_size however many SKUs are below the threshold.
+    
+    Args:
+        threshold: Inventory level threshold for low stock alert (default: 10)
+        region: Optional region filter
+        category: Optional category filter
+        index: Elasticsearch index name
+        history: Query the full daily history instead of the latest snapshot
+        page_size: Records fetched per request
+    
+    Yields:
+        Alert dictionaries in the same format as get_low_stock_alerts()
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        raise ConnectionError("Elasticsearch client not configured")
+    
+    for hits in scan_documents(
+        es,
+        _resolve_index(es, index, history),
+        query={"bool": {"filter": _low_stock_filters(threshold, region, category)}},
+        sort=[{"Inventory Level": {"order": "asc"}}],
+        page_size=page_size
+    ):
+        for hit in hits:
+            yield _low_stock_alert(hit['_source'], threshold)
+
+
+def export_low_stock_alerts(
+    output_path: str,
+    threshold: int = 10,
+    region: Optional[str] = None,
+    category: Optional[str] = None,
+    index: str = "retail_store_inventory",
+    history: bool = False
+) -> Dict[str, Any]:
+    """
+    Write every low stock alert to an NDJSON file, one alert per line.
+    
+    Args:
+        output_path: Destination .ndjson file
+        threshold: Inventory level threshold for low stock alert (default: 10)
+        region: Optional region filter
+        category: Optional category filter
+        index: Elasticsearch index name
+        history: Query the full daily history instead of the latest snapshot
+    
+    Returns:
+        Dictionary containing the file path and alert counts by severity
+    """
+    try:
+        counts = {"critical": 0, "high": 0, "medium": 0}
+        with open(output_path, "w", encoding="utf-8") as f:
+            for alert in iter_low_stock_alerts(threshold, region, category, index, history):
+                counts[alert["severity"]] += 1
+                f.write(json.dumps(alert) + "\n")
+        
+        return {
+            "output_path": output_path,
+            "threshold": threshold,
+            "total_alerts": sum(counts.values()),
+            "critical_alerts": counts["critical"],
+            "high_alerts": counts["high"],
+            "low_stock_alerts": counts["medium"],
+            "filters_applied": {
+                "region": region,
+                "category": category
+            }
+        }
+    
+    except Exception as e:
+        logger.error(f"Error exporting low stock alerts: {str(e)}")
+        return {
+            "error": "Low stock alert export failed",
+            "message": str(e),
+            "output_path": output_path
+        }
+
+
 def get_inventory_by_region(
     region: str,
     category: Optional[str] = None,
     index: str = "retail_store_inventory",
-    size: int = 100
+    size: int = 100,
+    history: bool = False,
+    include_items: bool = False
 ) -> Dict[str, Any]:
     """
     Get inventory levels for a specific region.
     
+    Totals, store count and per-category breakdowns come from aggregations over
+    every matching record, so they are exact and the response stays compact.
+    
     Args:
         region: Region to query (e.g., "North", "South", "East", "West")
         category: Optional category filter
         index: Elasticsearch index name
-        size: Maximum number of results
+        size: Maximum number of raw inventory items (only with include_items)
+        history: Query the full daily history instead of the latest snapshot
+        include_items: Also return up to `size` raw inventory records
     
     Returns:
         Dictionary containing regional inventory data
@@ -394,6 +739,10 @@ def get_inventory_by_region(
         return {"error": "Elasticsearch client not configured"}
     
     try:
+        engine = _columnar_engine(es, index)
+        if engine:
+            return engine.inventory_by_region(region, category, size, history, include_items)
+        
         filters = [{"term": {"Region": region}}]
         
         if category:
@@ -402,71 +751,70 @@ def get_inventory_by_region(
                 "fields": ["Category"]
             }})
         
-        retriever_object = {
-            "standard": {
-                "query": {
-                    "bool": {
-                        "filter": filters
+        search_body = {
+            "query": {
+                "bool": {
+                    "filter": filters
+                }
+            },
+            "size": size if include_items else 0,
+            "track_total_hits": True,
+            "aggs": {
+                "total_inventory": {"sum": {"field": "Inventory Level"}},
+                "total_sold": {"sum": {"field": "Units Sold"}},
+                "store_count": {
+                    "cardinality": {"field": "Store ID", "precision_threshold": 40000}
+                },
+                "stores": {
+                    "terms": {"field": "Store ID", "size": 100}
+                },
+                "categories": {
+                    "terms": {"field": "Category", "size": 100},
+                    "aggs": {
+                        "inventory": {"sum": {"field": "Inventory Level"}},
+                        "sold": {"sum": {"field": "Units Sold"}}
                     }
                 }
             }
         }
         
-        response = es.search(
-            index=index,
-            retriever=retriever_object,
-            size=size
-        )
-        
-        # Aggregate regional data
-        total_inventory = 0
-        total_sold = 0
-        stores = set()
-        products_by_category = {}
+        target = _resolve_index(es, index, history)
+        response = es.search(index=target, body=search_body)
+        aggs = response['aggregations']
         
-        inventory_items = []
+        result = {
+            "region": region,
+            "total_inventory": int(aggs['total_inventory']['value']),
+            "total_units_sold": int(aggs['total_sold']['value']),
+            "store_count": aggs['store_count']['value'],
+            "stores": [bucket['key'] for bucket in aggs['stores']['buckets']],
+            "categories": {
+                bucket['key']: {
+                    "inventory": int(bucket['inventory']['value']),
+                    "sold": int(bucket['sold']['value']),
+                    "count": bucket['doc_count']
+                }
+                for bucket in aggs['categories']['buckets']
+            },
+            "total_results": response['hits']['total']['value'],
+            **_snapshot_pending(target, history)
+        }
         
-        for hit in response['hits']['hits']:
-            source = hit['_source']
-            inventory = source.get('Inventory Level', 0)
-            sold = source.get('Units Sold', 0)
-            cat = source.get('Category', 'Unknown')
-            
-            total_inventory += inventory
-            total_sold += sold
-            stores.add(source.get('Store ID'))
-            
-            if cat not in products_by_category:
-                products_by_category[cat] = {
-                    "inventory": 0,
-                    "sold": 0,
-                    "count": 0
+        if include_items:
+            result["inventory_items"] = [
+                {
+                    "product_id": hit['_source'].get('Product ID'),
+                    "store_id": hit['_source'].get('Store ID'),
+                    "category": hit['_source'].get('Category', 'Unknown'),
+                    "inventory_level": hit['_source'].get('Inventory Level', 0),
+                    "units_sold": hit['_source'].get('Units Sold', 0),
+                    "price": hit['_source'].get('Price', 0),
+                    "date": hit['_source'].get('Date')
                 }
-            
-            products_by_category[cat]["inventory"] += inventory
-            products_by_category[cat]["sold"] += sold
-            products_by_category[cat]["count"] += 1
-            
-            inventory_items.append({
-                "product_id": source.get('Product ID'),
-                "store_id": source.get('Store ID'),
-                "category": cat,
-                "inventory_level": inventory,
-                "units_sold": sold,
-                "price": source.get('Price', 0),
-                "date": source.get('Date')
-            })
+                for hit in response['hits']['hits']
+            ]
         
-        return {
-            "region": region,
-            "total_inventory": total_inventory,
-            "total_units_sold": total_sold,
-            "store_count": len(stores),
-            "stores": list(stores),
-            "categories": products_by_category,
-            "inventory_items": inventory_items,
-            "total_results": response['hits']['total']['value']
-        }
+        return result
         
     except Exception as e:
         logger.error(f"Error getting regional inventory: {str(e)}")
@@ -477,26 +825,53 @@ def get_inventory_by_region(
         }
 
 
+FORECAST_SOURCES = {"index", "model"}
+MAX_HORIZON_DAYS = 90
+
+
 def check_demand_forecast(
     product_id: Optional[str] = None,
     category: Optional[str] = None,
     region: Optional[str] = None,
     index: str = "retail_store_inventory",
-    size: int = 50
+    size: int = 50,
+    history: bool = False,
+    forecast_source: str = "index",
+    horizon_days: int = 1
 ) -> Dict[str, Any]:
     """
     Check demand forecasts for products to help with inventory planning.
     
+    With forecast_source="model", demand comes from the time-series models fitted
+    on the daily Units Sold history (see forecasting.py) instead of the
+    precomputed `Demand Forecast` column, and is summed over horizon_days.
+    
     Args:
         product_id: Optional specific product ID
         category: Optional category filter
         region: Optional region filter
         index: Elasticsearch index name
         size: Maximum number of results
+        history: Query the full daily history instead of the latest snapshot
+        forecast_source: "index" for the Demand Forecast field, "model" for fitted forecasts
+        horizon_days: Days of demand to forecast, 1-90 (model forecasts only)
     
     Returns:
         Dictionary containing demand forecast data and recommendations
     """
+    if forecast_source not in FORECAST_SOURCES:
+        return {
+            "error": "Invalid forecast_source",
+            "message": "forecast_source must be 'index' or 'model'",
+            "forecast_source": forecast_source
+        }
+    if not 1 <= horizon_days <= MAX_HORIZON_DAYS:
+        return {
+            "error": "Invalid horizon_days",
+            "message": f"horizon_days must be between 1 and {MAX_HORIZON_DAYS}",
+            "horizon_days": horizon_days
+        }
+    
     es = get_elasticsearch_client()
     if not es:
         return {"error": "Elasticsearch client not configured"}
@@ -520,6 +895,13 @@ def check_demand_forecast(
                 "message": "Please specify product_id, category, or region"
             }
         
+        engine = _columnar_engine(es, index)
+        if forecast_source == "model":
+            forecaster = get_demand_forecaster(es, index, engine=engine)
+            return forecaster.demand_forecast(product_id, category, region, size, horizon_days)
+        if engine:
+            return engine.demand_forecast(product_id, category, region, size, history)
+        
         retriever_object = {
             "standard": {
                 "query": {
@@ -530,8 +912,9 @@ def check_demand_forecast(
             }
         }
         
+        target = _resolve_index(es, index, history)
         response = es.search(
-            index=index,
+            index=target,
             retriever=retriever_object,
             size=size
         )
@@ -576,7 +959,8 @@ def check_demand_forecast(
                 "product_id": product_id,
                 "category": category,
                 "region": region
-            }
+            },
+            **_snapshot_pending(target, history)
         }
         
     except Exception as e:
@@ -587,20 +971,290 @@ def check_demand_forecast(
         }
 
 
+def plan_inventory_restock(
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    cover_days: float = 7.0,
+    top_n: int = 20,
+    file_name: Optional[str] = None,
+    index: str = "retail_store_inventory",
+    history: bool = False
+) -> Dict[str, Any]:
+    """
+    Build a ranked restock plan over every matching product/store record.
+
+    Unlike check_demand_forecast, which inspects a page of results, this pulls
+    all matching rows and computes shortage, days of cover and suggested order
+    quantity for each of them in one vectorized pass.
+
+    Args:
+        product_id: Optional specific product ID
+        category: Optional category filter
+        region: Optional region filter
+        cover_days: Days of forecast demand the restocked inventory should cover
+        top_n: Number of highest-priority rows to return
+        file_name: Optional file name for the full plan inside INVENTORY_EXPORT_DIR;
+            .parquet writes Parquet, anything else CSV
+        index: Elasticsearch index name
+        history: Plan over the full daily history instead of the latest snapshot
+
+    Returns:
+        Dictionary containing plan totals, the top priority rows and the download path
+    """
+    output_path = None
+    if file_name:
+        try:
+            output_path = resolve_export_path(file_name)
+        except ValueError as e:
+            return {
+                "error": "Invalid file_name",
+                "message": str(e),
+                "file_name": file_name
+            }
+
+    es = get_elasticsearch_client()
+    if not es:
+        return {"error": "Elasticsearch client not configured"}
+
+    try:
+        started = time.perf_counter()
+
+        pending = {}
+        engine = _columnar_engine(es, index)
+        if engine:
+            columns = load_restock_inputs_from_engine(engine, history, product_id, category, region)
+        else:
+            filters = []
+            if product_id:
+                filters.append({"term": {"Product ID": product_id}})
+            if category:
+                filters.append({"multi_match": {
+                    "query": category,
+                    "fields": ["Category"]
+                }})
+            if region:
+                filters.append({"term": {"Region": region}})
+            target = _resolve_index(es, index, history)
+            pending = _snapshot_pending(target, history)
+            columns = load_restock_inputs(es, target, filters)
+
+        plan = compute_restock_plan(columns, cover_days=cover_days)
+        needs_order = plan["suggested_order"] > 0
+
+        result = {
+            "rows_analyzed": int(len(plan["priority_rank"])),
+            "rows_short": int((plan["shortage"] > 0).sum()),
+            "rows_to_order": int(needs_order.sum()),
+            "total_shortage": int(np.ceil(plan["shortage"].sum())),
+            "total_suggested_order": int(plan["suggested_order"].sum()),
+            "cover_days": cover_days,
+            "top_priorities": plan_rows(plan, 0, top_n),
+            "filters_applied": {
+                "product_id": product_id,
+                "category": category,
+                "region": region
+            },
+            **pending
+        }
+        if output_path:
+            export_restock_plan(plan, output_path)
+            result["download_path"] = os.path.relpath(output_path, os.path.realpath(EXPORT_DIR)).replace(os.sep, "/")
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Restock plan for {result['rows_analyzed']} rows built in {elapsed:.2f}s")
+        result["elapsed_seconds"] = round(elapsed, 2)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error building restock plan: {str(e)}")
+        return {
+            "error": "Restock planning failed",
+            "message": str(e)
+        }
+
+
+def get_sales_anomalies(
+    region: Optional[str] = None,
+    category: Optional[str] = None,
+    store_id: Optional[str] = None,
+    direction: str = "both",
+    min_score: float = 3.5,
+    top_n: int = 20,
+    index: str = "retail_store_inventory"
+) -> Dict[str, Any]:
+    """
+    Find product/store pairs with abnormal sales on the latest day.
+    
+    Every product/store Units Sold series is scored against its trailing window
+    (rolling z-score and median-absolute-deviation score) in a precomputed
+    batch, so this answers from memory.
+    
+    Args:
+        region: Optional region filter
+        category: Optional category filter
+        store_id: Optional store filter
+        direction: "spike", "drop" or "both"
+        min_score: Minimum absolute robust score to report
+        top_n: Maximum number of anomalies to return
+        index: Elasticsearch index name
+    
+    Returns:
+        Dictionary containing anomaly counts and the strongest anomalies
+    """
+    if direction not in ("spike", "drop", "both"):
+        return {
+            "error": "Invalid direction",
+            "message": "direction must be 'spike', 'drop' or 'both'"
+        }
+    
+    es = get_elasticsearch_client()
+    if not es:
+        return {"error": "Elasticsearch client not configured"}
+    
+    try:
+        detector = get_anomaly_detector(es, index, engine=_columnar_engine(es, index))
+        return detector.top_anomalies(region, category, store_id, direction, min_score, top_n)
+        
+    except Exception as e:
+        logger.error(f"Error detecting sales anomalies: {str(e)}")
+        return {
+            "error": "Sales anomaly detection failed",
+            "message": str(e)
+        }
+
+
+def get_rebalancing_plan(
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    product_id: Optional[str] = None,
+    cover_days: float = 7.0,
+    cross_region: bool = False,
+    top_n: int = 50,
+    index: str = "retail_store_inventory"
+) -> Dict[str, Any]:
+    """
+    Suggest store-to-store transfers that cover shortages from overstocked stores.
+    
+    Every store holding a product gets a target of Demand Forecast × cover_days;
+    surplus above target is matched to shortages of the same product (in the same
+    region unless cross_region=True), largest first. Shortages that transfers
+    cannot cover are reported as remaining need for restocking.
+    
+    Args:
+        category: Optional category filter
+        region: Optional region filter
+        product_id: Optional specific product ID
+        cover_days: Days of forecast demand each store should hold
+        cross_region: Allow transfers between regions
+        top_n: Maximum number of transfers to return
+        index: Elasticsearch index name
+    
+    Returns:
+        Dictionary containing the transfer plan and coverage totals
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        return {"error": "Elasticsearch client not configured"}
+    
+    try:
+        started = time.perf_counter()
+        
+        pending = {}
+        engine = _columnar_engine(es, index)
+        if engine:
+            columns = load_restock_inputs_from_engine(engine, False, product_id, category, region)
+        else:
+            filters = []
+            if product_id:
+                filters.append({"term": {"Product ID": product_id}})
+            if category:
+                filters.append({"multi_match": {
+                    "query": category,
+                    "fields": ["Category"]
+                }})
+            if region:
+                filters.append({"term": {"Region": region}})
+            target = _resolve_index(es, index, False)
+            pending = _snapshot_pending(target, False)
+            columns = load_restock_inputs(es, target, filters)
+        
+        plan = compute_rebalancing_plan(columns, cover_days=cover_days, cross_region=cross_region)
+        
+        transfers = []
+        for donor, recipient, quantity in zip(
+            plan["donor"][:top_n], plan["recipient"][:top_n], plan["quantity"][:top_n]
+        ):
+            transfers.append({
+                "product_id": columns["product_id"][donor],
+                "category": columns["category"][donor],
+                "from_store": columns["store_id"][donor],
+                "from_region": columns["region"][donor],
+                "to_store": columns["store_id"][recipient],
+                "to_region": columns["region"][recipient],
+                "quantity": int(quantity),
+                "from_inventory": int(columns["current_inventory"][donor]),
+                "to_inventory": int(columns["current_inventory"][recipient])
+            })
+        
+        total_need = int(plan["need"].sum())
+        units_moved = int(plan["quantity"].sum())
+        return {
+            "total_transfers": int(len(plan["quantity"])),
+            "units_transferred": units_moved,
+            "total_shortage": total_need,
+            "shortage_covered_percent": round(units_moved / total_need * 100, 2) if total_need else 100.0,
+            "remaining_shortage": total_need - units_moved,
+            "total_surplus": int(plan["surplus"].sum()),
+            "stores_sending": int(len(np.unique(columns["store_id"][plan["donor"]]))),
+            "stores_receiving": int(len(np.unique(columns["store_id"][plan["recipient"]]))),
+            "transfers": transfers,
+            "cover_days": cover_days,
+            "filters_applied": {
+                "category": category,
+                "region": region,
+                "product_id": product_id,
+                "cross_region": cross_region
+            },
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            **pending
+        }
+        
+    except Exception as e:
+        logger.error(f"Error building rebalancing plan: {str(e)}")
+        return {
+            "error": "Rebalancing plan failed",
+            "message": str(e)
+        }
+
+
+def _readiness(inventory: float, demand: float) -> float:
+    """Inventory coverage of forecast demand, in percent."""
+    return round(inventory / demand * 100, 2) if demand > 0 else 0
+
+
 def get_seasonal_inventory_analysis(
     seasonality: str,
     region: Optional[str] = None,
     index: str = "retail_store_inventory",
-    size: int = 100
+    size: int = 100,
+    history: bool = False,
+    include_products: bool = False
 ) -> Dict[str, Any]:
     """
     Analyze inventory based on seasonal patterns.
     
+    The readiness score and the per-category and per-region breakdowns are sum
+    aggregations over the full Seasonality slice, so they are exact and the query
+    cost does not depend on how many documents match.
+    
     Args:
         seasonality: Season to analyze (e.g., "Summer", "Winter", "Spring", "Fall")
         region: Optional region filter
         index: Elasticsearch index name
-        size: Maximum number of results
+        size: Maximum number of product records (only with include_products)
+        history: Query the full daily history instead of the latest snapshot
+        include_products: Also return up to `size` raw product records
     
     Returns:
         Dictionary containing seasonal inventory analysis
@@ -610,82 +1264,91 @@ def get_seasonal_inventory_analysis(
         return {"error": "Elasticsearch client not configured"}
     
     try:
+        engine = _columnar_engine(es, index)
+        if engine:
+            return engine.seasonal_analysis(seasonality, region, size, history, include_products)
+        
         filters = [{"term": {"Seasonality": seasonality}}]
         
         if region:
             filters.append({"term": {"Region": region}})
         
-        retriever_object = {
-            "standard": {
-                "query": {
-                    "bool": {
-                        "filter": filters
-                    }
+        totals = {
+            "inventory": {"sum": {"field": "Inventory Level"}},
+            "demand": {"sum": {"field": "Demand Forecast"}}
+        }
+        search_body = {
+            "query": {
+                "bool": {
+                    "filter": filters
+                }
+            },
+            "size": size if include_products else 0,
+            "track_total_hits": True,
+            "aggs": {
+                **totals,
+                "categories": {
+                    "terms": {"field": "Category", "size": 100},
+                    "aggs": totals
+                },
+                "regions": {
+                    "terms": {"field": "Region", "size": 20},
+                    "aggs": totals
                 }
             }
         }
         
-        response = es.search(
-            index=index,
-            retriever=retriever_object,
-            size=size
-        )
-        
-        # Aggregate seasonal data
-        total_inventory = 0
-        total_demand = 0
-        categories = {}
-        
-        products = []
+        target = _resolve_index(es, index, history)
+        response = es.search(index=target, body=search_body)
+        aggs = response['aggregations']
         
-        for hit in response['hits']['hits']:
-            source = hit['_source']
-            inventory = source.get('Inventory Level', 0)
-            demand = source.get('Demand Forecast', 0)
-            cat = source.get('Category', 'Unknown')
-            
-            total_inventory += inventory
-            total_demand += demand
-            
-            if cat not in categories:
-                categories[cat] = {
-                    "inventory": 0,
-                    "demand": 0,
-                    "products": 0
+        def breakdown(buckets):
+            return {
+                bucket['key']: {
+                    "inventory": int(bucket['inventory']['value']),
+                    "demand": int(bucket['demand']['value']),
+                    "products": bucket['doc_count'],
+                    "readiness_score": _readiness(bucket['inventory']['value'], bucket['demand']['value'])
                 }
-            
-            categories[cat]["inventory"] += inventory
-            categories[cat]["demand"] += demand
-            categories[cat]["products"] += 1
-            
-            products.append({
-                "product_id": source.get('Product ID'),
-                "store_id": source.get('Store ID'),
-                "category": cat,
-                "region": source.get('Region'),
-                "inventory_level": inventory,
-                "demand_forecast": demand,
-                "units_sold": source.get('Units Sold', 0),
-                "price": source.get('Price', 0),
-                "discount": source.get('Discount', 0),
-                "date": source.get('Date')
-            })
+                for bucket in buckets
+            }
         
-        # Calculate readiness score
-        readiness = (total_inventory / total_demand * 100) if total_demand > 0 else 0
+        total_inventory = aggs['inventory']['value']
+        total_demand = aggs['demand']['value']
+        readiness = _readiness(total_inventory, total_demand)
         
-        return {
+        result = {
             "seasonality": seasonality,
             "region": region,
-            "total_inventory": total_inventory,
-            "total_demand_forecast": total_demand,
-            "readiness_score": round(readiness, 2),
+            "total_inventory": int(total_inventory),
+            "total_demand_forecast": int(total_demand),
+            "readiness_score": readiness,
             "readiness_status": "Ready" if readiness >= 100 else "Needs Restocking",
-            "categories": categories,
-            "products": products,
-            "total_results": response['hits']['total']['value']
+            "categories": breakdown(aggs['categories']['buckets']),
+            "regions": breakdown(aggs['regions']['buckets']),
+            "total_results": response['hits']['total']['value'],
+            **_snapshot_pending(target, history)
         }
         
+        if include_products:
+            result["products"] = [
+                {
+                    "product_id": hit['_source'].get('Product ID'),
+                    "store_id": hit['_source'].get('Store ID'),
+                    "category": hit['_source'].get('Category', 'Unknown'),
+                    "region": hit['_source'].get('Region'),
+                    "inventory_level": hit['_source'].get('Inventory Level', 0),
+                    "demand_forecast": hit['_source'].get('Demand Forecast', 0),
+                    "units_sold": hit['_source'].get('Units Sold', 0),
+                    "price": hit['_source'].get('Price', 0),
+                    "discount": hit['_source'].get('Discount', 0),
+                    "date": hit['_source'].get('Date')
+                }
+                for hit in response['hits']['hits']
+            ]
+        
+        return result
+        
     except Exception as e:
         logger.error(f"Error analyzing seasonal inventory: {str(e)}")
         return {
@@ -695,14 +1358,96 @@ def get_seasonal_inventory_analysis(
         }
 
 
+def _compute_inventory_statistics(es: Elasticsearch, index: str) -> Dict[str, Any]:
+    """Run the full statistics aggregation against an index."""
+    search_body = {
+        "size": 0,
+        "track_total_hits": True,
+        "aggs": {
+            "total_inventory": {
+                "sum": {"field": "Inventory Level"}
+            },
+            "total_sold": {
+                "sum": {"field": "Units Sold"}
+            },
+            "total_ordered": {
+                "sum": {"field": "Units Ordered"}
+            },
+            "categories": {
+                "terms": {"field": "Category", "size": 50}
+            },
+            "regions": {
+                "terms": {"field": "Region", "size": 20}
+            },
+            "stores": {
+                "cardinality": {"field": "Store ID"}
+            },
+            "avg_inventory": {
+                "avg": {"field": "Inventory Level"}
+            },
+            "avg_price": {
+                "avg": {"field": "Price"}
+            },
+            "low_stock_count": {
+                "filter": {
+                    "range": {
+                        "Inventory Level": {"lte": 10}
+                    }
+                }
+            },
+            "out_of_stock_count": {
+                "filter": {
+                    "term": {
+                        "Inventory Level": 0
+                    }
+                }
+            }
+        }
+    }
+    
+    response = es.search(index=index, body=search_body)
+    aggs = response['aggregations']
+    
+    return {
+        "total_products": response['hits']['total']['value'],
+        "total_inventory": int(aggs['total_inventory']['value']),
+        "total_units_sold": int(aggs['total_sold']['value']),
+        "total_units_ordered": int(aggs['total_ordered']['value']),
+        "unique_stores": aggs['stores']['value'],
+        "average_inventory_per_product": round(aggs['avg_inventory']['value'], 2),
+        "average_price": round(aggs['avg_price']['value'], 2),
+        "low_stock_products": aggs['low_stock_count']['doc_count'],
+        "out_of_stock_products": aggs['out_of_stock_count']['doc_count'],
+        "categories": [
+            {
+                "category": bucket['key'],
+                "product_count": bucket['doc_count']
+            }
+            for bucket in aggs['categories']['buckets']
+        ],
+        "regions": [
+            {
+                "region": bucket['key'],
+                "product_count": bucket['doc_count']
+            }
+            for bucket in aggs['regions']['buckets']
+        ]
+    }
+
+
 def get_inventory_statistics(
-    index: str = "retail_store_inventory"
+    index: str = "retail_store_inventory",
+    history: bool = False
 ) -> Dict[str, Any]:
     """
     Get overall inventory statistics and aggregations.
     
+    Served from a materialized rollup that is recomputed only when the index
+    stats or the snapshot sync counter change; see materialized.py.
+    
     Args:
         index: Elasticsearch index name
+        history: Query the full daily history instead of the latest snapshot
     
     Returns:
         Dictionary containing comprehensive inventory statistics
@@ -712,78 +1457,18 @@ def get_inventory_statistics(
         return {"error": "Elasticsearch client not configured"}
     
     try:
-        search_body = {
-            "size": 0,
-            "aggs": {
-                "total_inventory": {
-                    "sum": {"field": "Inventory Level"}
-                },
-                "total_sold": {
-                    "sum": {"field": "Units Sold"}
-                },
-                "total_ordered": {
-                    "sum": {"field": "Units Ordered"}
-                },
-                "categories": {
-                    "terms": {"field": "Category", "size": 50}
-                },
-                "regions": {
-                    "terms": {"field": "Region", "size": 20}
-                },
-                "stores": {
-                    "cardinality": {"field": "Store ID"}
-                },
-                "avg_inventory": {
-                    "avg": {"field": "Inventory Level"}
-                },
-                "avg_price": {
-                    "avg": {"field": "Price"}
-                },
-                "low_stock_count": {
-                    "filter": {
-                        "range": {
-                            "Inventory Level": {"lte": 10}
-                        }
-                    }
-                },
-                "out_of_stock_count": {
-                    "filter": {
-                        "term": {
-                            "Inventory Level": 0
-                        }
-                    }
-                }
-            }
-        }
-        
-        response = es.search(index=index, body=search_body)
-        aggs = response['aggregations']
+        engine = _columnar_engine(es, index)
+        if engine:
+            return engine.statistics(history)
         
-        return {
-            "total_products": response['hits']['total']['value'],
-            "total_inventory": int(aggs['total_inventory']['value']),
-            "total_units_sold": int(aggs['total_sold']['value']),
-            "total_units_ordered": int(aggs['total_ordered']['value']),
-            "unique_stores": aggs['stores']['value'],
-            "average_inventory_per_product": round(aggs['avg_inventory']['value'], 2),
-            "average_price": round(aggs['avg_price']['value'], 2),
-            "low_stock_products": aggs['low_stock_count']['doc_count'],
-            "out_of_stock_products": aggs['out_of_stock_count']['doc_count'],
-            "categories": [
-                {
-                    "category": bucket['key'],
-                    "product_count": bucket['doc_count']
-                }
-                for bucket in aggs['categories']['buckets']
-            ],
-            "regions": [
-                {
-                    "region": bucket['key'],
-                    "product_count": bucket['doc_count']
-                }
-                for bucket in aggs['regions']['buckets']
-            ]
-        }
+        result = get_materialized(
+            es,
+            "inventory_history_statistics" if history else "inventory_statistics",
+            index,
+            _compute_inventory_statistics,
+            resolve_index=lambda es, index: _resolve_index(es, index, history)
+        )
+        return {**result, **_snapshot_pending(result["materialized"]["fingerprint"]["index"], history)}
         
     except Exception as e:
         logger.error(f"Error getting inventory statistics: {str(e)}")
@@ -4,6 +4,7 @@ from typing import Dict, List, Any, Optional
 from elasticsearch import Elasticsearch
 from google.adk.agents import Agent
 from dotenv import load_dotenv
+from .dedupe import load_canonical_map, collapse_duplicates
 
 # Load environment variables
 load_dotenv()
@@ -89,6 +90,11 @@ def search_products_by_text(
             "size": size
         }
         
+        # Over-fetch when a duplicate map is loaded so collapsing still fills the page
+        canonical_map = load_canonical_map()
+        if canonical_map:
+            search_body["size"] = size * 2
+        
         # Add filters
         filters = []
         if gender:
@@ -105,9 +111,11 @@ def search_products_by_text(
         
         # Execute search
         response = es.search(index=index, body=search_body)
+        hits, duplicates_collapsed = collapse_duplicates(response['hits']['hits'], canonical_map)
         
         return {
             "total": response['hits']['total']['value'],
+            "duplicates_collapsed": duplicates_collapsed,
             "products": [
                 {
                     "id": hit['_id'],
@@ -124,7 +132,7 @@ def search_products_by_text(
                     "image_url": hit['_source'].get('image_url'),
                     "filename": hit['_source'].get('filename')
                 }
-                for hit in response['hits']['hits']
+                for hit in hits[:size]
             ],
             "query": query,
             "filters_applied": {
@@ -189,15 +197,19 @@ def search_products_by_image_similarity(
             }
         }
         
+        canonical_map = load_canonical_map()
         response = es.search(
             index=index,
             retriever=retriever_object,
-            size=size
+            size=size * 2 if canonical_map else size
         )
+        hits, duplicates_collapsed = collapse_duplicates(response['hits']['hits'], canonical_map)
+        hits = hits[:size]
         
         return {
-            "total": len(response['hits']['hits']),
+            "total": len(hits),
             "query": query_text,
+            "duplicates_collapsed": duplicates_collapsed,
             "products": [
                 {
                     "id": hit['_id'],
@@ -214,7 +226,7 @@ def search_products_by_image_similarity(
                     "image_url": hit['_source'].get('image_url'),
                     "filename": hit['_source'].get('filename')
                 }
-                for hit in response['hits']['hits']
+                for hit in hits
             ]
         }
     except Exception as e:
@@ -456,13 +468,18 @@ def search_similar_products(
         
         query_vector = original_product['_source']['image_embedding']
         
+        # Leave room for the original product and, when a duplicate map is
+        # loaded, for near-identical items that get collapsed below
+        canonical_map = load_canonical_map()
+        k = size * 2 + 1 if canonical_map else size + 1
+        
         # Search for similar products using kNN
         search_body = {
             "knn": {
                 "field": "image_embedding",
                 "query_vector": query_vector,
-                "k": size + 1,  # +1 to exclude the original product
-                "num_candidates": 100
+                "k": k,
+                "num_candidates": max(100, k)
             },
             "_source": {
                 "excludes": ["image_embedding"]  # Exclude embedding from results
@@ -471,9 +488,14 @@ def search_similar_products(
         
         response = es.search(index=index, body=search_body)
         
-        # Filter out the original product from results
+        # Filter out the original product and its duplicates, keeping one item per duplicate cluster
+        hits, duplicates_collapsed = collapse_duplicates(
+            response['hits']['hits'],
+            canonical_map,
+            exclude_ids=[product_id]
+        )
         similar_products = []
-        for hit in response['hits']['hits']:
+        for hit in hits:
             if hit['_id'] != product_id:
                 source = hit['_source']
                 similar_products.append({
@@ -496,7 +518,8 @@ def search_similar_products(
             "original_product_id": product_id,
             "original_product_name": original_product['_source'].get('productDisplayName'),
             "similar_products": similar_products[:size],
-            "count": len(similar_products[:size])
+            "count": len(similar_products[:size]),
+            "duplicates_collapsed": duplicates_collapsed
         }
     except Exception as e:
         logger.error(f"Similar products search error: {str(e)}")
@@ -0,0 +1,326 @@
+"""
+Product Near-Duplicate Detection
+Finds visually identical catalog items from exported image embeddings.
+
+Works on the output of `embedding_export` (embeddings.npy + metadata). Candidate
+pairs come from random-hyperplane locality-sensitive hashing (SimHash), so only
+products sharing an LSH bucket are compared, then every candidate is verified
+with exact cosine similarity. Connected duplicates form a cluster whose
+canonical ID is written to canonical_ids.json:
+
+    {
+      "threshold": 0.98,
+      "canonical": {"<duplicate id>": "<canonical id>", ...},
+      "clusters": {"<canonical id>": ["<member id>", ...], ...}
+    }
+
+Set PRODUCT_CANONICAL_MAP_PATH to this file so the search tools collapse duplicates.
+
+Usage (from the retail-agents-team directory):
+    python -m product_search_agent.dedupe --export exports/catalog --threshold 0.98
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Canonical Map Lookup (used by the search tools)
+# ============================================================================
+
+_canonical_cache: Dict[str, Any] = {"path": None, "mtime": None, "map": {}}
+
+
+def load_canonical_map(path: Optional[str] = None) -> Dict[str, str]:
+    """
+    Return the duplicate -> canonical product ID map.
+
+    The file is re-read only when its modification time changes, so calling
+    this on every search is cheap. Returns an empty map when no file is configured.
+
+    Args:
+        path: Map file path (defaults to PRODUCT_CANONICAL_MAP_PATH)
+
+    Returns:
+        Dictionary mapping duplicate product IDs to their canonical ID
+    """
+    path = path or os.getenv("PRODUCT_CANONICAL_MAP_PATH")
+    if not path or not os.path.exists(path):
+        return {}
+
+    try:
+        mtime = os.path.getmtime(path)
+        if _canonical_cache["path"] != path or _canonical_cache["mtime"] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            _canonical_cache.update({"path": path, "mtime": mtime, "map": data.get("canonical", {})})
+        return _canonical_cache["map"]
+    except Exception as e:
+        logger.warning(f"Failed to load canonical product map {path}: {str(e)}")
+        return {}
+
+
+def collapse_duplicates(
+    hits: List[Dict[str, Any]],
+    canonical_map: Dict[str, str],
+    exclude_ids: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Keep the best-ranked hit of every duplicate cluster.
+
+    Args:
+        hits: Elasticsearch hits in ranking order
+        canonical_map: Duplicate -> canonical ID map
+        exclude_ids: Product IDs whose whole cluster should be dropped
+
+    Returns:
+        Tuple of (remaining hits, number of hits collapsed)
+    """
+    seen = {canonical_map.get(pid, pid) for pid in (exclude_ids or [])}
+    kept = []
+    collapsed = 0
+    for hit in hits:
+        canonical_id = canonical_map.get(hit['_id'], hit['_id'])
+        if canonical_id in seen:
+            collapsed += 1
+            continue
+        seen.add(canonical_id)
+        kept.append(hit)
+    return kept, collapsed
+
+
+# ============================================================================
+# LSH Duplicate Detection
+# ============================================================================
+
+def _load_ids(export_dir: Path) -> List[str]:
+    parquet_path = export_dir / "metadata.parquet"
+    if parquet_path.exists():
+        import pyarrow.parquet as pq
+        return [str(i) for i in pq.read_table(parquet_path, columns=["id"]).column("id").to_pylist()]
+    with open(export_dir / "metadata.json", "r", encoding="utf-8") as f:
+        return [str(i) for i in json.load(f)["id"]]
+
+
+def _key_dtype(bits_per_table: int) -> np.dtype:
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        if bits_per_table <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError("bits_per_table must be at most 64")
+
+
+def _connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Lowest row of the component of every row, given duplicate pairs (min-label propagation)."""
+    labels = np.arange(n)
+    while len(left):
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return labels
+
+
+def find_duplicate_clusters(
+    embeddings: np.ndarray,
+    threshold: float = 0.98,
+    num_tables: int = 12,
+    bits_per_table: int = 16,
+    chunk_size: int = 20000,
+    max_bucket_size: int = 5000,
+    block_size: int = 2048,
+    seed: int = 42
+) -> np.ndarray:
+    """
+    Cluster near-duplicate rows using SimHash LSH plus exact cosine verification.
+
+    Each table hashes every vector to `bits_per_table` random-hyperplane sign bits.
+    Rows that collide in any table are compared with dense similarity blocks of
+    the bucket only, which keeps the total work far below the n^2 all-pairs scan.
+
+    The embeddings are read in chunks and never copied whole: memory is the
+    hash keys (num_tables × n, 2 bytes per key for 16 bits), one norm per row and
+    one block_size × block_size similarity block. Buckets larger than
+    max_bucket_size (degenerate hyperplanes) are skipped in that table; the
+    other tables still cover their rows.
+
+    Args:
+        embeddings: Matrix [n, dims] (a read-only memmap is fine)
+        threshold: Minimum cosine similarity for two products to be duplicates
+        num_tables: Number of independent hash tables (more tables = higher recall)
+        bits_per_table: Hyperplanes per table (more bits = smaller buckets)
+        chunk_size: Rows normalized and hashed per step
+        max_bucket_size: Largest bucket that is verified
+        block_size: Rows per side of a verification block
+        seed: Random seed for the hyperplanes
+
+    Returns:
+        Array [n] giving the cluster root (lowest row) for every row
+    """
+    n, dims = embeddings.shape
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((dims, num_tables * bits_per_table)).astype(np.float32)
+    key_dtype = _key_dtype(bits_per_table)
+    weights = (1 << np.arange(bits_per_table, dtype=np.uint64))
+
+    inverse_norms = np.empty(n, dtype=np.float32)
+    keys = np.empty((num_tables, n), dtype=key_dtype)
+    for start in range(0, n, chunk_size):
+        block = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        inverse = 1.0 / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+        inverse_norms[start:start + len(block)] = inverse
+        # Hyperplane signs do not depend on the vector length
+        bits = (block @ planes > 0).reshape(len(block), num_tables, bits_per_table)
+        keys[:, start:start + len(block)] = (bits.astype(np.uint64) * weights).sum(axis=2).T.astype(key_dtype)
+
+    def normalized(rows: np.ndarray) -> np.ndarray:
+        return np.asarray(embeddings[rows], dtype=np.float32) * inverse_norms[rows, None]
+
+    left_parts: List[np.ndarray] = []
+    right_parts: List[np.ndarray] = []
+    verified_pairs = 0
+    skipped_buckets = 0
+    for table in range(num_tables):
+        order = np.argsort(keys[table], kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[table][order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) < 2:
+                continue
+            if len(bucket) > max_bucket_size:
+                skipped_buckets += 1
+                continue
+            bucket = np.sort(bucket)
+            for i in range(0, len(bucket), block_size):
+                rows = bucket[i:i + block_size]
+                row_vectors = normalized(rows)
+                for j in range(i, len(bucket), block_size):
+                    columns = bucket[j:j + block_size]
+                    sims = row_vectors @ normalized(columns).T
+                    verified_pairs += sims.size
+                    left, right = np.nonzero(sims >= threshold)
+                    keep = rows[left] < columns[right]
+                    left_parts.append(rows[left][keep])
+                    right_parts.append(columns[right][keep])
+
+    if skipped_buckets:
+        logger.warning(f"Skipped {skipped_buckets} LSH buckets larger than {max_bucket_size} rows")
+    logger.info(f"LSH verified {verified_pairs} candidate pairs for {n} products ({n * n} all-pairs)")
+    return _connected_components(
+        n,
+        np.concatenate(left_parts) if left_parts else np.empty(0, dtype=np.int64),
+        np.concatenate(right_parts) if right_parts else np.empty(0, dtype=np.int64)
+    )
+
+
+def build_canonical_map(
+    export_dir: str,
+    output_path: Optional[str] = None,
+    threshold: float = 0.98,
+    num_tables: int = 12,
+    bits_per_table: int = 16
+) -> Dict[str, Any]:
+    """
+    Detect near-duplicate products in an embedding export and write the canonical-ID map.
+
+    The canonical ID of a cluster is its lowest product ID (numeric order when the IDs are numeric).
+
+    Args:
+        export_dir: Directory written by embedding_export
+        output_path: Map file path (default: <export_dir>/canonical_ids.json)
+        threshold: Minimum cosine similarity for duplicates
+        num_tables: Number of LSH hash tables
+        bits_per_table: Hyperplanes per LSH table
+
+    Returns:
+        Dictionary containing cluster counts and the map file path
+    """
+    export_path = Path(export_dir)
+    output = Path(output_path) if output_path else export_path / "canonical_ids.json"
+
+    try:
+        started = time.perf_counter()
+        embeddings = np.load(export_path / "embeddings.npy", mmap_mode="r")
+        ids = _load_ids(export_path)
+        if len(ids) != embeddings.shape[0]:
+            return {
+                "error": "Export is inconsistent",
+                "message": f"{len(ids)} ids for {embeddings.shape[0]} embeddings",
+                "export_dir": export_dir
+            }
+
+        roots = find_duplicate_clusters(
+            embeddings,
+            threshold=threshold,
+            num_tables=num_tables,
+            bits_per_table=bits_per_table
+        )
+
+        members: Dict[int, List[str]] = {}
+        for row, root in enumerate(roots):
+            members.setdefault(int(root), []).append(ids[row])
+
+        canonical = {}
+        clusters = {}
+        for group in members.values():
+            if len(group) < 2:
+                continue
+            group.sort(key=lambda pid: (len(pid), pid))
+            clusters[group[0]] = group
+            for pid in group[1:]:
+                canonical[pid] = group[0]
+
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"threshold": threshold, "canonical": canonical, "clusters": clusters}, f)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Found {len(clusters)} duplicate clusters in {elapsed:.1f}s")
+        return {
+            "products": len(ids),
+            "duplicate_clusters": len(clusters),
+            "duplicate_products": len(canonical),
+            "threshold": threshold,
+            "map_path": str(output),
+            "elapsed_seconds": round(elapsed, 2)
+        }
+
+    except Exception as e:
+        logger.error(f"Duplicate detection failed: {str(e)}")
+        return {
+            "error": "Duplicate detection failed",
+            "message": str(e),
+            "export_dir": export_dir
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Detect near-duplicate products from exported embeddings")
+    parser.add_argument("--export", required=True, help="Directory written by embedding_export")
+    parser.add_argument("--output", help="Canonical map path (default: <export>/canonical_ids.json)")
+    parser.add_argument("--threshold", type=float, default=0.98, help="Cosine similarity threshold")
+    parser.add_argument("--tables", type=int, default=12, help="Number of LSH tables")
+    parser.add_argument("--bits", type=int, default=16, help="Hyperplanes per LSH table")
+    args = parser.parse_args()
+
+    result = build_canonical_map(
+        export_dir=args.export,
+        output_path=args.output,
+        threshold=args.threshold,
+        num_tables=args.tables,
+        bits_per_table=args.bits
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
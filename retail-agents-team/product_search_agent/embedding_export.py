@@ -0,0 +1,447 @@
+"""
+Product Embedding Export
+Bulk export of catalog image embeddings and product metadata from Elasticsearch.
+
+Pulls `image_embedding` plus product metadata from the `imagebind-embeddings` index
+using parallel sliced point-in-time (PIT) scans and streams the rows into:
+
+    <output_dir>/embeddings.npy       float32 matrix [n_products, dims] (np.load(..., mmap_mode="r"))
+    <output_dir>/metadata.parquet     columnar metadata in the same row order
+                                      (metadata.json when pyarrow is not installed)
+    <output_dir>/manifest.json        export state, used to resume interrupted runs
+
+Usage (from the retail-agents-team directory):
+    python -m product_search_agent.embedding_export --output exports/catalog --slices 4
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .agent import get_elasticsearch_client
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_FIELD = "image_embedding"
+DEFAULT_DIMS = 1024
+
+METADATA_FIELDS = [
+    "productDisplayName",
+    "articleType",
+    "gender",
+    "baseColour",
+    "season",
+    "masterCategory",
+    "subCategory",
+    "usage",
+    "year",
+    "image_url",
+    "filename"
+]
+
+# ============================================================================
+# Manifest Handling
+# ============================================================================
+
+class _Manifest:
+    """Thread-safe export state persisted to manifest.json after every batch."""
+
+    def __init__(self, path: Path, state: Dict[str, Any]):
+        self.path = path
+        self.state = state
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["_Manifest"]:
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def slice_state(self, slice_id: int) -> Dict[str, Any]:
+        return self.state["slices"][str(slice_id)]
+
+    def update_slice(self, slice_id: int, **changes: Any) -> None:
+        with self._lock:
+            self.state["slices"][str(slice_id)].update(changes)
+            self._write()
+
+    def update(self, **changes: Any) -> None:
+        with self._lock:
+            self.state.update(changes)
+            self._write()
+
+    def _write(self) -> None:
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+def _new_slice_state() -> Dict[str, Any]:
+    return {"rows": 0, "meta_bytes": 0, "search_after": None, "done": False, "skipped": 0}
+
+
+# ============================================================================
+# Export Helpers
+# ============================================================================
+
+def _get_embedding_dims(es, index: str) -> int:
+    """Read the dense_vector dimension from the index mapping."""
+    try:
+        mapping = es.indices.get_mapping(index=index)
+        for index_mapping in mapping.values():
+            field = index_mapping['mappings'].get('properties', {}).get(EMBEDDING_FIELD, {})
+            if field.get('dims'):
+                return int(field['dims'])
+    except Exception as e:
+        logger.warning(f"Could not read {EMBEDDING_FIELD} dims from mapping: {str(e)}")
+    return DEFAULT_DIMS
+
+
+def _pit_is_alive(es, pit_id: Optional[str], keep_alive: str) -> bool:
+    if not pit_id:
+        return False
+    try:
+        es.search(body={"size": 0, "pit": {"id": pit_id, "keep_alive": keep_alive}})
+        return True
+    except Exception:
+        return False
+
+
+def _truncate(path: Path, size: int) -> None:
+    """Drop any bytes written after the last checkpoint."""
+    if path.exists():
+        with open(path, "r+b") as f:
+            f.truncate(size)
+
+
+def _export_slice(
+    es,
+    manifest: _Manifest,
+    parts_dir: Path,
+    slice_id: int,
+    num_slices: int,
+    dims: int,
+    batch_size: int,
+    keep_alive: str
+) -> int:
+    """
+    Scan one PIT slice and append its rows to the slice part files.
+
+    Returns:
+        Number of rows exported by this call
+    """
+    state = manifest.slice_state(slice_id)
+    if state["done"]:
+        return 0
+
+    vectors_path = parts_dir / f"slice-{slice_id}.f32"
+    meta_path = parts_dir / f"slice-{slice_id}.jsonl"
+    _truncate(vectors_path, state["rows"] * dims * 4)
+    _truncate(meta_path, state["meta_bytes"])
+
+    rows = state["rows"]
+    meta_bytes = state["meta_bytes"]
+    skipped = state["skipped"]
+    search_after = state["search_after"]
+    exported = 0
+    batches = 0
+    started = time.perf_counter()
+
+    with open(vectors_path, "ab") as vectors_file, open(meta_path, "ab") as meta_file:
+        while True:
+            search_body = {
+                "size": batch_size,
+                "pit": {"id": manifest.state["pit_id"], "keep_alive": keep_alive},
+                "sort": [{"_shard_doc": "asc"}],
+                "_source": [EMBEDDING_FIELD] + METADATA_FIELDS,
+                "track_total_hits": False
+            }
+            if num_slices > 1:
+                search_body["slice"] = {"id": slice_id, "max": num_slices}
+            if search_after is not None:
+                search_body["search_after"] = search_after
+
+            response = es.search(body=search_body)
+            hits = response['hits']['hits']
+            if not hits:
+                break
+
+            batch_vectors = []
+            batch_meta = []
+            for hit in hits:
+                source = hit['_source']
+                embedding = source.get(EMBEDDING_FIELD)
+                if not embedding or len(embedding) != dims:
+                    skipped += 1
+                    continue
+                batch_vectors.append(embedding)
+                record = {"id": hit['_id']}
+                record.update({field: source.get(field) for field in METADATA_FIELDS})
+                batch_meta.append(json.dumps(record, ensure_ascii=False))
+
+            if batch_vectors:
+                vectors_file.write(np.asarray(batch_vectors, dtype=np.float32).tobytes())
+                encoded = ("\n".join(batch_meta) + "\n").encode("utf-8")
+                meta_file.write(encoded)
+                vectors_file.flush()
+                meta_file.flush()
+                rows += len(batch_vectors)
+                meta_bytes += len(encoded)
+                exported += len(batch_vectors)
+
+            search_after = hits[-1]['sort']
+            manifest.update_slice(
+                slice_id,
+                rows=rows,
+                meta_bytes=meta_bytes,
+                search_after=search_after,
+                skipped=skipped
+            )
+
+            batches += 1
+            if batches % 20 == 0:
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"Slice {slice_id}/{num_slices}: {rows} rows "
+                    f"({exported / elapsed if elapsed > 0 else 0:.0f} docs/s)"
+                )
+
+    manifest.update_slice(slice_id, done=True)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Slice {slice_id}/{num_slices} finished: {exported} rows in {elapsed:.1f}s "
+        f"({exported / elapsed if elapsed > 0 else 0:.0f} docs/s)"
+    )
+    return exported
+
+
+def _write_metadata(columns: Dict[str, List[Any]], output_dir: Path, metadata_format: str) -> Path:
+    """Write metadata columns as Parquet, falling back to columnar JSON."""
+    if metadata_format == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            path = output_dir / "metadata.parquet"
+            pq.write_table(pa.table(columns), path)
+            return path
+        except ImportError:
+            logger.warning("pyarrow is not installed, writing metadata.json instead of Parquet")
+
+    path = output_dir / "metadata.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(columns, f, ensure_ascii=False)
+    return path
+
+
+def _finalize(output_dir: Path, parts_dir: Path, num_slices: int, dims: int, metadata_format: str) -> Dict[str, Any]:
+    """Merge slice part files into embeddings.npy and the columnar metadata file."""
+    columns: Dict[str, List[Any]] = {"id": []}
+    columns.update({field: [] for field in METADATA_FIELDS})
+    slice_rows = []
+
+    for slice_id in range(num_slices):
+        rows = 0
+        meta_path = parts_dir / f"slice-{slice_id}.jsonl"
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    for name in columns:
+                        columns[name].append(record.get(name))
+                    rows += 1
+        slice_rows.append(rows)
+
+    total_rows = len(columns["id"])
+    embeddings_path = output_dir / "embeddings.npy"
+    matrix = open_memmap(embeddings_path, mode="w+", dtype=np.float32, shape=(total_rows, dims))
+
+    offset = 0
+    for slice_id, rows in enumerate(slice_rows):
+        if rows == 0:
+            continue
+        part = np.memmap(parts_dir / f"slice-{slice_id}.f32", dtype=np.float32, mode="r").reshape(-1, dims)
+        matrix[offset:offset + rows] = part[:rows]
+        offset += rows
+        del part
+    matrix.flush()
+    del matrix
+
+    metadata_path = _write_metadata(columns, output_dir, metadata_format)
+    return {
+        "rows": total_rows,
+        "embeddings_path": str(embeddings_path),
+        "metadata_path": str(metadata_path)
+    }
+
+
+# ============================================================================
+# Public Export Function
+# ============================================================================
+
+def export_embeddings(
+    output_dir: str,
+    index: str = "imagebind-embeddings",
+    slices: int = 4,
+    batch_size: int = 500,
+    keep_alive: str = "10m",
+    metadata_format: str = "parquet",
+    resume: bool = True
+) -> Dict[str, Any]:
+    """
+    Export all product embeddings and metadata to a memory-mappable .npy matrix
+    and a columnar metadata file.
+
+    Each slice of the point-in-time scan runs in its own thread and checkpoints
+    its progress (rows written and search_after cursor) to manifest.json after
+    every batch. Re-running with resume=True continues unfinished slices from
+    their last checkpoint. If the PIT has expired, every slice (finished or not)
+    restarts on a fresh PIT, so all rows come from one consistent view of the
+    index. The exported rows plus skipped documents are checked against the
+    PIT's document count.
+
+    Args:
+        output_dir: Directory for the export files
+        index: Elasticsearch index name
+        slices: Number of parallel PIT slices
+        batch_size: Documents fetched per search request
+        keep_alive: PIT keep-alive between requests
+        metadata_format: "parquet" (requires pyarrow) or "json"
+        resume: Continue a previous export found in output_dir
+
+    Returns:
+        Dictionary containing output paths, row counts and throughput
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+
+    out = Path(output_dir)
+    parts_dir = out / "parts"
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / "manifest.json"
+
+    try:
+        manifest = _Manifest.load(manifest_path) if resume else None
+        if manifest and (manifest.state["index"] != index or len(manifest.state["slices"]) != slices):
+            return {
+                "error": "Existing export does not match the requested settings",
+                "message": f"Remove {manifest_path} or pass the same index and slice count",
+                "output_dir": str(out)
+            }
+
+        if manifest is None:
+            dims = _get_embedding_dims(es, index)
+            manifest = _Manifest(manifest_path, {
+                "index": index,
+                "dims": dims,
+                "pit_id": None,
+                "slices": {str(i): _new_slice_state() for i in range(slices)}
+            })
+        dims = manifest.state["dims"]
+
+        pending = [i for i in range(slices) if not manifest.slice_state(i)["done"]]
+        if pending and not _pit_is_alive(es, manifest.state["pit_id"], keep_alive):
+            if manifest.state["pit_id"]:
+                logger.warning("Point-in-time expired, restarting every slice on a new PIT")
+            pending = list(range(slices))
+            for slice_id in pending:
+                manifest.state["slices"][str(slice_id)] = _new_slice_state()
+            pit = es.open_point_in_time(index=index, keep_alive=keep_alive)
+            documents = es.search(body={
+                "size": 0,
+                "track_total_hits": True,
+                "pit": {"id": pit['id'], "keep_alive": keep_alive}
+            })['hits']['total']['value']
+            manifest.update(pit_id=pit['id'], documents=documents)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=slices) as pool:
+            futures = [
+                pool.submit(_export_slice, es, manifest, parts_dir, slice_id, slices, dims, batch_size, keep_alive)
+                for slice_id in range(slices)
+            ]
+            exported = sum(future.result() for future in futures)
+        elapsed = time.perf_counter() - started
+
+        if pending:
+            try:
+                es.close_point_in_time(id=manifest.state["pit_id"])
+            except Exception as e:
+                logger.warning(f"Failed to close point-in-time: {str(e)}")
+
+        result = _finalize(out, parts_dir, slices, dims, metadata_format)
+        skipped = sum(manifest.slice_state(i)["skipped"] for i in range(slices))
+        documents = manifest.state.get("documents")
+        if documents is not None and result["rows"] + skipped != documents:
+            logger.warning(
+                f"Export accounts for {result['rows'] + skipped} documents but the point-in-time "
+                f"holds {documents}"
+            )
+        docs_per_sec = exported / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"Exported {exported} embeddings in {elapsed:.1f}s ({docs_per_sec:.0f} docs/s, "
+            f"{docs_per_sec * dims * 4 / 1e6:.1f} MB/s)"
+        )
+
+        result.update({
+            "index": index,
+            "dims": dims,
+            "slices": slices,
+            "exported_this_run": exported,
+            "skipped_without_embedding": skipped,
+            "documents_in_pit": documents,
+            "complete": documents is None or result["rows"] + skipped == documents,
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(docs_per_sec, 1)
+        })
+        return result
+
+    except Exception as e:
+        logger.error(f"Embedding export failed: {str(e)}")
+        return {
+            "error": "Embedding export failed",
+            "message": str(e),
+            "output_dir": str(out)
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export product image embeddings to NumPy / Parquet")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--index", default="imagebind-embeddings", help="Source index")
+    parser.add_argument("--slices", type=int, default=4, help="Parallel PIT slices")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per request")
+    parser.add_argument("--keep-alive", default="10m", help="PIT keep-alive")
+    parser.add_argument("--metadata-format", choices=["parquet", "json"], default="parquet")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore any previous export state")
+    args = parser.parse_args()
+
+    result = export_embeddings(
+        output_dir=args.output,
+        index=args.index,
+        slices=args.slices,
+        batch_size=args.batch_size,
+        keep_alive=args.keep_alive,
+        metadata_format=args.metadata_format,
+        resume=not args.no_resume
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
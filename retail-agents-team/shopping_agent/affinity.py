@@ -0,0 +1,284 @@
+"""
+Category Affinity
+Precomputes which product categories are bought by the same customers.
+
+The job streams all transactions once (customer_id, category) with the
+point-in-time scanner of export.py and builds a sparse binary customer ×
+category matrix X (scipy.sparse CSR, one non-zero per customer and category
+bought). One sparse product gives the category co-occurrence matrix
+
+    C = Xᵀ X    (C[i, j] = customers who bought both i and j, C[i, i] = buyers of i)
+
+from which, for a customer who bought category i, the affinity to category j is
+
+- confidence(i → j) = C[i, j] / C[i, i]
+- lift(i → j) = confidence(i → j) / (C[j, j] / customers)
+
+A lift above 1 means buyers of i are more likely than the average customer to
+buy j. Cross-sell candidates for every category are ranked once when the matrix
+is built, so a lookup is a dictionary access.
+
+Results are held in memory per index and rebuilt only when the index fingerprint
+changes (checked at most every SHOPPING_AFFINITY_CHECK_SECONDS). The first build,
+the checks and the rebuilds run in a background thread; the current result keeps
+being served meanwhile, and get_category_affinity returns None until the first
+build has completed. After a failure the current result is served for
+SHOPPING_AFFINITY_RETRY_SECONDS before trying again.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.affinity
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from scipy import sparse
+from elasticsearch import Elasticsearch
+
+from .migrations import SHOPPING_INDEX
+from .export import iter_transaction_pages
+from .revenue_cube import data_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = float(os.getenv("SHOPPING_AFFINITY_CHECK_SECONDS", "300"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_AFFINITY_RETRY_SECONDS", "300"))
+
+SCAN_FIELDS = ["customer_id", "category"]
+
+
+class CategoryAffinity:
+    """Category co-occurrence, confidence and lift for one index."""
+
+    def __init__(
+        self,
+        categories: List[str],
+        co_customers: np.ndarray,
+        total_customers: int,
+        multi_category_customers: int,
+        fingerprint: Optional[Dict[str, Any]] = None
+    ):
+        self.categories = categories
+        self.co_customers = co_customers
+        self.total_customers = total_customers
+        self.multi_category_customers = multi_category_customers
+        self.fingerprint = fingerprint
+
+        buyers = np.diag(co_customers).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.support = buyers / total_customers if total_customers else np.zeros_like(buyers)
+            self.confidence = np.nan_to_num(co_customers / buyers[:, None])
+            self.lift = np.nan_to_num(self.confidence / self.support[None, :])
+
+        # Other categories ranked by lift, then by shared customers
+        self._ranked = {}
+        for i, category in enumerate(categories):
+            others = np.array([j for j in range(len(categories)) if j != i], dtype=np.int64)
+            order = np.lexsort((-co_customers[i, others], -self.lift[i, others]))
+            self._ranked[category] = others[order].tolist()
+        self._position = {category: i for i, category in enumerate(categories)}
+        self._names = {category.lower(): category for category in categories}
+
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.checked_at = time.monotonic()
+
+    @classmethod
+    def from_transactions(
+        cls,
+        customer_ids: List[str],
+        categories: List[str],
+        fingerprint: Optional[Dict[str, Any]] = None
+    ) -> "CategoryAffinity":
+        """Build the customer × category matrix and its co-occurrence product."""
+        customers, rows = np.unique(np.asarray(customer_ids, dtype=str), return_inverse=True)
+        labels, columns = np.unique(np.asarray(categories, dtype=str), return_inverse=True)
+
+        purchases = sparse.csr_matrix(
+            (np.ones(len(customer_ids), dtype=np.int64), (rows.ravel(), columns.ravel())),
+            shape=(len(customers), len(labels))
+        )
+        purchases.sum_duplicates()
+        purchases.data[:] = 1
+        co_customers = (purchases.T @ purchases).toarray()
+
+        return cls(
+            labels.tolist(),
+            co_customers,
+            total_customers=len(customers),
+            multi_category_customers=int((purchases.getnnz(axis=1) > 1).sum()),
+            fingerprint=fingerprint
+        )
+
+    def resolve(self, category: str) -> Optional[str]:
+        """Category name as stored (case-insensitive match), or None if unknown."""
+        return self._names.get(category.lower())
+
+    def buyers(self, category: str) -> int:
+        i = self._position[category]
+        return int(self.co_customers[i, i])
+
+    def recommendations(self, category: str, top_n: int = 5, min_customers: int = 5) -> List[Dict[str, Any]]:
+        """
+        Categories to cross-sell to buyers of `category`, highest lift first.
+
+        Args:
+            category: Category as returned by resolve()
+            top_n: Maximum number of categories
+            min_customers: Minimum customers who bought both categories
+
+        Returns:
+            List of category, customers_both, confidence and lift
+        """
+        i = self._position[category]
+        results = []
+        for j in self._ranked[category]:
+            if len(results) >= top_n:
+                break
+            if self.co_customers[i, j] < min_customers:
+                continue
+            results.append({
+                "category": self.categories[j],
+                "customers_both": int(self.co_customers[i, j]),
+                "confidence": round(float(self.confidence[i, j]), 4),
+                "lift": round(float(self.lift[i, j]), 3)
+            })
+        return results
+
+    def matrix(self) -> Dict[str, Any]:
+        """Full co-occurrence and lift matrices, rows and columns in `categories` order."""
+        return {
+            "categories": self.categories,
+            "co_customers": self.co_customers.astype(int).tolist(),
+            "lift": np.round(self.lift, 3).tolist(),
+            "total_customers": self.total_customers,
+            "multi_category_customers": self.multi_category_customers
+        }
+
+
+def compute_category_affinity(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    slices: int = 2
+) -> CategoryAffinity:
+    """
+    Stream every transaction once and compute the category affinity matrices.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+        fingerprint: Fingerprint to store with the result
+        slices: Parallel point-in-time slices for the scan
+
+    Returns:
+        CategoryAffinity
+    """
+    started = time.perf_counter()
+    customer_ids: List[str] = []
+    categories: List[str] = []
+    for page in iter_transaction_pages(es, {"match_all": {}}, index=index, slices=slices, fields=SCAN_FIELDS):
+        for row in page:
+            if row["customer_id"] is None or row["category"] is None:
+                continue
+            customer_ids.append(row["customer_id"])
+            categories.append(row["category"])
+
+    affinity = CategoryAffinity.from_transactions(customer_ids, categories, fingerprint)
+    logger.info(
+        f"Category affinity of {len(affinity.categories)} categories over {affinity.total_customers} customers "
+        f"({affinity.multi_category_customers} multi-category) in {time.perf_counter() - started:.1f}s"
+    )
+    return affinity
+
+
+# ============================================================================
+# Affinity Registry
+# ============================================================================
+
+_affinity_lock = threading.Lock()
+_affinities: Dict[str, CategoryAffinity] = {}
+_failed_at: Dict[str, float] = {}
+_rebuilding: Dict[str, threading.Thread] = {}
+
+
+def _revalidate(es: Elasticsearch, index: str, affinity: Optional[CategoryAffinity]) -> None:
+    try:
+        fingerprint = data_fingerprint(es, index)
+        if affinity is None or fingerprint != affinity.fingerprint:
+            affinity = compute_category_affinity(es, index, fingerprint)
+        with _affinity_lock:
+            affinity.checked_at = time.monotonic()
+            _affinities[index] = affinity
+            _failed_at.pop(index, None)
+    except Exception as e:
+        logger.warning(f"Category affinity rebuild failed for {index}: {str(e)}")
+        with _affinity_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _affinity_lock:
+            _rebuilding.pop(index, None)
+
+
+def get_category_affinity(es: Elasticsearch, index: str = SHOPPING_INDEX) -> Optional[CategoryAffinity]:
+    """
+    Return the category affinity for an index, recomputing it only after the data changed.
+
+    Builds and rebuilds run in a background thread; the current result keeps
+    being returned meanwhile.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+
+    Returns:
+        Current CategoryAffinity, or None until the first build has completed
+    """
+    with _affinity_lock:
+        affinity = _affinities.get(index)
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _rebuilding
+            and (affinity is None or now - affinity.checked_at >= CHECK_SECONDS)
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _rebuilding[index] = threading.Thread(
+                target=_revalidate,
+                args=(es, index, affinity),
+                name=f"affinity-{index}",
+                daemon=True
+            )
+            _rebuilding[index].start()
+        return affinity
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compute the category co-occurrence and lift matrices")
+    parser.add_argument("--index", default=SHOPPING_INDEX, help="Shopping transactions index")
+    parser.add_argument("--slices", type=int, default=2, help="Parallel point-in-time slices")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    affinity = compute_category_affinity(es, args.index, data_fingerprint(es, args.index), args.slices)
+    print(json.dumps(affinity.matrix(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,12 @@ from .tools import (
     get_high_value_transactions,
     analyze_shopping_mall_performance,
     get_payment_method_analytics,
-    search_transactions_by_date_range
+    search_transactions_by_date_range,
+    get_customer_profile,
+    export_transactions,
+    get_customer_segments,
+    get_approximate_customer_metrics,
+    get_cross_sell_recommendations
 )
 
 root_agent = Agent(
@@ -37,19 +42,20 @@ root_agent = Agent(
 
     **Available Functions**:
 
-    1. **search_shopping_data_by_category(category, size)**:
+    1. **search_shopping_data_by_category(category, size, include_samples)**:
        - Search transactions by product category
        - Provides spending analytics, gender distribution, payment preferences
        - Returns: Total spending, average price, quantity sold, mall distribution
        - Use when: "Show me all Clothing purchases" or "Electronics sales data"
 
-    2. **get_customer_purchase_history(customer_id, size)**:
+    2. **get_customer_purchase_history(customer_id, size, page)**:
        - Complete purchase history for specific customer
        - Includes spending patterns, favorite categories, preferred malls
+       - Lifetime analytics are exact over all purchases; the history list is paginated (page, size)
        - Returns: Total spent, average transaction, category preferences, purchase timeline
        - Use when: "What has customer C123456 bought?" or "Customer purchase profile"
 
-    3. **analyze_shopping_trends_by_gender(gender, size)**:
+    3. **analyze_shopping_trends_by_gender(gender, size, include_samples)**:
        - Analyze shopping preferences by gender (Male/Female)
        - Category preferences, payment methods, mall preferences
        - Returns: Category breakdown, spending patterns, demographic insights
@@ -61,9 +67,11 @@ root_agent = Agent(
        - Returns: High-value purchases with customer details
        - Use when: "Show premium purchases" or "Transactions over $100"
 
-    5. **analyze_shopping_mall_performance(shopping_mall, size)**:
+    5. **analyze_shopping_mall_performance(shopping_mall, size, include_samples, category, start_month, end_month, top_n)**:
        - Performance metrics for specific mall or all malls
        - Revenue, traffic, category performance, customer demographics
+       - Slice by category and month range (YYYY-MM); top_segments ranks mall × category pairs
+       - Served from an in-memory revenue cube, so repeated slices are instant
        - Returns: Mall comparison, top categories, payment preferences
        - Use when: "How is Mall of Istanbul performing?" or "Compare all malls"
 
@@ -73,14 +81,49 @@ root_agent = Agent(
        - Returns: Payment method breakdown, gender distribution, age stats
        - Use when: "Payment method preferences" or "Cash vs Card usage"
 
-    7. **search_transactions_by_date_range(start_date, end_date, size)**:
+    7. **search_transactions_by_date_range(start_date, end_date, size, interval)**:
        - Search transactions within date range (YYYY-MM-DD format)
-       - Daily sales trends, category performance over time
-       - Returns: Revenue trends, daily breakdown, top categories
+       - Sales trends bucketed by interval: "day", "week" or "month" (use month for year-long ranges)
+       - Returns: Revenue trends, sales_over_time breakdown, top categories
        - Use when: "Sales in January" or "Last week's transactions"
 
+    8. **get_customer_profile(customer_id)**:
+       - Precomputed customer 360 profile (single lookup, kept up to date incrementally)
+       - Lifetime spend, order count, average order value, first/last purchase, recency
+       - Returns: Category, mall and payment distributions with favorites
+       - Use when: "Who is customer C123456?" or quick personalization questions
+
+    9. **export_transactions(file_name, start_date, end_date, category, slices)**:
+       - Write ALL matching transactions to a file in the export directory (.parquet for Parquet, otherwise NDJSON)
+       - file_name is a plain file name such as "transactions-2022.parquet"; never pass absolute paths or ".."
+       - Not limited by size; streams with bounded memory, slices 2-8 export in parallel
+       - Returns: Download path, format, rows exported, elapsed time
+       - Use when: "Export all 2022 transactions" or "Give me every Clothing sale as a file"
+
+    10. **get_customer_segments(segment, customer_id, top_n)**:
+       - RFM (recency, frequency, monetary) segmentation of every customer, precomputed
+       - Segments: champions, loyal_customers, potential_loyalists, new_customers, at_risk,
+         need_attention, hibernating, lost
+       - Returns: Segment sizes and revenue shares; top members of a segment; a customer's RFM score
+       - Use when: "Who are our best customers?" or "Which customers are at risk?"
+
+    11. **get_approximate_customer_metrics(start_date, end_date, shopping_mall, category, group_by, top_n)**:
+       - Approximate distinct customers, spend percentiles (p50/p90/p95/p99) and top customers by spend
+       - Any date range, mall and category; group_by "mall", "category", "day" or "month"
+       - Returns: Per-group transactions, revenue, distinct customers, spend quantiles, top customers
+       - Use when: "How many unique customers visited each mall last month?" or "What is the 95th percentile basket size?"
+
+    12. **get_cross_sell_recommendations(category, top_n, min_customers)**:
+       - Categories that buyers of a category also buy, from a precomputed co-occurrence / lift matrix
+       - Lift > 1 means buyers of the category are more likely than average to buy the other one
+       - Returns: Recommended categories with shared customers, confidence and lift
+       - Use when: "What should we cross-sell to Shoes buyers?" or "Which categories are bought together?"
+
     **Best Practices**:
 
+    - Analytics tools return aggregations only; set include_samples=True only when example transactions are needed
+    - Category, gender, payment and date-range analytics are served from a daily rollup; results may lag new transactions by about a minute
+
     - Use search_shopping_data_by_category() for product category insights
     - Use get_customer_purchase_history() for customer-specific analysis
     - Use analyze_shopping_trends_by_gender() for demographic segmentation
@@ -88,6 +131,11 @@ root_agent = Agent(
     - Use analyze_shopping_mall_performance() for location-based insights
     - Use get_payment_method_analytics() for payment strategy optimization
     - Use search_transactions_by_date_range() for temporal analysis
+    - Use get_customer_profile() for fast customer summaries; get_customer_purchase_history() for individual transactions
+    - Use export_transactions() when the user needs the full transaction list rather than a summary
+    - Use get_customer_segments() for best / at-risk / churned customer questions instead of scanning histories
+    - Use get_approximate_customer_metrics() for distinct-customer counts and spend percentiles; mention the figures are estimates
+    - Use get_cross_sell_recommendations() for "customers who buy X also buy Y" questions; only recommend lift > 1
     
     **Response Guidelines**:
     - Present data in clear, organized format with key metrics highlighted
@@ -140,6 +188,11 @@ root_agent = Agent(
         get_high_value_transactions,
         analyze_shopping_mall_performance,
         get_payment_method_analytics,
-        search_transactions_by_date_range
+        search_transactions_by_date_range,
+        get_customer_profile,
+        export_transactions,
+        get_customer_segments,
+        get_approximate_customer_metrics,
+        get_cross_sell_recommendations
     ]
 )
@@ -0,0 +1,488 @@
+"""
+Customer Profiles (Customer 360)
+Maintains one precomputed profile document per customer of the shopping index.
+
+A profile holds lifetime spend, order count, item count, category / mall / payment
+distributions and first/last purchase dates. Profiles are built with a composite
+aggregation over `customer_id` and written to SHOPPING_PROFILE_INDEX with bulk
+upserts, so a customer lookup is a single document get instead of a scan of the
+customer's transactions.
+
+Updates are incremental: each refresh finds the customers with transactions at or
+after the stored `invoice_date` watermark and rebuilds only their profiles from
+all of their transactions. The watermark and the transaction count it was taken
+at live in the profile index mapping `_meta`; while both are unchanged a refresh
+writes nothing. Transactions indexed later with an older date are only picked up
+by a full rebuild (`--full`).
+
+The first build covers every customer. Run it ahead of time from the command
+line; otherwise the first lookup starts it in a background thread and lookups
+aggregate the transactions until it completes. After a failed refresh lookups
+aggregate the transactions for SHOPPING_PROFILE_RETRY_SECONDS before trying
+again.
+
+Looked-up profiles are kept in a bounded in-process LRU; refreshed customers are
+evicted from it as their profiles are rewritten.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.customer_profiles [--full]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Dict, List, Any, Iterator, Optional
+
+from elasticsearch import Elasticsearch, helpers
+
+from .migrations import SHOPPING_INDEX
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INDEX = os.getenv("SHOPPING_PROFILE_INDEX", "customer_shopping_profiles")
+SYNC_INTERVAL_SECONDS = float(os.getenv("SHOPPING_PROFILE_SYNC_SECONDS", "60"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_PROFILE_RETRY_SECONDS", "300"))
+CACHE_SIZE = int(os.getenv("SHOPPING_PROFILE_CACHE_SIZE", "10000"))
+
+PROFILE_MAPPINGS = {
+    "properties": {
+        "customer_id": {"type": "keyword"},
+        "gender": {"type": "keyword"},
+        "age": {"type": "integer"},
+        "order_count": {"type": "long"},
+        "lifetime_spend": {"type": "double"},
+        "total_items": {"type": "long"},
+        "average_order_value": {"type": "double"},
+        "first_purchase": {"type": "date", "format": "yyyy-MM-dd"},
+        "last_purchase": {"type": "date", "format": "yyyy-MM-dd"},
+        "favorite_category": {"type": "keyword"},
+        "favorite_mall": {"type": "keyword"},
+        "preferred_payment_method": {"type": "keyword"},
+        "category_distribution": {"type": "object", "enabled": False},
+        "mall_distribution": {"type": "object", "enabled": False},
+        "payment_distribution": {"type": "object", "enabled": False},
+        "updated_at": {"type": "date"}
+    }
+}
+
+PROFILE_AGGS = {
+    "lifetime_spend": {"sum": {"field": "total_amount"}},
+    "total_items": {"sum": {"field": "quantity"}},
+    "first_purchase": {"min": {"field": "invoice_date", "format": "yyyy-MM-dd"}},
+    "last_purchase": {"max": {"field": "invoice_date", "format": "yyyy-MM-dd"}},
+    "categories": {
+        "terms": {"field": "category", "size": 20},
+        "aggs": {"spend": {"sum": {"field": "total_amount"}}}
+    },
+    "malls": {
+        "terms": {"field": "shopping_mall", "size": 20},
+        "aggs": {"spend": {"sum": {"field": "total_amount"}}}
+    },
+    "payment_methods": {"terms": {"field": "payment_method", "size": 10}},
+    "latest": {
+        "top_hits": {
+            "size": 1,
+            "sort": [{"invoice_date": {"order": "desc"}}],
+            "_source": ["gender", "age"]
+        }
+    }
+}
+
+
+# ============================================================================
+# In-process LRU
+# ============================================================================
+
+class ProfileCache:
+    """Bounded least-recently-used cache of profile documents keyed by customer_id."""
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            profile = self.entries.get(customer_id)
+            if profile is not None:
+                self.entries.move_to_end(customer_id)
+            return profile
+
+    def put(self, customer_id: str, profile: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[customer_id] = profile
+            self.entries.move_to_end(customer_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, customer_ids: List[str]) -> None:
+        with self.lock:
+            for customer_id in customer_ids:
+                self.entries.pop(customer_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+_cache = ProfileCache()
+
+
+# ============================================================================
+# Profile Build
+# ============================================================================
+
+def _distribution(buckets: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {
+        bucket['key']: {
+            "transactions": bucket['doc_count'],
+            "spend": round(bucket['spend']['value'], 2)
+        }
+        for bucket in buckets
+    }
+
+
+def _profile_document(bucket: Dict[str, Any], updated_at: str) -> Dict[str, Any]:
+    """Turn one customer bucket of the profile aggregation into a profile document."""
+    order_count = bucket['doc_count']
+    lifetime_spend = bucket['lifetime_spend']['value']
+    latest = bucket['latest']['hits']['hits'][0]['_source']
+    categories = bucket['categories']['buckets']
+    malls = bucket['malls']['buckets']
+    payments = bucket['payment_methods']['buckets']
+    return {
+        "customer_id": bucket['key']['customer'],
+        "gender": latest.get('gender'),
+        "age": latest.get('age'),
+        "order_count": order_count,
+        "lifetime_spend": round(lifetime_spend, 2),
+        "total_items": int(bucket['total_items']['value']),
+        "average_order_value": round(lifetime_spend / order_count, 2) if order_count else 0,
+        "first_purchase": bucket['first_purchase'].get('value_as_string'),
+        "last_purchase": bucket['last_purchase'].get('value_as_string'),
+        "favorite_category": categories[0]['key'] if categories else None,
+        "favorite_mall": malls[0]['key'] if malls else None,
+        "preferred_payment_method": payments[0]['key'] if payments else None,
+        "category_distribution": _distribution(categories),
+        "mall_distribution": _distribution(malls),
+        "payment_distribution": {bucket['key']: bucket['doc_count'] for bucket in payments},
+        "updated_at": updated_at
+    }
+
+
+def _customer_pages(
+    es: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    page_size: int,
+    profile_aggs: bool = True
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield pages of customer_id composite buckets (with profile sub-aggregations if requested)."""
+    after_key = None
+    while True:
+        composite = {
+            "size": page_size,
+            "sources": [{"customer": {"terms": {"field": "customer_id"}}}]
+        }
+        if after_key:
+            composite["after"] = after_key
+
+        customers = {"composite": composite}
+        if profile_aggs:
+            customers["aggs"] = PROFILE_AGGS
+        response = es.search(
+            index=index,
+            body={"size": 0, "query": query, "aggs": {"customers": customers}}
+        )
+        page = response['aggregations']['customers']
+        if page['buckets']:
+            yield page['buckets']
+
+        after_key = page.get('after_key')
+        if not after_key or not page['buckets']:
+            break
+
+
+def compute_customer_profile(
+    es: Elasticsearch,
+    customer_id: str,
+    index: str = SHOPPING_INDEX
+) -> Optional[Dict[str, Any]]:
+    """
+    Build one customer's profile directly from the transactions (no profile index).
+
+    Args:
+        es: Elasticsearch client
+        customer_id: Customer ID
+        index: Shopping transactions index
+
+    Returns:
+        Profile document, or None if the customer has no transactions
+    """
+    updated_at = datetime.now(timezone.utc).isoformat()
+    for buckets in _customer_pages(es, index, {"term": {"customer_id": customer_id}}, page_size=1):
+        return _profile_document(buckets[0], updated_at)
+    return None
+
+
+def _get_meta(es: Elasticsearch, profile_index: str) -> Dict[str, Any]:
+    mapping = es.indices.get_mapping(index=profile_index)
+    return next(iter(mapping.values()))['mappings'].get('_meta', {})
+
+
+def refresh_customer_profiles(
+    es: Elasticsearch,
+    source_index: str = SHOPPING_INDEX,
+    profile_index: str = PROFILE_INDEX,
+    full: bool = False,
+    page_size: int = 1000
+) -> Dict[str, Any]:
+    """
+    Bring the customer profile index up to date with the transactions.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Shopping transactions index
+        profile_index: Customer profile index to maintain
+        full: Ignore the watermark and rebuild every profile
+        page_size: Composite aggregation page size
+
+    Returns:
+        Dictionary containing the number of upserted profiles and the new watermark
+    """
+    if not es.indices.exists(index=profile_index):
+        es.indices.create(
+            index=profile_index,
+            mappings={"_meta": {"source_index": source_index, "watermark": None}, **PROFILE_MAPPINGS}
+        )
+        logger.info(f"Created customer profile index {profile_index}")
+        full = True
+
+    meta = {} if full else _get_meta(es, profile_index)
+    watermark = meta.get('watermark')
+
+    source = es.search(
+        index=source_index,
+        body={
+            "size": 0,
+            "track_total_hits": True,
+            "aggs": {"max_date": {"max": {"field": "invoice_date", "format": "yyyy-MM-dd"}}}
+        }
+    )
+    doc_count = source['hits']['total']['value']
+    max_date = source['aggregations']['max_date']
+    if max_date.get('value') is None:
+        return {"upserted": 0, "watermark": watermark, "full_rebuild": full}
+
+    new_watermark = max_date.get('value_as_string') or max_date['value']
+    if watermark == new_watermark and meta.get('doc_count') == doc_count:
+        return {"upserted": 0, "watermark": watermark, "full_rebuild": False}
+
+    query = {"range": {"invoice_date": {"gte": watermark, "format": "yyyy-MM-dd"}}} if watermark else {"match_all": {}}
+
+    started = time.perf_counter()
+    updated_at = datetime.now(timezone.utc).isoformat()
+    upserted = 0
+
+    def write(buckets: List[Dict[str, Any]]) -> None:
+        nonlocal upserted
+        profiles = [_profile_document(bucket, updated_at) for bucket in buckets]
+        helpers.bulk(es, [
+            {"_index": profile_index, "_id": profile["customer_id"], "_source": profile}
+            for profile in profiles
+        ])
+        _cache.invalidate([profile["customer_id"] for profile in profiles])
+        upserted += len(profiles)
+
+    if full:
+        _cache.clear()
+        for buckets in _customer_pages(es, source_index, query, page_size):
+            write(buckets)
+    else:
+        # Changed customers first, then their profiles from all of their transactions
+        for changed in _customer_pages(es, source_index, query, page_size, profile_aggs=False):
+            customer_ids = [bucket['key']['customer'] for bucket in changed]
+            for buckets in _customer_pages(es, source_index, {"terms": {"customer_id": customer_ids}}, page_size):
+                write(buckets)
+
+    es.indices.put_mapping(
+        index=profile_index,
+        meta={"source_index": source_index, "watermark": new_watermark, "doc_count": doc_count}
+    )
+    es.indices.refresh(index=profile_index)
+
+    logger.info(
+        f"Customer profiles refreshed: {upserted} customers, watermark {new_watermark}, "
+        f"{time.perf_counter() - started:.1f}s"
+    )
+    return {"upserted": upserted, "watermark": new_watermark, "full_rebuild": full}
+
+
+# ============================================================================
+# Lookup
+# ============================================================================
+
+_sync_lock = threading.Lock()
+_last_sync: Dict[str, float] = {}
+_failed_at: Dict[str, float] = {}
+_building: Dict[str, threading.Thread] = {}
+_watermarks: Dict[str, Optional[str]] = {}
+
+
+def _profiles_ready(es: Elasticsearch, profile_index: str) -> bool:
+    """True once a build has completed (the watermark is only written at the end)."""
+    return es.indices.exists(index=profile_index) and _get_meta(es, profile_index).get('watermark') is not None
+
+
+def _initial_build(es: Elasticsearch, source_index: str, profile_index: str) -> None:
+    try:
+        result = refresh_customer_profiles(es, source_index, profile_index, full=True)
+        with _sync_lock:
+            _watermarks[profile_index] = result["watermark"]
+            _last_sync[profile_index] = time.monotonic()
+            _failed_at.pop(profile_index, None)
+    except Exception as e:
+        logger.warning(f"Initial customer profile build failed: {str(e)}")
+        with _sync_lock:
+            _failed_at[profile_index] = time.monotonic()
+    finally:
+        with _sync_lock:
+            _building.pop(profile_index, None)
+
+
+def ensure_customer_profiles(
+    es: Elasticsearch,
+    source_index: str = SHOPPING_INDEX,
+    profile_index: str = PROFILE_INDEX
+) -> bool:
+    """
+    Refresh the profile index at most once per SHOPPING_PROFILE_SYNC_SECONDS.
+
+    The profile index is reported unusable while the first build runs in the
+    background and for SHOPPING_PROFILE_RETRY_SECONDS after a failed refresh.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Shopping transactions index
+        profile_index: Customer profile index
+
+    Returns:
+        True if the profile index is usable, False if lookups should fall back to the transactions
+    """
+    with _sync_lock:
+        now = time.monotonic()
+        if profile_index in _building:
+            return False
+        failed = _failed_at.get(profile_index)
+        if failed is not None and now - failed < RETRY_SECONDS:
+            return False
+        last = _last_sync.get(profile_index)
+        if last is not None and now - last < SYNC_INTERVAL_SECONDS:
+            return True
+        try:
+            if last is None and not _profiles_ready(es, profile_index):
+                _building[profile_index] = threading.Thread(
+                    target=_initial_build,
+                    args=(es, source_index, profile_index),
+                    name=f"profiles-{profile_index}",
+                    daemon=True
+                )
+                _building[profile_index].start()
+                return False
+            result = refresh_customer_profiles(es, source_index, profile_index)
+            _watermarks[profile_index] = result["watermark"]
+            _last_sync[profile_index] = now
+            _failed_at.pop(profile_index, None)
+            return True
+        except Exception as e:
+            _failed_at[profile_index] = now
+            logger.warning(
+                f"Customer profiles unavailable, aggregating {source_index} "
+                f"for {RETRY_SECONDS:.0f}s: {str(e)}"
+            )
+            return False
+
+
+def _recency_days(last_purchase: Optional[str], as_of: Optional[str]) -> Optional[int]:
+    if not last_purchase or not as_of:
+        return None
+    return (date.fromisoformat(as_of[:10]) - date.fromisoformat(last_purchase[:10])).days
+
+
+def lookup_customer_profile(
+    es: Elasticsearch,
+    customer_id: str,
+    source_index: str = SHOPPING_INDEX,
+    profile_index: str = PROFILE_INDEX
+) -> Optional[Dict[str, Any]]:
+    """
+    Look up a customer's profile: in-process LRU, then one get on the profile index.
+
+    Falls back to aggregating the customer's transactions when the profile index
+    cannot be maintained.
+
+    Args:
+        es: Elasticsearch client
+        customer_id: Customer ID
+        source_index: Shopping transactions index
+        profile_index: Customer profile index
+
+    Returns:
+        Profile with `recency_days` (days from last purchase to the newest transaction)
+        and `profile_source`, or None if the customer has no transactions
+    """
+    if ensure_customer_profiles(es, source_index, profile_index):
+        profile = _cache.get(customer_id)
+        source = "cache"
+        if profile is None:
+            response = es.options(ignore_status=404).get(index=profile_index, id=customer_id)
+            if not response.get('found'):
+                return None
+            profile = response['_source']
+            _cache.put(customer_id, profile)
+            source = "index"
+        as_of = _watermarks.get(profile_index)
+    else:
+        profile = compute_customer_profile(es, customer_id, source_index)
+        if profile is None:
+            return None
+        source = "transactions"
+        as_of = None
+
+    return {
+        **profile,
+        "recency_days": _recency_days(profile.get('last_purchase'), as_of),
+        "as_of": as_of,
+        "profile_source": source
+    }
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or update the customer profile index")
+    parser.add_argument("--index", default=SHOPPING_INDEX, help="Shopping transactions index")
+    parser.add_argument("--profile-index", default=PROFILE_INDEX, help="Customer profile index")
+    parser.add_argument("--full", action="store_true", help="Rebuild every profile")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    result = refresh_customer_profiles(es, args.index, args.profile_index, full=args.full)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Transaction Export
+Streams every shopping transaction matching a date range / category to a file.
+
+Results are walked with a point-in-time and search_after, optionally split into
+parallel slices of the same point-in-time. Slice workers hand pages to the
+writer through a bounded queue, so memory stays at a few pages regardless of the
+export size. Output is NDJSON (one transaction per line), or Parquet when the
+path ends in .parquet (requires pyarrow). Row order is index order, not date
+order.
+
+The agent tool only writes below SHOPPING_EXPORT_DIR: resolve_export_path()
+rejects absolute paths and `..` escapes, and the tool returns the file's path
+relative to that directory for download. The command line writes wherever the
+operator points it.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.export transactions-2022.parquet --start 2022-01-01 --end 2022-12-31 --slices 4
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+from typing import Dict, List, Any, Iterator, Optional
+
+from elasticsearch import Elasticsearch
+
+from .migrations import SHOPPING_INDEX
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = [
+    "invoice_no", "customer_id", "gender", "age", "category", "quantity", "price",
+    "total_amount", "payment_method", "invoice_date", "shopping_mall"
+]
+INTEGER_FIELDS = {"age", "quantity"}
+FLOAT_FIELDS = {"price", "total_amount"}
+PARQUET_ROW_GROUP = 50000
+EXPORT_DIR = os.getenv("SHOPPING_EXPORT_DIR", "exports")
+
+
+def resolve_export_path(file_name: str, export_dir: str = EXPORT_DIR) -> str:
+    """
+    Absolute path for an export file inside the export directory.
+
+    Args:
+        file_name: File name, or relative path below the export directory
+        export_dir: Directory exports are written to (created if missing)
+
+    Returns:
+        Absolute destination path
+
+    Raises:
+        ValueError: If the name is empty, absolute, or escapes the export directory
+    """
+    if not file_name or os.path.isabs(file_name) or ".." in file_name.replace("\\", "/").split("/"):
+        raise ValueError("file_name must be a relative path without '..' components")
+
+    root = os.path.realpath(export_dir)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError("file_name must stay inside the export directory")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def export_query(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None
+) -> Dict[str, Any]:
+    """Query for the exported transactions (dates as YYYY-MM-DD or DD/MM/YYYY, both inclusive)."""
+    filters = []
+    if start_date or end_date:
+        date_range = {"format": "yyyy-MM-dd||dd/MM/yyyy"}
+        if start_date:
+            date_range["gte"] = start_date
+        if end_date:
+            date_range["lte"] = end_date
+        filters.append({"range": {"invoice_date": date_range}})
+    if category:
+        filters.append({"term": {"category": category}})
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+
+def _export_row(source: Dict[str, Any], fields: List[str] = EXPORT_FIELDS) -> Dict[str, Any]:
+    row = {}
+    for field in fields:
+        value = source.get(field)
+        if value is not None and field in INTEGER_FIELDS:
+            value = int(value)
+        elif value is not None and field in FLOAT_FIELDS:
+            value = float(value)
+        row[field] = value
+    if row.get("total_amount", 0) is None and row.get("price") is not None and row.get("quantity") is not None:
+        row["total_amount"] = round(row["price"] * row["quantity"], 2)
+    return row
+
+
+def _put(pages: "queue.Queue", item: Any, stop: threading.Event) -> None:
+    """Queue an item, giving up once the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
+def _scan_slice(
+    es: Elasticsearch,
+    pit_id: str,
+    query: Dict[str, Any],
+    slice_id: int,
+    slices: int,
+    page_size: int,
+    keep_alive: str,
+    fields: List[str],
+    pages: "queue.Queue",
+    stop: threading.Event
+) -> None:
+    """Walk one slice of the point-in-time and put its pages on the queue."""
+    try:
+        search_after = None
+        while not stop.is_set():
+            body = {
+                "size": page_size,
+                "query": query,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": [{"_shard_doc": "asc"}],
+                "_source": fields,
+                "track_total_hits": False
+            }
+            if slices > 1:
+                body["slice"] = {"id": slice_id, "max": slices}
+            if search_after is not None:
+                body["search_after"] = search_after
+
+            hits = es.search(body=body)['hits']['hits']
+            if not hits:
+                break
+            _put(pages, [_export_row(hit['_source'], fields) for hit in hits], stop)
+            search_after = hits[-1]['sort']
+    except Exception as e:
+        _put(pages, e, stop)
+        return
+    _put(pages, None, stop)
+
+
+def iter_transaction_pages(
+    es: Elasticsearch,
+    query: Dict[str, Any],
+    index: str = SHOPPING_INDEX,
+    slices: int = 1,
+    page_size: int = 1000,
+    keep_alive: str = "5m",
+    fields: List[str] = EXPORT_FIELDS,
+    pit_id: Optional[str] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield pages of export rows for every transaction matching the query.
+
+    Args:
+        es: Elasticsearch client
+        query: Query DSL (see export_query)
+        index: Shopping transactions index
+        slices: Number of parallel point-in-time slices
+        page_size: Hits per page and slice
+        keep_alive: Point-in-time keep-alive between pages
+        fields: Fields to fetch and return per row
+        pit_id: Point-in-time to read, left open for the caller to close
+            (default: open one on index and close it when done)
+
+    Yields:
+        Lists of flat transaction rows
+    """
+    owns_pit = pit_id is None
+    if owns_pit:
+        pit_id = es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+    pages: "queue.Queue" = queue.Queue(maxsize=2 * slices)
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=_scan_slice,
+            args=(es, pit_id, query, slice_id, slices, page_size, keep_alive, fields, pages, stop),
+            name=f"export-slice-{slice_id}",
+            daemon=True
+        )
+        for slice_id in range(slices)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        running = slices
+        while running:
+            page = pages.get()
+            if page is None:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+        if owns_pit:
+            try:
+                es.close_point_in_time(id=pit_id)
+            except Exception as e:
+                logger.warning(f"Failed to close point-in-time: {str(e)}")
+
+
+def _write_ndjson(pages: Iterator[List[Dict[str, Any]]], output_path: str) -> int:
+    rows = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for page in pages:
+            f.writelines(json.dumps(row) + "\n" for row in page)
+            rows += len(page)
+    return rows
+
+
+def _write_parquet(pages: Iterator[List[Dict[str, Any]]], output_path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (field, pa.int64() if field in INTEGER_FIELDS else pa.float64() if field in FLOAT_FIELDS else pa.string())
+        for field in EXPORT_FIELDS
+    ])
+    rows = 0
+    buffered: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for page in pages:
+            buffered.extend(page)
+            if len(buffered) >= PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(buffered, schema=schema))
+                rows += len(buffered)
+                buffered = []
+        if buffered or not rows:
+            writer.write_table(pa.Table.from_pylist(buffered, schema=schema))
+            rows += len(buffered)
+    return rows
+
+
+def write_transaction_export(
+    es: Elasticsearch,
+    output_path: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None,
+    index: str = SHOPPING_INDEX,
+    slices: int = 1,
+    page_size: int = 1000
+) -> Dict[str, Any]:
+    """
+    Stream matching transactions to NDJSON, or Parquet when the path ends in .parquet.
+
+    Args:
+        es: Elasticsearch client
+        output_path: Destination file
+        start_date: First invoice date to include (default: no lower bound)
+        end_date: Last invoice date to include (default: no upper bound)
+        category: Exact category to export (default: all)
+        index: Shopping transactions index
+        slices: Number of parallel point-in-time slices
+        page_size: Hits per page and slice
+
+    Returns:
+        Dictionary with the written path, format, row count and elapsed time
+    """
+    started = time.perf_counter()
+    slices = max(int(slices), 1)
+    pages = iter_transaction_pages(
+        es, export_query(start_date, end_date, category), index=index, slices=slices, page_size=page_size
+    )
+    if output_path.endswith(".parquet"):
+        file_format, rows = "parquet", _write_parquet(pages, output_path)
+    else:
+        file_format, rows = "ndjson", _write_ndjson(pages, output_path)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Exported {rows} transactions to {output_path} in {elapsed:.1f}s ({slices} slices)")
+    return {
+        "output_path": output_path,
+        "format": file_format,
+        "rows_exported": rows,
+        "slices": slices,
+        "elapsed_seconds": round(elapsed, 1),
+        "filters_applied": {
+            "start_date": start_date,
+            "end_date": end_date,
+            "category": category
+        }
+    }
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export shopping transactions to NDJSON or Parquet")
+    parser.add_argument("output_path", help="Destination file (.ndjson or .parquet)")
+    parser.add_argument("--start", help="First invoice date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last invoice date (YYYY-MM-DD)")
+    parser.add_argument("--category", help="Exact category to export")
+    parser.add_argument("--index", default=SHOPPING_INDEX, help="Shopping transactions index")
+    parser.add_argument("--slices", type=int, default=1, help="Parallel point-in-time slices")
+    parser.add_argument("--page-size", type=int, default=1000, help="Hits per page and slice")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    result = write_transaction_export(
+        es, args.output_path, start_date=args.start, end_date=args.end, category=args.category,
+        index=args.index, slices=args.slices, page_size=args.page_size
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Shopping Index Migrations
+Maintenance jobs that prepare customer_shopping_data.csv for the shopping tools.
+
+total_amount
+    An ingest pipeline computes `total_amount = price * quantity` once per
+    document. It is installed as the index default pipeline so new transactions
+    get the field on write, and existing documents are backfilled with an
+    update-by-query through the same pipeline. The shopping tools then filter,
+    sort and sum on a plain numeric field instead of running Painless scripts
+    on every document of every query.
+
+invoice_date
+    The source CSV stores `invoice_date` as a DD/MM/YYYY string, which range
+    filters and sorts compare lexically. The date migration reindexes into a new
+    index whose `invoice_date` is a `date` field (normalized to yyyy-MM-dd by the
+    transactions pipeline) and, with --swap, atomically points the
+    SHOPPING_INDEX name at it as an alias and drops the old index.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.migrations total-amount
+    python -m shopping_agent.migrations invoice-date --swap
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+SHOPPING_INDEX = os.getenv("SHOPPING_INDEX", "customer_shopping_data.csv")
+TOTAL_AMOUNT_PIPELINE = "shopping-total-amount"
+TRANSACTIONS_PIPELINE = "shopping-transactions"
+INVOICE_DATE_FORMAT = "yyyy-MM-dd||dd/MM/yyyy||strict_date_optional_time"
+
+# ============================================================================
+# total_amount
+# ============================================================================
+
+TOTAL_AMOUNT_PROCESSORS = [
+    {
+        "script": {
+            "description": "Materialize total_amount = price * quantity",
+            "lang": "painless",
+            "source": """
+                if (ctx.price != null && ctx.quantity != null) {
+                    double price = Double.parseDouble(ctx.price.toString());
+                    double quantity = Double.parseDouble(ctx.quantity.toString());
+                    ctx.total_amount = Math.round(price * quantity * 100) / 100.0;
+                }
+            """
+        }
+    }
+]
+
+
+def ensure_total_amount_pipeline(es: Elasticsearch) -> None:
+    """Create or update the ingest pipeline that computes total_amount."""
+    es.ingest.put_pipeline(
+        id=TOTAL_AMOUNT_PIPELINE,
+        description="Computes the transaction total for customer shopping data",
+        processors=TOTAL_AMOUNT_PROCESSORS
+    )
+
+
+def apply_total_amount_mapping(es: Elasticsearch, index: str = SHOPPING_INDEX) -> None:
+    """Map total_amount as a number and make the pipeline the index default."""
+    es.indices.put_mapping(index=index, properties={"total_amount": {"type": "double"}})
+    es.indices.put_settings(index=index, settings={"index.default_pipeline": TOTAL_AMOUNT_PIPELINE})
+
+
+def backfill_total_amount(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    only_missing: bool = True,
+    poll_seconds: float = 5.0
+) -> Dict[str, Any]:
+    """
+    Run every existing document through the total_amount pipeline.
+
+    Runs as a sliced background update-by-query task and polls until it is done.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping index
+        only_missing: Only touch documents without total_amount (makes reruns cheap)
+        poll_seconds: Seconds between task status checks
+
+    Returns:
+        Dictionary with updated/failed counts and elapsed time
+    """
+    query = {"bool": {"must_not": {"exists": {"field": "total_amount"}}}} if only_missing else {"match_all": {}}
+    started = time.perf_counter()
+    task = es.update_by_query(
+        index=index,
+        query=query,
+        pipeline=TOTAL_AMOUNT_PIPELINE,
+        conflicts="proceed",
+        slices="auto",
+        refresh=True,
+        wait_for_completion=False
+    )['task']
+
+    while True:
+        status = es.tasks.get(task_id=task)
+        if status.get('completed'):
+            break
+        progress = status['task']['status']
+        logger.info(f"total_amount backfill: {progress.get('updated', 0)}/{progress.get('total', 0)} documents")
+        time.sleep(poll_seconds)
+
+    response = status.get('response', {})
+    return {
+        "updated": response.get('updated', 0),
+        "failures": len(response.get('failures', [])),
+        "elapsed_seconds": round(time.perf_counter() - started, 1)
+    }
+
+
+def migrate_total_amount(es: Elasticsearch, index: str = SHOPPING_INDEX, full: bool = False) -> Dict[str, Any]:
+    """
+    Install the pipeline, map the field and backfill existing documents.
+
+    Safe to rerun: without `full`, only documents still missing total_amount are updated.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping index
+        full: Recompute total_amount for every document
+
+    Returns:
+        Dictionary summarizing the migration
+    """
+    try:
+        ensure_total_amount_pipeline(es)
+        apply_total_amount_mapping(es, index)
+        result = backfill_total_amount(es, index, only_missing=not full)
+        missing = es.count(index=index, query={"bool": {"must_not": {"exists": {"field": "total_amount"}}}})['count']
+        logger.info(f"total_amount migration finished for {index}: {result}")
+        return {
+            "index": index,
+            "pipeline": TOTAL_AMOUNT_PIPELINE,
+            **result,
+            "documents_without_total_amount": missing
+        }
+
+    except Exception as e:
+        logger.error(f"total_amount migration failed: {str(e)}")
+        return {
+            "error": "Migration failed",
+            "message": str(e),
+            "index": index
+        }
+
+
+# ============================================================================
+# invoice_date
+# ============================================================================
+
+INVOICE_DATE_PROCESSORS = [
+    {
+        "date": {
+            "description": "Normalize invoice_date to yyyy-MM-dd",
+            "field": "invoice_date",
+            "target_field": "invoice_date",
+            "formats": ["dd/MM/yyyy", "d/M/yyyy", "yyyy-MM-dd", "ISO8601"],
+            "output_format": "yyyy-MM-dd",
+            "if": "ctx.invoice_date != null"
+        }
+    }
+]
+
+
+def _iso_invoice_date(value: str) -> str:
+    if "/" in value:
+        return datetime.strptime(value.split()[0], "%d/%m/%Y").strftime("%Y-%m-%d")
+    return value[:10]
+
+
+def parse_invoice_dates(dates: List[str]) -> np.ndarray:
+    """
+    Parse invoice dates from _source into datetime64[D].
+
+    Migrated indices hold yyyy-MM-dd, which is parsed in one vectorized step.
+    Unmigrated DD/MM/YYYY values, zero-padded or not (5/8/2022), are parsed one
+    by one, the way the date processor above accepts them.
+    """
+    try:
+        return np.asarray([d[:10] for d in dates], dtype="datetime64[D]")
+    except ValueError:
+        return np.asarray([_iso_invoice_date(d) for d in dates], dtype="datetime64[D]")
+
+
+def ensure_transactions_pipeline(es: Elasticsearch) -> None:
+    """Create or update the pipeline used by date-typed shopping indices (total_amount + invoice_date)."""
+    es.ingest.put_pipeline(
+        id=TRANSACTIONS_PIPELINE,
+        description="Computes total_amount and normalizes invoice_date for customer shopping data",
+        processors=TOTAL_AMOUNT_PROCESSORS + INVOICE_DATE_PROCESSORS
+    )
+
+
+def _concrete_indices(es: Elasticsearch, name: str) -> List[str]:
+    """Indices behind a name (the index itself, or every index of an alias)."""
+    if es.indices.exists_alias(name=name):
+        return list(es.indices.get_alias(name=name).keys())
+    return [name]
+
+
+def migrate_invoice_date(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    target_index: Optional[str] = None,
+    swap: bool = False
+) -> Dict[str, Any]:
+    """
+    Reindex the shopping data into an index with a date-typed invoice_date.
+
+    Args:
+        es: Elasticsearch client
+        index: Current shopping index or alias
+        target_index: New index name (default: <index>-v<unix time>)
+        swap: Point `index` at the new index as an alias and delete the old index(es)
+
+    Returns:
+        Dictionary summarizing the reindex and alias swap
+    """
+    try:
+        sources = _concrete_indices(es, index)
+        target = target_index or f"{index.lower()}-v{int(time.time())}"
+
+        mapping = es.indices.get_mapping(index=sources[0])
+        properties = dict(next(iter(mapping.values()))['mappings'].get('properties', {}))
+        properties["invoice_date"] = {"type": "date", "format": INVOICE_DATE_FORMAT}
+        properties["total_amount"] = {"type": "double"}
+
+        ensure_transactions_pipeline(es)
+        es.indices.create(
+            index=target,
+            mappings={"properties": properties},
+            settings={"index.default_pipeline": TRANSACTIONS_PIPELINE}
+        )
+
+        started = time.perf_counter()
+        response = es.options(request_timeout=3600).reindex(
+            source={"index": sources},
+            dest={"index": target, "pipeline": TRANSACTIONS_PIPELINE},
+            slices="auto",
+            refresh=True,
+            wait_for_completion=True
+        )
+        source_count = es.count(index=sources)['count']
+        target_count = es.count(index=target)['count']
+
+        result = {
+            "source_indices": sources,
+            "target_index": target,
+            "reindexed": response.get('created', 0) + response.get('updated', 0),
+            "failures": len(response.get('failures', [])),
+            "source_count": source_count,
+            "target_count": target_count,
+            "elapsed_seconds": round(time.perf_counter() - started, 1),
+            "swapped": False
+        }
+
+        if not swap:
+            result["next_step"] = f"Set SHOPPING_INDEX={target} or rerun with --swap"
+            return result
+
+        if target_count != source_count or result["failures"]:
+            result["message"] = "Document counts differ or reindex failed; alias not swapped"
+            return result
+
+        if sources == [index]:
+            # `index` is a concrete index: replace it with an alias of the same name
+            actions = [{"add": {"index": target, "alias": index}}, {"remove_index": {"index": index}}]
+        else:
+            actions = [{"add": {"index": target, "alias": index}}] + \
+                [{"remove": {"index": source, "alias": index}} for source in sources]
+        es.indices.update_aliases(actions=actions)
+        if sources != [index]:
+            es.indices.delete(index=sources)
+
+        result["swapped"] = True
+        logger.info(f"{index} now points at {target}")
+        return result
+
+    except Exception as e:
+        logger.error(f"invoice_date migration failed: {str(e)}")
+        return {
+            "error": "Migration failed",
+            "message": str(e),
+            "index": index
+        }
+
+
+# ============================================================================
+# Migration status
+# ============================================================================
+
+NUMERIC_TYPES = {"double", "float", "half_float", "scaled_float", "long", "integer"}
+
+MIGRATION_COMMANDS = {
+    "total-amount": "python -m shopping_agent.migrations total-amount",
+    "invoice-date": "python -m shopping_agent.migrations invoice-date --swap"
+}
+
+
+def pending_migrations(es: Elasticsearch, index: str = SHOPPING_INDEX) -> List[str]:
+    """
+    Migrations the index mapping still lacks, by CLI command name.
+
+    The invoice-date reindex also computes and maps total_amount, so when it is
+    pending it is reported on its own.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping index or alias
+
+    Returns:
+        List of pending migration names (empty once the index is migrated)
+    """
+    mapping = es.indices.get_mapping(index=index)
+    properties = next(iter(mapping.values()))['mappings'].get('properties', {})
+    if properties.get('invoice_date', {}).get('type') != "date":
+        return ["invoice-date"]
+    if properties.get('total_amount', {}).get('type') not in NUMERIC_TYPES:
+        return ["total-amount"]
+    return []
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Shopping index maintenance jobs")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    total_amount = subcommands.add_parser("total-amount", help="Materialize total_amount = price * quantity")
+    total_amount.add_argument("--index", default=SHOPPING_INDEX, help="Shopping index")
+    total_amount.add_argument("--full", action="store_true", help="Recompute every document")
+
+    invoice_date = subcommands.add_parser("invoice-date", help="Reindex with a date-typed invoice_date")
+    invoice_date.add_argument("--index", default=SHOPPING_INDEX, help="Shopping index or alias")
+    invoice_date.add_argument("--target", help="New index name")
+    invoice_date.add_argument("--swap", action="store_true", help="Alias the index name to the new index and drop the old one")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    if args.command == "total-amount":
+        result = migrate_total_amount(es, index=args.index, full=args.full)
+    else:
+        result = migrate_invoice_date(es, index=args.index, target_index=args.target, swap=args.swap)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Shopping Revenue Cube
+Dense in-memory cube of the shopping transactions by mall × category × month × payment method.
+
+The cube is built by paging through one composite aggregation (terms on
+shopping_mall, category and payment_method, a monthly date_histogram on
+invoice_date) with revenue, transaction, quantity and age sums per cell, and is
+held as small dense numpy arrays. Any slice (one mall, one category, a month
+range, top-N segments) is then answered with array sums, without a cluster
+round trip.
+
+A cube is rebuilt only when the index fingerprint (document count and newest
+invoice_date) changes. The fingerprint is checked at most once every
+SHOPPING_CUBE_CHECK_SECONDS in a background thread, which also does the rebuild;
+callers keep getting the current cube until the new one is swapped in. Only the
+very first call for an index waits on the build. After a failed check or rebuild
+the current cube is served for SHOPPING_CUBE_RETRY_SECONDS before trying again.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .migrations import SHOPPING_INDEX
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = float(os.getenv("SHOPPING_CUBE_CHECK_SECONDS", "30"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_CUBE_RETRY_SECONDS", "300"))
+
+DIMENSIONS = ("mall", "category", "month", "payment_method")
+MEASURES = ("revenue", "transactions", "quantity", "age_sum")
+
+
+def data_fingerprint(es: Elasticsearch, index: str = SHOPPING_INDEX) -> Dict[str, Any]:
+    """
+    Cheap change detector for the shopping index: document count and newest invoice_date.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+
+    Returns:
+        Dictionary with doc_count and max_date
+    """
+    response = es.search(
+        index=index,
+        body={
+            "size": 0,
+            "track_total_hits": True,
+            "aggs": {"max_date": {"max": {"field": "invoice_date", "format": "yyyy-MM-dd"}}}
+        }
+    )
+    max_date = response['aggregations']['max_date']
+    return {
+        "doc_count": response['hits']['total']['value'],
+        "max_date": max_date.get('value_as_string') or max_date.get('value')
+    }
+
+
+class RevenueCube:
+    """Dense measure arrays indexed [mall, category, month, payment_method]."""
+
+    def __init__(
+        self,
+        labels: Dict[str, List[str]],
+        measures: Dict[str, np.ndarray],
+        fingerprint: Optional[Dict[str, Any]] = None
+    ):
+        self.labels = labels
+        self.measures = measures
+        self.fingerprint = fingerprint
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.checked_at = time.monotonic()
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.measures["revenue"].shape
+
+    def slice(
+        self,
+        shopping_mall: Optional[str] = None,
+        category: Optional[str] = None,
+        start_month: Optional[str] = None,
+        end_month: Optional[str] = None
+    ) -> "RevenueCube":
+        """
+        Sub-cube for one mall and/or category and an inclusive yyyy-MM month range.
+
+        Unknown mall or category names give an empty sub-cube.
+        """
+        selectors = []
+        for dimension, value in (("mall", shopping_mall), ("category", category)):
+            labels = np.asarray(self.labels[dimension], dtype=object)
+            selectors.append(np.flatnonzero(labels == value) if value is not None else np.arange(len(labels)))
+
+        months = np.asarray(self.labels["month"], dtype=object)
+        in_range = np.ones(len(months), dtype=bool)
+        if start_month:
+            in_range &= months >= start_month[:7]
+        if end_month:
+            in_range &= months <= end_month[:7]
+        selectors.append(np.flatnonzero(in_range))
+        selectors.append(np.arange(len(self.labels["payment_method"])))
+
+        grid = np.ix_(*selectors)
+        return RevenueCube(
+            labels={
+                dimension: [self.labels[dimension][i] for i in selector]
+                for dimension, selector in zip(DIMENSIONS, selectors)
+            },
+            measures={name: values[grid] for name, values in self.measures.items()},
+            fingerprint=self.fingerprint
+        )
+
+    def rollup(self, *dimensions: str) -> Dict[str, np.ndarray]:
+        """Sum every measure over all dimensions except the given ones (kept in DIMENSIONS order)."""
+        drop = tuple(axis for axis, dimension in enumerate(DIMENSIONS) if dimension not in dimensions)
+        return {name: values.sum(axis=drop) for name, values in self.measures.items()}
+
+
+def build_revenue_cube(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    page_size: int = 1000
+) -> RevenueCube:
+    """
+    Page through a composite aggregation and assemble the dense revenue cube.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index (date-typed invoice_date, see migrations.py)
+        fingerprint: Fingerprint to store with the cube
+        page_size: Composite aggregation page size
+
+    Returns:
+        RevenueCube
+    """
+    started = time.perf_counter()
+    keys: Dict[str, List[str]] = {dimension: [] for dimension in DIMENSIONS}
+    values: Dict[str, List[float]] = {measure: [] for measure in MEASURES}
+
+    after_key = None
+    while True:
+        composite = {
+            "size": page_size,
+            "sources": [
+                {"mall": {"terms": {"field": "shopping_mall"}}},
+                {"category": {"terms": {"field": "category"}}},
+                {"month": {"date_histogram": {"field": "invoice_date", "calendar_interval": "month", "format": "yyyy-MM"}}},
+                {"payment_method": {"terms": {"field": "payment_method"}}}
+            ]
+        }
+        if after_key:
+            composite["after"] = after_key
+
+        response = es.search(
+            index=index,
+            body={
+                "size": 0,
+                "aggs": {
+                    "cells": {
+                        "composite": composite,
+                        "aggs": {
+                            "revenue": {"sum": {"field": "total_amount"}},
+                            "quantity": {"sum": {"field": "quantity"}},
+                            "age_sum": {"sum": {"field": "age"}}
+                        }
+                    }
+                }
+            }
+        )
+        cells = response['aggregations']['cells']
+        for bucket in cells['buckets']:
+            for dimension in DIMENSIONS:
+                keys[dimension].append(str(bucket['key'][dimension]))
+            values["revenue"].append(bucket['revenue']['value'])
+            values["transactions"].append(bucket['doc_count'])
+            values["quantity"].append(bucket['quantity']['value'])
+            values["age_sum"].append(bucket['age_sum']['value'])
+
+        after_key = cells.get('after_key')
+        if not after_key or not cells['buckets']:
+            break
+
+    labels, coordinates = {}, []
+    for dimension in DIMENSIONS:
+        unique, inverse = np.unique(np.asarray(keys[dimension], dtype=str), return_inverse=True)
+        labels[dimension] = unique.tolist()
+        coordinates.append(inverse.ravel())
+    shape = tuple(len(labels[dimension]) for dimension in DIMENSIONS)
+
+    measures = {}
+    for measure in MEASURES:
+        dense = np.zeros(shape, dtype=np.int64 if measure == "transactions" else np.float64)
+        np.add.at(dense, tuple(coordinates), np.asarray(values[measure], dtype=dense.dtype))
+        measures[measure] = dense
+
+    logger.info(
+        f"Built revenue cube {shape} from {len(values['revenue'])} cells "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return RevenueCube(labels, measures, fingerprint)
+
+
+# ============================================================================
+# Cube Registry
+# ============================================================================
+
+_cube_lock = threading.Lock()
+_cubes: Dict[str, RevenueCube] = {}
+_failed_at: Dict[str, float] = {}
+_rebuilding: Dict[str, threading.Thread] = {}
+
+
+def _revalidate(es: Elasticsearch, index: str, cube: RevenueCube) -> None:
+    try:
+        fingerprint = data_fingerprint(es, index)
+        if fingerprint != cube.fingerprint:
+            cube = build_revenue_cube(es, index, fingerprint)
+        with _cube_lock:
+            cube.checked_at = time.monotonic()
+            _cubes[index] = cube
+            _failed_at.pop(index, None)
+    except Exception as e:
+        logger.warning(f"Revenue cube rebuild failed for {index}, serving the current cube: {str(e)}")
+        with _cube_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _cube_lock:
+            _rebuilding.pop(index, None)
+
+
+def get_revenue_cube(es: Elasticsearch, index: str = SHOPPING_INDEX) -> RevenueCube:
+    """
+    Return the revenue cube for an index, rebuilding it only after the data changed.
+
+    The first call builds synchronously; later change checks and rebuilds run
+    in a background thread while the current cube keeps being returned.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+
+    Returns:
+        Current RevenueCube
+    """
+    with _cube_lock:
+        cube = _cubes.get(index)
+        if cube is None:
+            cube = build_revenue_cube(es, index, data_fingerprint(es, index))
+            _cubes[index] = cube
+            return cube
+
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _rebuilding
+            and now - cube.checked_at >= CHECK_SECONDS
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _rebuilding[index] = threading.Thread(
+                target=_revalidate,
+                args=(es, index, cube),
+                name=f"revenue-cube-{index}",
+                daemon=True
+            )
+            _rebuilding[index].start()
+        return cube
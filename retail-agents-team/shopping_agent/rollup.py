@@ -0,0 +1,453 @@
+"""
+Daily Sales Rollup
+Maintains a pre-aggregated daily summary of the shopping transactions.
+
+One rollup document per day × mall × category × payment method × gender holds the
+transaction count, quantity, revenue and the price / age sums behind the
+averages. The dimensions keep the transaction field names (invoice_date,
+shopping_mall, category, payment_method, gender), so filters written for the
+transactions run unchanged on SHOPPING_ROLLUP_INDEX.
+
+Updates are incremental: each refresh re-aggregates only the days at or after
+the stored `invoice_date` watermark (kept in the rollup index mapping `_meta`)
+and overwrites their documents, which have deterministic ids. Transactions
+indexed later with an older date are only picked up by a full rebuild
+(`--full`).
+
+The first build aggregates the whole history. Run it ahead of time from the
+command line; otherwise the first tool call starts it in a background thread and
+the tools aggregate the transactions until it completes. After a failed refresh
+the tools aggregate the transactions for SHOPPING_ROLLUP_RETRY_SECONDS before
+trying again.
+
+rollup_query / rollup_aggs translate a transaction query and aggregation tree to
+the rollup (or return None when it uses a field that is not rolled up), and
+rollup_response turns summed counts back into doc_count, so callers read the
+response exactly as if it came from the transactions.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.rollup [--full]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterator, Optional
+
+from elasticsearch import Elasticsearch, helpers
+
+from .migrations import SHOPPING_INDEX
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INDEX = os.getenv("SHOPPING_ROLLUP_INDEX", "customer_shopping_daily_rollup")
+SYNC_INTERVAL_SECONDS = float(os.getenv("SHOPPING_ROLLUP_SYNC_SECONDS", "60"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_ROLLUP_RETRY_SECONDS", "300"))
+
+DIMENSIONS = ("invoice_date", "shopping_mall", "category", "payment_method", "gender")
+
+ROLLUP_MAPPINGS = {
+    "properties": {
+        "invoice_date": {"type": "date", "format": "yyyy-MM-dd"},
+        "shopping_mall": {"type": "keyword"},
+        "category": {"type": "keyword"},
+        "payment_method": {"type": "keyword"},
+        "gender": {"type": "keyword"},
+        "transactions": {"type": "long"},
+        "quantity": {"type": "long"},
+        "revenue": {"type": "double"},
+        "price_sum": {"type": "double"},
+        "age_sum": {"type": "long"},
+        "age_min": {"type": "integer"},
+        "age_max": {"type": "integer"},
+        "amount_avg": {"type": "double"},
+        "price_avg": {"type": "double"},
+        "age_avg": {"type": "double"},
+        "updated_at": {"type": "date"}
+    }
+}
+
+# Transaction field -> rollup field for each metric aggregation the rollup can answer
+# (averages are weighted_avg of the per-document average, weighted by transactions)
+SUM_FIELDS = {"total_amount": "revenue", "quantity": "quantity", "price": "price_sum", "age": "age_sum"}
+AVG_FIELDS = {"total_amount": "amount_avg", "price": "price_avg", "age": "age_avg"}
+MIN_FIELDS = {"age": "age_min"}
+MAX_FIELDS = {"age": "age_max"}
+
+COUNT_AGG = "rollup_transactions"
+_COUNT = {"sum": {"field": "transactions"}}
+
+
+# ============================================================================
+# Build
+# ============================================================================
+
+def _rollup_pages(
+    es: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    page_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield pages of day × mall × category × payment method × gender composite buckets."""
+    after_key = None
+    while True:
+        composite = {
+            "size": page_size,
+            "sources": [
+                {"invoice_date": {"date_histogram": {"field": "invoice_date", "calendar_interval": "day", "format": "yyyy-MM-dd"}}},
+                {"shopping_mall": {"terms": {"field": "shopping_mall"}}},
+                {"category": {"terms": {"field": "category"}}},
+                {"payment_method": {"terms": {"field": "payment_method"}}},
+                {"gender": {"terms": {"field": "gender"}}}
+            ]
+        }
+        if after_key:
+            composite["after"] = after_key
+
+        response = es.search(
+            index=index,
+            body={
+                "size": 0,
+                "query": query,
+                "aggs": {
+                    "cells": {
+                        "composite": composite,
+                        "aggs": {
+                            "quantity": {"sum": {"field": "quantity"}},
+                            "revenue": {"sum": {"field": "total_amount"}},
+                            "price_sum": {"sum": {"field": "price"}},
+                            "age_sum": {"sum": {"field": "age"}},
+                            "age_min": {"min": {"field": "age"}},
+                            "age_max": {"max": {"field": "age"}}
+                        }
+                    }
+                }
+            }
+        )
+        page = response['aggregations']['cells']
+        if page['buckets']:
+            yield page['buckets']
+
+        after_key = page.get('after_key')
+        if not after_key or not page['buckets']:
+            break
+
+
+def _rollup_document(bucket: Dict[str, Any], updated_at: str) -> Dict[str, Any]:
+    transactions = bucket['doc_count']
+    revenue = bucket['revenue']['value']
+    price_sum = bucket['price_sum']['value']
+    age_sum = bucket['age_sum']['value']
+    return {
+        **{dimension: bucket['key'][dimension] for dimension in DIMENSIONS},
+        "transactions": transactions,
+        "quantity": int(bucket['quantity']['value']),
+        "revenue": round(revenue, 2),
+        "price_sum": round(price_sum, 2),
+        "age_sum": int(age_sum),
+        "age_min": int(bucket['age_min']['value']) if bucket['age_min']['value'] is not None else None,
+        "age_max": int(bucket['age_max']['value']) if bucket['age_max']['value'] is not None else None,
+        "amount_avg": revenue / transactions,
+        "price_avg": price_sum / transactions,
+        "age_avg": age_sum / transactions,
+        "updated_at": updated_at
+    }
+
+
+def _get_watermark(es: Elasticsearch, rollup_index: str) -> Optional[str]:
+    mapping = es.indices.get_mapping(index=rollup_index)
+    meta = next(iter(mapping.values()))['mappings'].get('_meta', {})
+    return meta.get('watermark')
+
+
+def refresh_daily_rollup(
+    es: Elasticsearch,
+    source_index: str = SHOPPING_INDEX,
+    rollup_index: str = ROLLUP_INDEX,
+    full: bool = False,
+    page_size: int = 1000
+) -> Dict[str, Any]:
+    """
+    Bring the daily rollup index up to date with the transactions.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Shopping transactions index
+        rollup_index: Daily rollup index to maintain
+        full: Ignore the watermark and re-aggregate every day
+        page_size: Composite aggregation page size
+
+    Returns:
+        Dictionary containing the number of written rollup documents and the new watermark
+    """
+    if not es.indices.exists(index=rollup_index):
+        es.indices.create(
+            index=rollup_index,
+            mappings={"_meta": {"source_index": source_index, "watermark": None}, **ROLLUP_MAPPINGS}
+        )
+        logger.info(f"Created daily rollup index {rollup_index}")
+        full = True
+
+    watermark = None if full else _get_watermark(es, rollup_index)
+    query = {"range": {"invoice_date": {"gte": watermark, "format": "yyyy-MM-dd"}}} if watermark else {"match_all": {}}
+
+    started = time.perf_counter()
+    updated_at = datetime.now(timezone.utc).isoformat()
+    written = 0
+    new_watermark = watermark
+    for buckets in _rollup_pages(es, source_index, query, page_size):
+        documents = [_rollup_document(bucket, updated_at) for bucket in buckets]
+        helpers.bulk(es, [
+            {
+                "_index": rollup_index,
+                "_id": "|".join(str(document[dimension]) for dimension in DIMENSIONS),
+                "_source": document
+            }
+            for document in documents
+        ])
+        written += len(documents)
+        new_watermark = max([new_watermark or ""] + [document["invoice_date"] for document in documents])
+
+    if written:
+        es.indices.put_mapping(index=rollup_index, meta={"source_index": source_index, "watermark": new_watermark})
+        es.indices.refresh(index=rollup_index)
+
+    logger.info(
+        f"Daily rollup refreshed: {written} documents, watermark {new_watermark}, "
+        f"{time.perf_counter() - started:.1f}s"
+    )
+    return {"written": written, "watermark": new_watermark, "full_rebuild": full}
+
+
+_sync_lock = threading.Lock()
+_last_sync: Dict[str, float] = {}
+_failed_at: Dict[str, float] = {}
+_building: Dict[str, threading.Thread] = {}
+
+
+def _rollup_ready(es: Elasticsearch, rollup_index: str) -> bool:
+    """True once a build has completed (the watermark is only written at the end)."""
+    return es.indices.exists(index=rollup_index) and _get_watermark(es, rollup_index) is not None
+
+
+def _initial_build(es: Elasticsearch, source_index: str, rollup_index: str) -> None:
+    try:
+        refresh_daily_rollup(es, source_index, rollup_index, full=True)
+        with _sync_lock:
+            _last_sync[rollup_index] = time.monotonic()
+            _failed_at.pop(rollup_index, None)
+    except Exception as e:
+        logger.warning(f"Initial daily rollup build failed: {str(e)}")
+        with _sync_lock:
+            _failed_at[rollup_index] = time.monotonic()
+    finally:
+        with _sync_lock:
+            _building.pop(rollup_index, None)
+
+
+def ensure_daily_rollup(
+    es: Elasticsearch,
+    source_index: str = SHOPPING_INDEX,
+    rollup_index: str = ROLLUP_INDEX
+) -> bool:
+    """
+    Refresh the rollup index at most once per SHOPPING_ROLLUP_SYNC_SECONDS.
+
+    The rollup is reported unusable while the first build runs in the background
+    and for SHOPPING_ROLLUP_RETRY_SECONDS after a failed refresh.
+
+    Args:
+        es: Elasticsearch client
+        source_index: Shopping transactions index
+        rollup_index: Daily rollup index
+
+    Returns:
+        True if the rollup is usable, False if queries should run on the transactions
+    """
+    with _sync_lock:
+        now = time.monotonic()
+        if rollup_index in _building:
+            return False
+        failed = _failed_at.get(rollup_index)
+        if failed is not None and now - failed < RETRY_SECONDS:
+            return False
+        last = _last_sync.get(rollup_index)
+        if last is not None and now - last < SYNC_INTERVAL_SECONDS:
+            return True
+        try:
+            if last is None and not _rollup_ready(es, rollup_index):
+                _building[rollup_index] = threading.Thread(
+                    target=_initial_build,
+                    args=(es, source_index, rollup_index),
+                    name=f"rollup-{rollup_index}",
+                    daemon=True
+                )
+                _building[rollup_index].start()
+                return False
+            refresh_daily_rollup(es, source_index, rollup_index)
+            _last_sync[rollup_index] = now
+            _failed_at.pop(rollup_index, None)
+            return True
+        except Exception as e:
+            _failed_at[rollup_index] = now
+            logger.warning(
+                f"Daily rollup unavailable, aggregating {source_index} "
+                f"for {RETRY_SECONDS:.0f}s: {str(e)}"
+            )
+            return False
+
+
+# ============================================================================
+# Query Translation
+# ============================================================================
+
+def _query_fields(query: Dict[str, Any]) -> Optional[List[str]]:
+    """Fields a query filters on, or None if it uses a query type we do not translate."""
+    fields: List[str] = []
+    for kind, body in query.items():
+        if kind == "match_all":
+            continue
+        if kind == "bool":
+            for occur in ("must", "filter", "should", "must_not"):
+                clauses = body.get(occur, [])
+                for clause in clauses if isinstance(clauses, list) else [clauses]:
+                    nested = _query_fields(clause)
+                    if nested is None:
+                        return None
+                    fields.extend(nested)
+        elif kind == "multi_match":
+            fields.extend(body.get("fields", []))
+        elif kind == "exists":
+            fields.append(body["field"])
+        elif kind in ("term", "terms", "range", "match", "prefix", "fuzzy", "wildcard"):
+            fields.extend(field for field in body if field != "boost")
+        else:
+            return None
+    return fields
+
+
+def rollup_query(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The query for the rollup index (unchanged), or None if it filters on a field that is not rolled up."""
+    fields = _query_fields(query)
+    if fields is None or any(field not in DIMENSIONS for field in fields):
+        return None
+    return query
+
+
+def _terms_order(order: Any) -> Optional[Any]:
+    """Terms order on the rollup (count order -> COUNT_AGG), or None if it cannot be translated."""
+    if order is None:
+        return {COUNT_AGG: "desc"}
+    orders = order if isinstance(order, list) else [order]
+    translated = []
+    for item in orders:
+        if not isinstance(item, dict) or len(item) != 1:
+            return None
+        (key, direction), = item.items()
+        if key == "_count":
+            translated.append({COUNT_AGG: direction})
+        elif key == "_key":
+            translated.append({"_key": direction})
+        else:
+            return None
+    return translated if isinstance(order, list) else translated[0]
+
+
+def rollup_aggs(aggs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Translate a transaction aggregation tree to the rollup index.
+
+    Bucket aggregations on rolled-up dimensions get a transaction count sub-aggregation.
+    Terms without an explicit order are ordered by it, and an explicit `_count` order
+    is translated to it; sum / avg / min / max map to rollup measures.
+
+    Returns:
+        Rollup aggregation tree, or None if any aggregation cannot be answered from the rollup
+    """
+    translated = {}
+    for name, agg in aggs.items():
+        kind = next(key for key in agg if key != "aggs")
+        body = agg[kind]
+        field = body.get("field")
+
+        if kind in ("terms", "date_histogram"):
+            if field not in DIMENSIONS or (kind == "date_histogram" and field != "invoice_date"):
+                return None
+            sub_aggs = rollup_aggs(agg.get("aggs", {}))
+            if sub_aggs is None:
+                return None
+            bucket = dict(body)
+            if kind == "terms":
+                order = _terms_order(body.get("order"))
+                if order is None:
+                    return None
+                bucket["order"] = order
+            translated[name] = {kind: bucket, "aggs": {**sub_aggs, COUNT_AGG: _COUNT}}
+        elif kind == "sum" and field in SUM_FIELDS:
+            translated[name] = {"sum": {"field": SUM_FIELDS[field]}}
+        elif kind == "avg" and field in AVG_FIELDS:
+            translated[name] = {"weighted_avg": {"value": {"field": AVG_FIELDS[field]}, "weight": {"field": "transactions"}}}
+        elif kind == "min" and field in MIN_FIELDS:
+            translated[name] = {"min": {"field": MIN_FIELDS[field]}}
+        elif kind == "max" and field in MAX_FIELDS:
+            translated[name] = {"max": {"field": MAX_FIELDS[field]}}
+        else:
+            return None
+    translated[COUNT_AGG] = _COUNT
+    return translated
+
+
+def _restore_doc_counts(aggregations: Dict[str, Any]) -> None:
+    for value in aggregations.values():
+        if isinstance(value, dict) and isinstance(value.get('buckets'), list):
+            for bucket in value['buckets']:
+                if COUNT_AGG in bucket:
+                    bucket['doc_count'] = int(bucket.pop(COUNT_AGG)['value'] or 0)
+                _restore_doc_counts(bucket)
+
+
+def rollup_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read a rollup search response as a transaction search response.
+
+    Returns:
+        Dictionary with hits (total = transactions, no documents) and aggregations,
+        where every bucket doc_count is the number of transactions
+    """
+    aggregations = dict(response['aggregations'])
+    total = int(aggregations.pop(COUNT_AGG)['value'] or 0)
+    _restore_doc_counts(aggregations)
+    return {
+        "hits": {"total": {"value": total, "relation": "eq"}, "hits": []},
+        "aggregations": aggregations
+    }
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or update the daily sales rollup index")
+    parser.add_argument("--index", default=SHOPPING_INDEX, help="Shopping transactions index")
+    parser.add_argument("--rollup-index", default=ROLLUP_INDEX, help="Daily rollup index")
+    parser.add_argument("--full", action="store_true", help="Re-aggregate every day")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    result = refresh_daily_rollup(es, args.index, args.rollup_index, full=args.full)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+RFM Customer Segmentation
+Scores every customer on recency, frequency and monetary value and assigns a segment.
+
+The job streams all transactions once (customer_id, invoice_date, total_amount)
+with the point-in-time scanner of export.py into flat arrays, then computes per
+customer with NumPy:
+
+- recency_days: days from the customer's last purchase to the newest transaction
+- frequency: number of transactions
+- monetary: lifetime spend
+
+Each measure is scored 1-5 by its percentile rank among all customers (ties share
+the average rank, so a measure that is equal for everyone scores 3). Segments come
+from the recency score and the mean of the frequency and monetary scores, see
+SEGMENT_RULES.
+
+Results are held in memory per index and rebuilt only when the index fingerprint
+changes (checked at most every SHOPPING_RFM_CHECK_SECONDS). Checks and rebuilds
+run in a background thread while the current segmentation keeps being served;
+only the very first call for an index waits on the scan. After a failed rebuild
+the current segmentation is served for SHOPPING_RFM_RETRY_SECONDS before trying
+again. Each rebuild also writes one document per customer to SHOPPING_RFM_INDEX,
+off the request path, so segment labels are available to other consumers.
+
+Usage (from the retail-agents-team directory):
+    python -m shopping_agent.segmentation
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+from .migrations import SHOPPING_INDEX, parse_invoice_dates
+from .export import iter_transaction_pages
+from .revenue_cube import data_fingerprint
+
+logger = logging.getLogger(__name__)
+
+RFM_INDEX = os.getenv("SHOPPING_RFM_INDEX", "customer_shopping_rfm")
+CHECK_SECONDS = float(os.getenv("SHOPPING_RFM_CHECK_SECONDS", "300"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_RFM_RETRY_SECONDS", "300"))
+
+SCAN_FIELDS = ["customer_id", "invoice_date", "total_amount", "price", "quantity"]
+
+# (segment, description); evaluated in order, first match wins
+SEGMENT_RULES = [
+    ("champions", "Bought recently, buy often and spend the most"),
+    ("loyal_customers", "Regular, high-value customers"),
+    ("potential_loyalists", "Recent customers with average frequency and spend"),
+    ("new_customers", "Bought recently but rarely and for little"),
+    ("at_risk", "Valuable customers who have not purchased for a while"),
+    ("need_attention", "Average recency, frequency and spend"),
+    ("hibernating", "Low recency, frequency and spend"),
+    ("lost", "Lowest recency; likely churned")
+]
+SEGMENTS = [name for name, _ in SEGMENT_RULES]
+
+RFM_MAPPINGS = {
+    "properties": {
+        "customer_id": {"type": "keyword"},
+        "segment": {"type": "keyword"},
+        "rfm_score": {"type": "keyword"},
+        "recency_score": {"type": "byte"},
+        "frequency_score": {"type": "byte"},
+        "monetary_score": {"type": "byte"},
+        "recency_days": {"type": "integer"},
+        "frequency": {"type": "integer"},
+        "monetary": {"type": "double"},
+        "last_purchase": {"type": "date", "format": "yyyy-MM-dd"},
+        "as_of": {"type": "date", "format": "yyyy-MM-dd"},
+        "computed_at": {"type": "date"}
+    }
+}
+
+
+def quantile_scores(values: np.ndarray, bins: int = 5) -> np.ndarray:
+    """Score values 1..bins by average percentile rank (higher value, higher score)."""
+    if not len(values):
+        return np.empty(0, dtype=np.int8)
+    unique, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    # Average 1-based rank of each distinct value
+    upper = np.cumsum(counts)
+    mid_rank = upper - (counts - 1) / 2.0
+    percentile = mid_rank[inverse.ravel()] / len(values)
+    return np.clip(np.ceil(percentile * bins), 1, bins).astype(np.int8)
+
+
+def assign_segments(r: np.ndarray, f: np.ndarray, m: np.ndarray) -> np.ndarray:
+    """Segment codes (indices into SEGMENTS) from R, F and M scores."""
+    fm = (f.astype(np.float32) + m) / 2
+    conditions = [
+        (r >= 4) & (fm >= 4),
+        (r >= 3) & (fm >= 3),
+        (r >= 4) & (fm >= 2),
+        (r >= 4),
+        (r <= 2) & (fm >= 3),
+        (r == 3),
+        (r == 2),
+        (r <= 1)
+    ]
+    return np.select(conditions, np.arange(len(SEGMENTS)), default=len(SEGMENTS) - 1).astype(np.int8)
+
+
+class RFMSegmentation:
+    """Per-customer RFM measures, scores and segments for one index."""
+
+    def __init__(
+        self,
+        customer_ids: np.ndarray,
+        last_purchase: np.ndarray,
+        frequency: np.ndarray,
+        monetary: np.ndarray,
+        fingerprint: Optional[Dict[str, Any]] = None
+    ):
+        self.customer_ids = customer_ids
+        self.last_purchase = last_purchase
+        self.frequency = frequency
+        self.monetary = monetary
+        self.fingerprint = fingerprint
+        self.as_of = last_purchase.max() if len(last_purchase) else None
+        self.recency_days = (self.as_of - last_purchase).astype(np.int64) if len(last_purchase) else np.empty(0, np.int64)
+
+        self.r_score = quantile_scores(-self.recency_days)
+        self.f_score = quantile_scores(frequency)
+        self.m_score = quantile_scores(monetary)
+        self.segment = assign_segments(self.r_score, self.f_score, self.m_score)
+
+        self._position = {customer_id: i for i, customer_id in enumerate(customer_ids.tolist())}
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.checked_at = time.monotonic()
+
+    @classmethod
+    def from_transactions(
+        cls,
+        customer_ids: List[str],
+        dates: List[str],
+        amounts: List[float],
+        fingerprint: Optional[Dict[str, Any]] = None
+    ) -> "RFMSegmentation":
+        """Aggregate flat transaction arrays into per-customer RFM measures."""
+        customers, inverse = np.unique(np.asarray(customer_ids, dtype=str), return_inverse=True)
+        inverse = inverse.ravel()
+        days = parse_invoice_dates(dates).astype(np.int64)
+
+        last_purchase = np.full(len(customers), np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(last_purchase, inverse, days)
+        frequency = np.bincount(inverse, minlength=len(customers)).astype(np.int64)
+        monetary = np.bincount(inverse, weights=np.asarray(amounts, dtype=np.float64), minlength=len(customers))
+        return cls(customers, last_purchase.astype("datetime64[D]"), frequency, monetary, fingerprint)
+
+    def customer_record(self, i: int) -> Dict[str, Any]:
+        return {
+            "customer_id": str(self.customer_ids[i]),
+            "segment": SEGMENTS[self.segment[i]],
+            "rfm_score": f"{self.r_score[i]}{self.f_score[i]}{self.m_score[i]}",
+            "recency_score": int(self.r_score[i]),
+            "frequency_score": int(self.f_score[i]),
+            "monetary_score": int(self.m_score[i]),
+            "recency_days": int(self.recency_days[i]),
+            "frequency": int(self.frequency[i]),
+            "monetary": round(float(self.monetary[i]), 2),
+            "last_purchase": str(self.last_purchase[i])
+        }
+
+    def lookup(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        i = self._position.get(customer_id)
+        return self.customer_record(i) if i is not None else None
+
+    def segment_summary(self) -> List[Dict[str, Any]]:
+        """Size, share and average measures of every segment."""
+        counts = np.bincount(self.segment, minlength=len(SEGMENTS))
+        revenue = np.bincount(self.segment, weights=self.monetary, minlength=len(SEGMENTS))
+        recency = np.bincount(self.segment, weights=self.recency_days, minlength=len(SEGMENTS))
+        frequency = np.bincount(self.segment, weights=self.frequency, minlength=len(SEGMENTS))
+        total_customers = max(len(self.segment), 1)
+        total_revenue = self.monetary.sum() or 1.0
+
+        summary = []
+        for code, (name, description) in enumerate(SEGMENT_RULES):
+            count = int(counts[code])
+            summary.append({
+                "segment": name,
+                "description": description,
+                "customers": count,
+                "customer_share": round(count / total_customers * 100, 2),
+                "revenue": round(float(revenue[code]), 2),
+                "revenue_share": round(float(revenue[code]) / total_revenue * 100, 2),
+                "avg_recency_days": round(float(recency[code]) / count, 1) if count else None,
+                "avg_frequency": round(float(frequency[code]) / count, 2) if count else None,
+                "avg_monetary": round(float(revenue[code]) / count, 2) if count else None
+            })
+        return summary
+
+    def members(self, segment: str, top_n: int = 20) -> List[Dict[str, Any]]:
+        """Highest-spending customers of a segment."""
+        rows = np.flatnonzero(self.segment == SEGMENTS.index(segment))
+        rows = rows[np.argsort(-self.monetary[rows], kind="stable")[:top_n]]
+        return [self.customer_record(i) for i in rows]
+
+
+def compute_rfm_segmentation(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    slices: int = 2
+) -> RFMSegmentation:
+    """
+    Stream every transaction once and compute the RFM segmentation.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+        fingerprint: Fingerprint to store with the result
+        slices: Parallel point-in-time slices for the scan
+
+    Returns:
+        RFMSegmentation
+    """
+    started = time.perf_counter()
+    customer_ids: List[str] = []
+    dates: List[str] = []
+    amounts: List[float] = []
+    for page in iter_transaction_pages(es, {"match_all": {}}, index=index, slices=slices, fields=SCAN_FIELDS):
+        for row in page:
+            if row["customer_id"] is None or row["invoice_date"] is None:
+                continue
+            customer_ids.append(row["customer_id"])
+            dates.append(row["invoice_date"])
+            amounts.append(row["total_amount"] or 0.0)
+
+    segmentation = RFMSegmentation.from_transactions(customer_ids, dates, amounts, fingerprint)
+    logger.info(
+        f"RFM segmentation of {len(segmentation.customer_ids)} customers from {len(amounts)} transactions "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return segmentation
+
+
+def store_rfm_segments(
+    es: Elasticsearch,
+    segmentation: RFMSegmentation,
+    rfm_index: str = RFM_INDEX
+) -> int:
+    """
+    Write one segment document per customer (id = customer_id).
+
+    Args:
+        es: Elasticsearch client
+        segmentation: Computed segmentation
+        rfm_index: Destination index
+
+    Returns:
+        Number of documents written
+    """
+    if not es.indices.exists(index=rfm_index):
+        es.indices.create(index=rfm_index, mappings=RFM_MAPPINGS)
+        logger.info(f"Created RFM segment index {rfm_index}")
+
+    as_of = str(segmentation.as_of)
+    actions = (
+        {
+            "_index": rfm_index,
+            "_id": str(segmentation.customer_ids[i]),
+            "_source": {**segmentation.customer_record(i), "as_of": as_of, "computed_at": segmentation.computed_at}
+        }
+        for i in range(len(segmentation.customer_ids))
+    )
+    written, _ = helpers.bulk(es, actions, chunk_size=2000)
+    es.indices.refresh(index=rfm_index)
+    return written
+
+
+# ============================================================================
+# Segmentation Registry
+# ============================================================================
+
+_segmentation_lock = threading.Lock()
+_segmentations: Dict[str, RFMSegmentation] = {}
+_failed_at: Dict[str, float] = {}
+_rebuilding: Dict[str, threading.Thread] = {}
+
+
+def _store(es: Elasticsearch, segmentation: RFMSegmentation, rfm_index: str) -> None:
+    try:
+        store_rfm_segments(es, segmentation, rfm_index)
+    except Exception as e:
+        logger.warning(f"Could not store RFM segments in {rfm_index}: {str(e)}")
+
+
+def _revalidate(es: Elasticsearch, index: str, rfm_index: str, segmentation: RFMSegmentation) -> None:
+    try:
+        fingerprint = data_fingerprint(es, index)
+        changed = fingerprint != segmentation.fingerprint
+        if changed:
+            segmentation = compute_rfm_segmentation(es, index, fingerprint)
+        with _segmentation_lock:
+            segmentation.checked_at = time.monotonic()
+            _segmentations[index] = segmentation
+            _failed_at.pop(index, None)
+        if changed:
+            _store(es, segmentation, rfm_index)
+    except Exception as e:
+        logger.warning(f"RFM segmentation rebuild failed for {index}, serving the current one: {str(e)}")
+        with _segmentation_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _segmentation_lock:
+            _rebuilding.pop(index, None)
+
+
+def get_rfm_segmentation(
+    es: Elasticsearch,
+    index: str = SHOPPING_INDEX,
+    rfm_index: str = RFM_INDEX
+) -> RFMSegmentation:
+    """
+    Return the RFM segmentation for an index, recomputing (and storing) it only after the data changed.
+
+    The first call computes synchronously; later change checks and rebuilds run
+    in a background thread while the current segmentation keeps being returned.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+        rfm_index: Index the segment labels are written to
+
+    Returns:
+        Current RFMSegmentation
+    """
+    with _segmentation_lock:
+        segmentation = _segmentations.get(index)
+        if segmentation is None:
+            segmentation = compute_rfm_segmentation(es, index, data_fingerprint(es, index))
+            _segmentations[index] = segmentation
+            threading.Thread(
+                target=_store,
+                args=(es, segmentation, rfm_index),
+                name=f"rfm-store-{rfm_index}",
+                daemon=True
+            ).start()
+            return segmentation
+
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _rebuilding
+            and now - segmentation.checked_at >= CHECK_SECONDS
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _rebuilding[index] = threading.Thread(
+                target=_revalidate,
+                args=(es, index, rfm_index, segmentation),
+                name=f"rfm-{index}",
+                daemon=True
+            )
+            _rebuilding[index].start()
+        return segmentation
+
+
+def _client() -> Optional[Elasticsearch]:
+    from .tools import get_elasticsearch_client
+    return get_elasticsearch_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compute and store RFM customer segments")
+    parser.add_argument("--index", default=SHOPPING_INDEX, help="Shopping transactions index")
+    parser.add_argument("--rfm-index", default=RFM_INDEX, help="Segment index to write")
+    parser.add_argument("--slices", type=int, default=2, help="Parallel point-in-time slices")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    es = _client()
+    if not es:
+        print(json.dumps({"error": "Elasticsearch client not configured"}))
+        return
+
+    segmentation = compute_rfm_segmentation(es, args.index, data_fingerprint(es, args.index), args.slices)
+    written = store_rfm_segments(es, segmentation, args.rfm_index)
+    print(json.dumps({
+        "rfm_index": args.rfm_index,
+        "customers": written,
+        "as_of": str(segmentation.as_of),
+        "segments": {row["segment"]: row["customers"] for row in segmentation.segment_summary()}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+"""
+Streaming Sales Sketches
+Mergeable per mall × category × day sketches of the shopping transactions.
+
+For every (mall, category, day) cell the store keeps
+
+- exact transaction count, revenue and min/max spend
+- a HyperLogLog of customer_id (2^HLL_PRECISION registers, kept sparse: only
+  the registers a cell actually touches) for distinct customers
+- a t-digest of transaction spend (centroids compressed with the k1 scale
+  function, compression TDIGEST_COMPRESSION) for spend quantiles
+- a top-k summary of spend per customer (at most TOP_K counters per cell, in the
+  style of Space-Saving) plus the largest spend it dropped, which bounds the error
+  of merged counts
+
+Each sketch type is one flat table of numpy columns tagged with the cell's
+mall, category and day codes. A range query filters the rows and merges the
+sketches in one vectorized pass: HyperLogLog registers by maximum, t-digest
+centroids by recompression, top-k counters by summing. Queries never touch the
+cluster.
+
+The store is maintained incrementally. The first build streams every transaction
+once. Later refreshes, triggered when the index fingerprint changes (checked at
+most every SHOPPING_SKETCH_CHECK_SECONDS), copy the cells before the newest
+ingested day into a new store and re-stream only that day and later. Each
+refresh reads one point-in-time: if the new store then holds a different number
+of transactions than that point-in-time's document count (transactions
+backfilled into older days, or deleted), everything is re-streamed from the same
+point-in-time instead. Refreshes always build a new store in a background thread
+and the registry swaps it in only once it is complete, so queries keep getting
+the previous store meanwhile and a failed scan keeps serving it for
+SHOPPING_SKETCH_RETRY_SECONDS before trying again. Until the first build
+completes get_sales_sketches returns None.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from .migrations import SHOPPING_INDEX, parse_invoice_dates
+from .export import iter_transaction_pages
+from .revenue_cube import data_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = float(os.getenv("SHOPPING_SKETCH_CHECK_SECONDS", "60"))
+RETRY_SECONDS = float(os.getenv("SHOPPING_SKETCH_RETRY_SECONDS", "300"))
+PIT_KEEP_ALIVE = "5m"
+HLL_PRECISION = 14
+TDIGEST_COMPRESSION = 100.0
+TOP_K = 50
+
+SCAN_FIELDS = ["customer_id", "shopping_mall", "category", "invoice_date", "total_amount", "price", "quantity"]
+GROUP_BY = ("mall", "category", "day", "month")
+
+_HLL_REGISTERS = 1 << HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_REGISTERS)
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+# ============================================================================
+# Sketch Primitives
+# ============================================================================
+
+def hash64(values: Sequence[str]) -> np.ndarray:
+    """Stable 64-bit hashes (blake2b) of string values."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(v.encode("utf-8"), digest_size=8).digest(), "little") for v in values),
+        dtype=np.uint64,
+        count=len(values)
+    )
+
+
+def hll_registers(hashes: np.ndarray) -> tuple:
+    """Register index and rank (leading zeros + 1 of the remaining bits) for each hash."""
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes << np.uint64(HLL_PRECISION)
+    high = (rest >> np.uint64(32)).astype(np.float64)
+    low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        leading = np.where(
+            high > 0,
+            31 - np.floor(np.log2(np.maximum(high, 1))),
+            np.where(low > 0, 63 - np.floor(np.log2(np.maximum(low, 1))), 64)
+        )
+    rank = np.minimum(leading, 64 - HLL_PRECISION) + 1
+    return index, rank.astype(np.uint8)
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Cardinality estimates for a [groups, registers] array (with small-range correction)."""
+    m = registers.shape[-1]
+    raw = _HLL_ALPHA * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def compress_centroids(groups: np.ndarray, means: np.ndarray, weights: np.ndarray) -> tuple:
+    """
+    Merge t-digest centroids within each group (k1 scale function).
+
+    Returns:
+        (groups, means, weights) of the compressed centroids, sorted by group then mean
+    """
+    if not len(means):
+        return groups, means, weights
+    order = np.lexsort((means, groups))
+    groups, means, weights = groups[order], means[order], weights[order]
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    run_lengths = np.diff(np.r_[starts, len(groups)])
+    cumulative = np.cumsum(weights)
+    before_group = np.repeat(cumulative[starts] - weights[starts], run_lengths)
+    group_total = np.repeat(np.add.reduceat(weights, starts), run_lengths)
+    q = (cumulative - before_group - weights / 2) / group_total
+    k = np.floor(TDIGEST_COMPRESSION / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))).astype(np.int64)
+
+    boundary = np.r_[True, (groups[1:] != groups[:-1]) | (k[1:] != k[:-1])]
+    centroid = np.cumsum(boundary) - 1
+    merged_weights = np.bincount(centroid, weights=weights)
+    merged_means = np.bincount(centroid, weights=means * weights) / merged_weights
+    return groups[boundary], merged_means, merged_weights
+
+
+def digest_quantiles(means: np.ndarray, weights: np.ndarray, quantiles: Sequence[float], low: float, high: float) -> List[float]:
+    """Quantiles of one compressed digest by interpolating between centroid centers."""
+    if not len(means):
+        return [None] * len(quantiles)
+    centers = np.cumsum(weights) - weights / 2
+    targets = np.asarray(quantiles) * weights.sum()
+    values = np.interp(targets, np.r_[0.0, centers, weights.sum()], np.r_[low, means, high])
+    return [round(float(v), 2) for v in values]
+
+
+def _group_starts(keys: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, np.int64)
+
+
+# ============================================================================
+# Sketch Store
+# ============================================================================
+
+TABLE_COLUMNS = {
+    "cells": ("transactions", "revenue", "min_spend", "max_spend", "top_floor"),
+    "hll": ("register", "rank"),
+    "digest": ("mean", "weight"),
+    "top": ("customer", "spend")
+}
+COLUMN_TYPES = {"mall": np.int64, "category": np.int64, "day": np.int64, "register": np.int64, "rank": np.uint8, "customer": np.int64}
+
+
+class SalesSketches:
+    """Per mall × category × day sketches of one shopping index."""
+
+    def __init__(self):
+        self.malls: List[str] = []
+        self.categories: List[str] = []
+        self.customers: List[str] = []
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._codes: Dict[str, Dict[str, int]] = {"mall": {}, "category": {}, "customer": {}}
+        self.tables: Dict[str, Dict[str, np.ndarray]] = {
+            name: {column: np.empty(0, dtype=COLUMN_TYPES.get(column, np.float64)) for column in ("mall", "category", "day") + columns}
+            for name, columns in TABLE_COLUMNS.items()
+        }
+        self.last_day: Optional[int] = None
+        self.skipped: Dict[int, int] = {}
+        self.undated = 0
+        self.fingerprint: Optional[Dict[str, Any]] = None
+        self.computed_at: Optional[str] = None
+        self.checked_at = 0.0
+
+    def _encode(self, kind: str, labels: List[str], values: List[str]) -> np.ndarray:
+        codes = self._codes[kind]
+        for value in values:
+            if value not in codes:
+                codes[value] = len(labels)
+                labels.append(value)
+        return np.fromiter((codes[value] for value in values), dtype=np.int64, count=len(values))
+
+    def _append(self, name: str, columns: Dict[str, np.ndarray]) -> None:
+        table = self.tables[name]
+        for column, values in columns.items():
+            table[column] = np.concatenate([table[column], np.asarray(values, dtype=table[column].dtype)])
+
+    @property
+    def documents(self) -> int:
+        """Transactions the store accounts for, including those without customer_id or invoice_date."""
+        return int(self.tables["cells"]["transactions"].sum()) + sum(self.skipped.values()) + self.undated
+
+    def copy_before(self, day: int) -> "SalesSketches":
+        """New store holding only the cells before `day`; this store is left unchanged."""
+        copy = SalesSketches()
+        copy.malls, copy.categories, copy.customers = list(self.malls), list(self.categories), list(self.customers)
+        copy._hashes = self._hashes
+        copy._codes = {kind: dict(codes) for kind, codes in self._codes.items()}
+        for name, table in self.tables.items():
+            keep = table["day"] < day
+            copy.tables[name] = {column: values[keep] for column, values in table.items()}
+        days = copy.tables["cells"]["day"]
+        copy.last_day = int(days.max()) if len(days) else None
+        copy.skipped = {d: n for d, n in self.skipped.items() if d < day}
+        copy.undated = self.undated
+        return copy
+
+    def ingest(self, customer_ids: List[str], malls: List[str], categories: List[str],
+               dates: List[str], spend: List[float]) -> None:
+        """Build the sketches of a batch of transactions and append them (cells must be new)."""
+        if not customer_ids:
+            return
+        customer = self._encode("customer", self.customers, customer_ids)
+        mall = self._encode("mall", self.malls, malls)
+        category = self._encode("category", self.categories, categories)
+        day = parse_invoice_dates(dates).astype(np.int64)
+        spend = np.asarray(spend, dtype=np.float64)
+
+        # One integer key per (mall, category, day) cell
+        cell_keys, cell = np.unique(
+            (mall * (len(self.categories) + 1) + category) * (1 << 20) + (day - day.min()),
+            return_inverse=True
+        )
+        cell = cell.ravel()
+        first = np.zeros(len(cell_keys), dtype=np.int64)
+        first[cell[::-1]] = np.arange(len(cell))[::-1]
+        cell_mall, cell_category, cell_day = mall[first], category[first], day[first]
+
+        # Top-k spend per customer: exact per cell, truncated to TOP_K counters
+        pair_keys, pair = np.unique(cell * len(self.customers) + customer, return_inverse=True)
+        pair_spend = np.bincount(pair.ravel(), weights=spend)
+        pair_cell, pair_customer = pair_keys // len(self.customers), pair_keys % len(self.customers)
+        order = np.lexsort((-pair_spend, pair_cell))
+        pair_cell, pair_customer, pair_spend = pair_cell[order], pair_customer[order], pair_spend[order]
+        starts = _group_starts(pair_cell)
+        position = np.arange(len(pair_cell)) - np.repeat(starts, np.diff(np.r_[starts, len(pair_cell)]))
+        kept = position < TOP_K
+        floor = np.zeros(len(cell_keys))
+        np.maximum.at(floor, pair_cell[~kept], pair_spend[~kept])
+
+        counts = np.bincount(cell, minlength=len(cell_keys))
+        low = np.full(len(cell_keys), np.inf)
+        high = np.full(len(cell_keys), -np.inf)
+        np.minimum.at(low, cell, spend)
+        np.maximum.at(high, cell, spend)
+        self._append("cells", {
+            "mall": cell_mall, "category": cell_category, "day": cell_day,
+            "transactions": counts.astype(np.float64),
+            "revenue": np.bincount(cell, weights=spend, minlength=len(cell_keys)),
+            "min_spend": low, "max_spend": high, "top_floor": floor
+        })
+        self._append("top", {
+            "mall": cell_mall[pair_cell[kept]], "category": cell_category[pair_cell[kept]],
+            "day": cell_day[pair_cell[kept]], "customer": pair_customer[kept], "spend": pair_spend[kept]
+        })
+
+        # Sparse HyperLogLog: highest rank per (cell, register)
+        register, rank = hll_registers(self._customer_hashes()[customer])
+        keys, inverse = np.unique(cell * _HLL_REGISTERS + register, return_inverse=True)
+        best = np.zeros(len(keys), dtype=np.uint8)
+        np.maximum.at(best, inverse.ravel(), rank)
+        register_cell = keys // _HLL_REGISTERS
+        self._append("hll", {
+            "mall": cell_mall[register_cell], "category": cell_category[register_cell],
+            "day": cell_day[register_cell], "register": keys % _HLL_REGISTERS, "rank": best
+        })
+
+        # t-digest per cell
+        digest_cell, means, weights = compress_centroids(cell, spend, np.ones(len(spend)))
+        self._append("digest", {
+            "mall": cell_mall[digest_cell], "category": cell_category[digest_cell],
+            "day": cell_day[digest_cell], "mean": means, "weight": weights
+        })
+
+        self.last_day = int(day.max()) if self.last_day is None else max(self.last_day, int(day.max()))
+
+    def _customer_hashes(self) -> np.ndarray:
+        if len(self._hashes) < len(self.customers):
+            self._hashes = np.concatenate([self._hashes, hash64(self.customers[len(self._hashes):])])
+        return self._hashes
+
+    def query(
+        self,
+        shopping_mall: Optional[str] = None,
+        category: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        group_by: Optional[str] = None,
+        quantiles: Sequence[float] = (0.5, 0.9, 0.95, 0.99),
+        top_n: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Merge the sketches of every cell in the range, optionally per mall, category, day or month.
+
+        Returns:
+            One dictionary per group with transactions, revenue, distinct customers,
+            spend quantiles and top customers
+        """
+        start = (np.datetime64(start_date[:10], "D") - _EPOCH).astype(np.int64) if start_date else None
+        end = (np.datetime64(end_date[:10], "D") - _EPOCH).astype(np.int64) if end_date else None
+        mall_code = self._codes["mall"].get(shopping_mall, -1) if shopping_mall else None
+        category_code = self._codes["category"].get(category, -1) if category else None
+
+        def select(name: str) -> Dict[str, np.ndarray]:
+            table = self.tables[name]
+            mask = np.ones(len(table["day"]), dtype=bool)
+            if mall_code is not None:
+                mask &= table["mall"] == mall_code
+            if category_code is not None:
+                mask &= table["category"] == category_code
+            if start is not None:
+                mask &= table["day"] >= start
+            if end is not None:
+                mask &= table["day"] <= end
+            rows = {column: values[mask] for column, values in table.items()}
+            rows["group"] = self._group_codes(rows, group_by)
+            return rows
+
+        cells = select("cells")
+        groups = np.unique(cells["group"])
+        slot = {g: i for i, g in enumerate(groups.tolist())}
+        if not len(groups):
+            return []
+
+        def positions(rows: Dict[str, np.ndarray]) -> np.ndarray:
+            return np.searchsorted(groups, rows["group"])
+
+        cell_slot = positions(cells)
+        transactions = np.bincount(cell_slot, weights=cells["transactions"], minlength=len(groups))
+        revenue = np.bincount(cell_slot, weights=cells["revenue"], minlength=len(groups))
+        low = np.full(len(groups), np.inf)
+        high = np.full(len(groups), -np.inf)
+        np.minimum.at(low, cell_slot, cells["min_spend"])
+        np.maximum.at(high, cell_slot, cells["max_spend"])
+        top_error = np.bincount(cell_slot, weights=cells["top_floor"], minlength=len(groups))
+
+        hll = select("hll")
+        registers = np.zeros((len(groups), _HLL_REGISTERS), dtype=np.uint8)
+        np.maximum.at(registers, (positions(hll), hll["register"]), hll["rank"])
+        distinct = hll_estimate(registers)
+
+        digest = select("digest")
+        digest_group, means, weights = compress_centroids(positions(digest), digest["mean"], digest["weight"])
+        digest_starts = _group_starts(digest_group)
+        digest_bounds = dict(zip(digest_group[digest_starts].tolist(), zip(digest_starts, np.r_[digest_starts[1:], len(digest_group)])))
+
+        top = select("top")
+        top_keys, top_inverse = np.unique(positions(top) * max(len(self.customers), 1) + top["customer"], return_inverse=True)
+        top_spend = np.bincount(top_inverse.ravel(), weights=top["spend"])
+        top_group = top_keys // max(len(self.customers), 1)
+        top_customer = top_keys % max(len(self.customers), 1)
+        order = np.lexsort((-top_spend, top_group))
+        top_group, top_customer, top_spend = top_group[order], top_customer[order], top_spend[order]
+        top_starts = _group_starts(top_group)
+        top_bounds = dict(zip(top_group[top_starts].tolist(), top_starts.tolist()))
+
+        results = []
+        for i, group in enumerate(groups.tolist()):
+            d_start, d_end = digest_bounds.get(i, (0, 0))
+            t_start = top_bounds.get(i, 0)
+            t_rows = range(t_start, t_start + top_n) if i in top_bounds else range(0)
+            results.append({
+                **self._group_label(group, group_by),
+                "transactions": int(transactions[i]),
+                "revenue": round(float(revenue[i]), 2),
+                "distinct_customers": int(round(float(distinct[i]))),
+                "spend_quantiles": dict(zip(
+                    [f"p{round(q * 100, 1):g}" for q in quantiles],
+                    digest_quantiles(means[d_start:d_end], weights[d_start:d_end], quantiles, low[i], high[i])
+                )),
+                "min_spend": round(float(low[i]), 2),
+                "max_spend": round(float(high[i]), 2),
+                "top_customers": [
+                    {"customer_id": self.customers[top_customer[j]], "spend": round(float(top_spend[j]), 2)}
+                    for j in t_rows if j < len(top_group) and top_group[j] == i
+                ],
+                "top_customers_max_error": round(float(top_error[i]), 2)
+            })
+        return results
+
+    def _group_codes(self, rows: Dict[str, np.ndarray], group_by: Optional[str]) -> np.ndarray:
+        if group_by == "mall":
+            return rows["mall"]
+        if group_by == "category":
+            return rows["category"]
+        if group_by == "day":
+            return rows["day"]
+        if group_by == "month":
+            return (rows["day"].astype("datetime64[D]").astype("datetime64[M]")).astype(np.int64)
+        return np.zeros(len(rows["day"]), dtype=np.int64)
+
+    def _group_label(self, group: int, group_by: Optional[str]) -> Dict[str, Any]:
+        if group_by == "mall":
+            return {"mall": self.malls[group]}
+        if group_by == "category":
+            return {"category": self.categories[group]}
+        if group_by == "day":
+            return {"day": str(np.datetime64(group, "D"))}
+        if group_by == "month":
+            return {"month": str(np.datetime64(group, "M"))}
+        return {}
+
+
+def _stream(
+    es: Elasticsearch,
+    sketches: SalesSketches,
+    index: str,
+    slices: int,
+    pit_id: str,
+    since: Optional[int] = None
+) -> None:
+    """Stream transactions of the point-in-time on or after day `since` (all if None) into the sketches."""
+    query = {"match_all": {}}
+    if since is not None:
+        query = {"range": {"invoice_date": {"gte": str(np.datetime64(since, "D")), "format": "yyyy-MM-dd"}}}
+
+    batch: Dict[str, List[Any]] = {field: [] for field in ("customer_id", "shopping_mall", "category", "invoice_date", "total_amount")}
+    skipped_dates: List[str] = []
+    pages = iter_transaction_pages(
+        es, query, index=index, slices=slices, keep_alive=PIT_KEEP_ALIVE, fields=SCAN_FIELDS, pit_id=pit_id
+    )
+    for page in pages:
+        for row in page:
+            if row["invoice_date"] is None:
+                sketches.undated += 1
+                continue
+            if row["customer_id"] is None:
+                skipped_dates.append(row["invoice_date"])
+                continue
+            for field in batch:
+                batch[field].append(row[field] if field != "total_amount" else row[field] or 0.0)
+
+    sketches.ingest(
+        [str(v) for v in batch["customer_id"]],
+        [str(v) for v in batch["shopping_mall"]],
+        [str(v) for v in batch["category"]],
+        batch["invoice_date"],
+        batch["total_amount"]
+    )
+    if skipped_dates:
+        days, counts = np.unique(parse_invoice_dates(skipped_dates).astype(np.int64), return_counts=True)
+        for day, count in zip(days.tolist(), counts.tolist()):
+            sketches.skipped[day] = sketches.skipped.get(day, 0) + count
+
+
+def _pit_documents(es: Elasticsearch, pit_id: str) -> int:
+    """Exact document count of a point-in-time."""
+    response = es.search(body={
+        "size": 0,
+        "track_total_hits": True,
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    })
+    return response['hits']['total']['value']
+
+
+def refresh_sketches(
+    es: Elasticsearch,
+    sketches: Optional[SalesSketches],
+    index: str = SHOPPING_INDEX,
+    slices: int = 2
+) -> SalesSketches:
+    """
+    Build the next version of a store without modifying the current one.
+
+    The cells before the newest ingested day are copied and only that day and
+    later are re-streamed. Counting and streaming read one point-in-time; if the
+    result does not account for every transaction in it, changes reached older
+    days and everything is re-streamed from the same point-in-time.
+
+    Args:
+        es: Elasticsearch client
+        sketches: Current store (None for a full build)
+        index: Shopping transactions index
+        slices: Parallel point-in-time slices for the scan
+
+    Returns:
+        New SalesSketches
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)['id']
+    try:
+        if sketches is not None and sketches.last_day is not None:
+            expected = _pit_documents(es, pit_id)
+            updated = sketches.copy_before(sketches.last_day)
+            _stream(es, updated, index, slices, pit_id, since=sketches.last_day)
+            if updated.documents == expected:
+                return updated
+            logger.warning(
+                f"Sketches account for {updated.documents} transactions but {index} has {expected}; "
+                f"re-streaming everything"
+            )
+
+        rebuilt = SalesSketches()
+        _stream(es, rebuilt, index, slices, pit_id)
+        return rebuilt
+    finally:
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"Failed to close point-in-time: {str(e)}")
+
+
+# ============================================================================
+# Sketch Registry
+# ============================================================================
+
+_sketch_lock = threading.Lock()
+_sketches: Dict[str, SalesSketches] = {}
+_failed_at: Dict[str, float] = {}
+_refreshing: Dict[str, threading.Thread] = {}
+
+
+def _refresh(es: Elasticsearch, index: str, sketches: Optional[SalesSketches]) -> None:
+    try:
+        fingerprint = data_fingerprint(es, index)
+        if sketches is None or fingerprint != sketches.fingerprint:
+            started = time.perf_counter()
+            sketches = refresh_sketches(es, sketches, index)
+            sketches.fingerprint = fingerprint
+            sketches.computed_at = datetime.now(timezone.utc).isoformat()
+            logger.info(f"Sketched {sketches.documents} transactions for {index} in {time.perf_counter() - started:.1f}s")
+        with _sketch_lock:
+            sketches.checked_at = time.monotonic()
+            _sketches[index] = sketches
+            _failed_at.pop(index, None)
+    except Exception as e:
+        logger.warning(f"Sales sketch refresh failed for {index}: {str(e)}")
+        with _sketch_lock:
+            _failed_at[index] = time.monotonic()
+    finally:
+        with _sketch_lock:
+            _refreshing.pop(index, None)
+
+
+def get_sales_sketches(es: Elasticsearch, index: str = SHOPPING_INDEX) -> Optional[SalesSketches]:
+    """
+    Return the sketches of an index, streaming in new days after the data changed.
+
+    Builds and refreshes run in a background thread; the current store keeps
+    being returned meanwhile.
+
+    Args:
+        es: Elasticsearch client
+        index: Shopping transactions index
+
+    Returns:
+        Current SalesSketches, or None until the first build has completed
+    """
+    with _sketch_lock:
+        sketches = _sketches.get(index)
+        now = time.monotonic()
+        failed = _failed_at.get(index)
+        if (
+            index not in _refreshing
+            and (sketches is None or now - sketches.checked_at >= CHECK_SECONDS)
+            and (failed is None or now - failed >= RETRY_SECONDS)
+        ):
+            _refreshing[index] = threading.Thread(
+                target=_refresh,
+                args=(es, index, sketches),
+                name=f"sketches-{index}",
+                daemon=True
+            )
+            _refreshing[index].start()
+        return sketches
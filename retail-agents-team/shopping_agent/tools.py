@@ -5,9 +5,19 @@ Elasticsearch-based tools for analyzing customer shopping data and purchase patt
 
 import os
 import logging
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
+import numpy as np
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
+from .migrations import SHOPPING_INDEX, MIGRATION_COMMANDS, pending_migrations
+from .customer_profiles import lookup_customer_profile
+from .revenue_cube import get_revenue_cube
+from .export import EXPORT_DIR, resolve_export_path, write_transaction_export
+from .segmentation import SEGMENTS, get_rfm_segmentation
+from .sketches import GROUP_BY, get_sales_sketches
+from .rollup import ROLLUP_INDEX, ensure_daily_rollup, rollup_query, rollup_aggs, rollup_response
+from .affinity import get_category_affinity
 
 # Load environment variables
 load_dotenv()
@@ -51,17 +61,126 @@ def get_elasticsearch_client() -> Optional[Elasticsearch]:
 # Shopping Data Analysis Tools
 # ============================================================================
 
+_migrated_indices = set()
+
+
+def _migration_error(es: Elasticsearch) -> Optional[Dict[str, Any]]:
+    """
+    Error response when SHOPPING_INDEX still lacks a migration the tools rely on.
+    
+    The tools sum, sort and filter on fields that only exist after the jobs in
+    migrations.py have run. A passing check is remembered for the process.
+    """
+    if SHOPPING_INDEX in _migrated_indices:
+        return None
+    
+    pending = pending_migrations(es, SHOPPING_INDEX)
+    if not pending:
+        _migrated_indices.add(SHOPPING_INDEX)
+        return None
+    
+    return {
+        "error": "Shopping index not migrated",
+        "message": f"{SHOPPING_INDEX} is missing required migrations; run: "
+                   + "; ".join(MIGRATION_COMMANDS[name] for name in pending),
+        "pending_migrations": pending
+    }
+
+
+def _transaction_total(source: Dict[str, Any]) -> float:
+    """Transaction total from the materialized total_amount field (price * quantity if missing)."""
+    if source.get('total_amount') is not None:
+        return float(source['total_amount'])
+    return float(source.get('price', 0)) * int(source.get('quantity', 1))
+
+
+def _sample_transactions(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact rows for the optional sample transactions of the analytics tools."""
+    return [
+        {
+            "invoice_no": hit['_source'].get('invoice_no'),
+            "customer_id": hit['_source'].get('customer_id'),
+            "gender": hit['_source'].get('gender'),
+            "age": hit['_source'].get('age'),
+            "category": hit['_source'].get('category'),
+            "quantity": hit['_source'].get('quantity'),
+            "price": hit['_source'].get('price'),
+            "total": round(_transaction_total(hit['_source']), 2),
+            "payment_method": hit['_source'].get('payment_method'),
+            "invoice_date": hit['_source'].get('invoice_date'),
+            "shopping_mall": hit['_source'].get('shopping_mall')
+        }
+        for hit in hits
+    ]
+
+
+def _search_analytics(
+    es: Elasticsearch,
+    query: Dict[str, Any],
+    aggs: Dict[str, Any],
+    rows: int = 0,
+    sort: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Query planner for the aggregation tools.
+    
+    When every filter and aggregation can be answered from the daily rollup (see
+    rollup.py) and the rollup is available, the aggregations run on the rollup
+    and the transactions are only searched for the requested rows, without
+    aggregations. Otherwise everything runs on the transactions as one search.
+    
+    Args:
+        es: Elasticsearch client
+        query: Query DSL on the transaction fields
+        aggs: Aggregations on the transaction fields
+        rows: Number of matching transactions to return (default: 0)
+        sort: Sort for the returned transactions (default: index order)
+    
+    Returns:
+        Dictionary with hits, aggregations and data_source ("daily_rollup" or "transactions")
+    """
+    rolled_query, rolled_aggs = rollup_query(query), rollup_aggs(aggs)
+    if rolled_query is not None and rolled_aggs is not None and ensure_daily_rollup(es, SHOPPING_INDEX):
+        response = rollup_response(es.search(
+            index=ROLLUP_INDEX,
+            body={"query": rolled_query, "size": 0, "aggs": rolled_aggs}
+        ))
+        if rows:
+            body = {"query": query, "size": rows, "track_total_hits": False}
+            if sort:
+                body["sort"] = sort
+            response['hits']['hits'] = es.search(index=SHOPPING_INDEX, body=body)['hits']['hits']
+        response['data_source'] = "daily_rollup"
+        return response
+    
+    body = {"query": query, "size": rows, "track_total_hits": True, "aggs": aggs}
+    if sort:
+        body["sort"] = sort
+    response = es.search(index=SHOPPING_INDEX, body=body)
+    return {
+        "hits": response['hits'],
+        "aggregations": response['aggregations'],
+        "data_source": "transactions"
+    }
+
+
 def search_shopping_data_by_category(
     category: str,
-    size: int = 20
+    size: int = 20,
+    include_samples: bool = False
 ) -> Dict[str, Any]:
     """
     Search customer shopping data by product category.
     Analyzes purchase patterns, spending, and customer preferences.
     
+    Analytics are aggregations over every matching transaction, answered from
+    the daily rollup when available. Transaction documents are only fetched
+    when include_samples is set.
+    
     Args:
         category: Product category to search (e.g., "Clothing", "Shoes", "Technology")
-        size: Number of results to return (default: 20)
+        size: Number of sample transactions when include_samples is set (default: 20)
+        include_samples: Also return up to `size` matching transactions (default: False)
     
     Returns:
         Dictionary containing shopping data and analytics
@@ -74,79 +193,53 @@ def search_shopping_data_by_category(
         }
     
     try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
         # Search using multi_match on category field
-        retriever_object = {
-            "standard": {
-                "query": {
-                    "multi_match": {
-                        "query": category,
-                        "fields": ["category"],
-                        "fuzziness": "AUTO"
-                    }
+        response = _search_analytics(
+            es,
+            query={
+                "multi_match": {
+                    "query": category,
+                    "fields": ["category"],
+                    "fuzziness": "AUTO"
                 }
+            },
+            rows=size if include_samples else 0,
+            aggs={
+                "total_spending": {"sum": {"field": "total_amount"}},
+                "avg_price": {"avg": {"field": "price"}},
+                "total_quantity": {"sum": {"field": "quantity"}},
+                "malls": {"terms": {"field": "shopping_mall", "size": 20}},
+                "payment_methods": {"terms": {"field": "payment_method", "size": 10}},
+                "genders": {"terms": {"field": "gender", "size": 10}}
             }
-        }
-        
-        response = es.search(
-            index="customer_shopping_data.csv",
-            retriever=retriever_object,
-            size=size
         )
         
         hits = response['hits']['hits']
         total = response['hits']['total']['value']
-        
-        # Calculate analytics
-        if hits:
-            total_spending = sum(float(hit['_source'].get('price', 0)) * int(hit['_source'].get('quantity', 1)) 
-                               for hit in hits)
-            avg_price = sum(float(hit['_source'].get('price', 0)) for hit in hits) / len(hits)
-            total_quantity = sum(int(hit['_source'].get('quantity', 1)) for hit in hits)
-            
-            # Get unique shopping malls
-            malls = list(set(hit['_source'].get('shopping_mall', 'Unknown') for hit in hits))
-            
-            # Get payment methods used
-            payment_methods = list(set(hit['_source'].get('payment_method', 'Unknown') for hit in hits))
-            
-            # Gender distribution
-            gender_dist = {}
-            for hit in hits:
-                gender = hit['_source'].get('gender', 'Unknown')
-                gender_dist[gender] = gender_dist.get(gender, 0) + 1
-        else:
-            total_spending = avg_price = total_quantity = 0
-            malls = payment_methods = []
-            gender_dist = {}
+        aggs = response['aggregations']
+        malls = [bucket['key'] for bucket in aggs['malls']['buckets']]
         
         return {
             "total_results": total,
             "results_shown": len(hits),
             "category": category,
             "analytics": {
-                "total_spending": round(total_spending, 2),
-                "average_price": round(avg_price, 2),
-                "total_quantity": total_quantity,
+                "total_spending": round(aggs['total_spending']['value'], 2),
+                "average_price": round(aggs['avg_price']['value'] or 0, 2),
+                "total_quantity": int(aggs['total_quantity']['value']),
                 "unique_malls": len(malls),
                 "malls": malls,
-                "payment_methods": payment_methods,
-                "gender_distribution": gender_dist
-            },
-            "transactions": [
-                {
-                    "invoice_no": hit['_source'].get('invoice_no'),
-                    "customer_id": hit['_source'].get('customer_id'),
-                    "gender": hit['_source'].get('gender'),
-                    "age": hit['_source'].get('age'),
-                    "category": hit['_source'].get('category'),
-                    "quantity": hit['_source'].get('quantity'),
-                    "price": hit['_source'].get('price'),
-                    "payment_method": hit['_source'].get('payment_method'),
-                    "invoice_date": hit['_source'].get('invoice_date'),
-                    "shopping_mall": hit['_source'].get('shopping_mall')
+                "payment_methods": [bucket['key'] for bucket in aggs['payment_methods']['buckets']],
+                "gender_distribution": {
+                    bucket['key']: bucket['doc_count'] for bucket in aggs['genders']['buckets']
                 }
-                for hit in hits
-            ]
+            },
+            "transactions": _sample_transactions(hits),
+            "data_source": response['data_source']
         }
         
     except Exception as e:
@@ -160,14 +253,20 @@ def search_shopping_data_by_category(
 
 def get_customer_purchase_history(
     customer_id: str,
-    size: int = 50
+    size: int = 50,
+    page: int = 1
 ) -> Dict[str, Any]:
     """
     Retrieve complete purchase history for a specific customer.
     
+    Lifetime analytics are aggregations over all of the customer's transactions,
+    so they are exact regardless of how many purchases exist; the raw purchase
+    list is paginated separately, newest first.
+    
     Args:
         customer_id: Customer ID to lookup
-        size: Maximum number of transactions to return (default: 50)
+        size: Number of transactions per history page (default: 50)
+        page: History page to return, starting at 1 (default: 1)
     
     Returns:
         Dictionary containing customer's purchase history and analytics
@@ -180,8 +279,13 @@ def get_customer_purchase_history(
         }
     
     try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        page = max(page, 1)
         response = es.search(
-            index="customer_shopping_data.csv",
+            index=SHOPPING_INDEX,
             body={
                 "query": {
                     "term": {
@@ -191,45 +295,52 @@ def get_customer_purchase_history(
                 "sort": [
                     {"invoice_date": {"order": "desc"}}
                 ],
-                "size": size
+                "from": (page - 1) * size,
+                "size": size,
+                "track_total_hits": True,
+                "aggs": {
+                    "total_spent": {"sum": {"field": "total_amount"}},
+                    "total_items": {"sum": {"field": "quantity"}},
+                    "first_purchase": {"min": {"field": "invoice_date", "format": "yyyy-MM-dd"}},
+                    "last_purchase": {"max": {"field": "invoice_date", "format": "yyyy-MM-dd"}},
+                    "categories": {
+                        "terms": {"field": "category", "size": 20},
+                        "aggs": {"spent": {"sum": {"field": "total_amount"}}}
+                    },
+                    "malls": {
+                        "terms": {"field": "shopping_mall", "size": 20},
+                        "aggs": {"spent": {"sum": {"field": "total_amount"}}}
+                    },
+                    "payment_methods": {
+                        "terms": {"field": "payment_method", "size": 10}
+                    },
+                    "latest": {
+                        "top_hits": {
+                            "size": 1,
+                            "sort": [{"invoice_date": {"order": "desc"}}],
+                            "_source": ["gender", "age"]
+                        }
+                    }
+                }
             }
         )
         
         hits = response['hits']['hits']
         total = response['hits']['total']['value']
         
-        if not hits:
+        if total == 0:
             return {
                 "customer_id": customer_id,
                 "total_purchases": 0,
                 "message": "No purchase history found for this customer"
             }
         
-        # Calculate customer analytics
-        total_spent = sum(float(hit['_source'].get('price', 0)) * int(hit['_source'].get('quantity', 1)) 
-                         for hit in hits)
-        total_items = sum(int(hit['_source'].get('quantity', 1)) for hit in hits)
-        
-        # Category preferences
-        categories = {}
-        for hit in hits:
-            cat = hit['_source'].get('category', 'Unknown')
-            categories[cat] = categories.get(cat, 0) + 1
-        
-        # Shopping mall preferences
-        malls = {}
-        for hit in hits:
-            mall = hit['_source'].get('shopping_mall', 'Unknown')
-            malls[mall] = malls.get(mall, 0) + 1
-        
-        # Payment method preferences
-        payment_methods = {}
-        for hit in hits:
-            pm = hit['_source'].get('payment_method', 'Unknown')
-            payment_methods[pm] = payment_methods.get(pm, 0) + 1
+        aggs = response['aggregations']
+        total_spent = aggs['total_spent']['value']
+        total_items = int(aggs['total_items']['value'])
         
         # Get customer demographics from most recent purchase
-        latest = hits[0]['_source']
+        latest = aggs['latest']['hits']['hits'][0]['_source']
         
         return {
             "customer_id": customer_id,
@@ -237,18 +348,38 @@ def get_customer_purchase_history(
             "purchases_shown": len(hits),
             "customer_profile": {
                 "gender": latest.get('gender'),
-                "age": latest.get('age')
+                "age": latest.get('age'),
+                "first_purchase": aggs['first_purchase'].get('value_as_string'),
+                "last_purchase": aggs['last_purchase'].get('value_as_string')
             },
             "spending_analytics": {
                 "total_spent": round(total_spent, 2),
-                "average_transaction": round(total_spent / len(hits), 2) if hits else 0,
+                "average_transaction": round(total_spent / total, 2),
                 "total_items_purchased": total_items,
-                "average_items_per_transaction": round(total_items / len(hits), 2) if hits else 0
+                "average_items_per_transaction": round(total_items / total, 2)
             },
             "preferences": {
-                "favorite_categories": sorted(categories.items(), key=lambda x: x[1], reverse=True),
-                "favorite_malls": sorted(malls.items(), key=lambda x: x[1], reverse=True),
-                "payment_methods": sorted(payment_methods.items(), key=lambda x: x[1], reverse=True)
+                "favorite_categories": [
+                    [bucket['key'], bucket['doc_count']] for bucket in aggs['categories']['buckets']
+                ],
+                "favorite_malls": [
+                    [bucket['key'], bucket['doc_count']] for bucket in aggs['malls']['buckets']
+                ],
+                "payment_methods": [
+                    [bucket['key'], bucket['doc_count']] for bucket in aggs['payment_methods']['buckets']
+                ],
+                "spending_by_category": {
+                    bucket['key']: round(bucket['spent']['value'], 2) for bucket in aggs['categories']['buckets']
+                },
+                "spending_by_mall": {
+                    bucket['key']: round(bucket['spent']['value'], 2) for bucket in aggs['malls']['buckets']
+                }
+            },
+            "pagination": {
+                "page": page,
+                "page_size": size,
+                "total_pages": (total + size - 1) // size if size else 0,
+                "has_more": page * size < total
             },
             "purchase_history": [
                 {
@@ -257,7 +388,7 @@ def get_customer_purchase_history(
                     "category": hit['_source'].get('category'),
                     "quantity": hit['_source'].get('quantity'),
                     "price": hit['_source'].get('price'),
-                    "total": round(float(hit['_source'].get('price', 0)) * int(hit['_source'].get('quantity', 1)), 2),
+                    "total": round(_transaction_total(hit['_source']), 2),
                     "payment_method": hit['_source'].get('payment_method'),
                     "shopping_mall": hit['_source'].get('shopping_mall')
                 }
@@ -274,16 +405,68 @@ def get_customer_purchase_history(
         }
 
 
+def get_customer_profile(customer_id: str) -> Dict[str, Any]:
+    """
+    Get a customer's precomputed 360° profile.
+    
+    Profiles are maintained incrementally in the customer profile index (see
+    customer_profiles.py), so this is a single document lookup rather than a scan
+    of the customer's transactions.
+    
+    Args:
+        customer_id: Customer ID to lookup
+    
+    Returns:
+        Dictionary containing lifetime spend, order count, category/mall/payment
+        distributions, first/last purchase and recency
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+    
+    try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        profile = lookup_customer_profile(es, customer_id, source_index=SHOPPING_INDEX)
+        
+        if profile is None:
+            return {
+                "customer_id": customer_id,
+                "order_count": 0,
+                "message": "No purchase history found for this customer"
+            }
+        
+        return profile
+        
+    except Exception as e:
+        logger.error(f"Error retrieving customer profile: {str(e)}")
+        return {
+            "error": "Profile lookup failed",
+            "message": str(e),
+            "customer_id": customer_id
+        }
+
+
 def analyze_shopping_trends_by_gender(
     gender: str,
-    size: int = 100
+    size: int = 100,
+    include_samples: bool = False
 ) -> Dict[str, Any]:
     """
     Analyze shopping trends and preferences by gender.
     
+    All figures are aggregations over every transaction of the gender (from the
+    daily rollup when available); by default no transaction documents are fetched.
+    
     Args:
         gender: Gender to analyze (e.g., "Male", "Female")
-        size: Sample size for analysis (default: 100)
+        size: Number of sample transactions when include_samples is set (default: 100)
+        include_samples: Also return up to `size` transactions (default: False)
     
     Returns:
         Dictionary containing gender-based shopping trends
@@ -296,51 +479,49 @@ def analyze_shopping_trends_by_gender(
         }
     
     try:
-        response = es.search(
-            index="customer_shopping_data.csv",
-            body={
-                "query": {
-                    "term": {
-                        "gender": gender
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        response = _search_analytics(
+            es,
+            query={
+                "term": {
+                    "gender": gender
+                }
+            },
+            rows=size if include_samples else 0,
+            aggs={
+                "categories": {
+                    "terms": {
+                        "field": "category",
+                        "size": 20
+                    },
+                    "aggs": {
+                        "avg_price": {"avg": {"field": "price"}},
+                        "total_quantity": {"sum": {"field": "quantity"}}
                     }
                 },
-                "size": size,
-                "aggs": {
-                    "categories": {
-                        "terms": {
-                            "field": "category",
-                            "size": 20
-                        },
-                        "aggs": {
-                            "avg_price": {"avg": {"field": "price"}},
-                            "total_quantity": {"sum": {"field": "quantity"}}
-                        }
-                    },
-                    "payment_methods": {
-                        "terms": {
-                            "field": "payment_method",
-                            "size": 10
-                        }
-                    },
-                    "shopping_malls": {
-                        "terms": {
-                            "field": "shopping_mall",
-                            "size": 10
-                        }
-                    },
-                    "avg_age": {
-                        "avg": {"field": "age"}
-                    },
-                    "avg_price": {
-                        "avg": {"field": "price"}
-                    },
-                    "total_spent": {
-                        "sum": {
-                            "script": {
-                                "source": "doc['price'].value * doc['quantity'].value"
-                            }
-                        }
+                "payment_methods": {
+                    "terms": {
+                        "field": "payment_method",
+                        "size": 10
                     }
+                },
+                "shopping_malls": {
+                    "terms": {
+                        "field": "shopping_mall",
+                        "size": 10
+                    }
+                },
+                "avg_age": {
+                    "avg": {"field": "age"}
+                },
+                "avg_price": {
+                    "avg": {"field": "price"}
+                },
+                "total_spent": {
+                    "sum": {"field": "total_amount"}
                 }
             }
         )
@@ -351,7 +532,9 @@ def analyze_shopping_trends_by_gender(
         return {
             "gender": gender,
             "total_transactions": total,
+            "data_source": response['data_source'],
             "sample_size": len(response['hits']['hits']),
+            "sample_transactions": _sample_transactions(response['hits']['hits']),
             "demographics": {
                 "average_age": round(aggs['avg_age']['value'], 1) if aggs['avg_age']['value'] else 0
             },
@@ -402,7 +585,7 @@ def get_high_value_transactions(
     
     Args:
         min_amount: Minimum transaction amount (default: 100.0)
-        size: Number of results to return (default: 20)
+        size: Number of results to return; 0 for analytics only (default: 20)
     
     Returns:
         Dictionary containing high-value transactions
@@ -415,31 +598,30 @@ def get_high_value_transactions(
         }
     
     try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
         response = es.search(
-            index="customer_shopping_data.csv",
+            index=SHOPPING_INDEX,
             body={
                 "query": {
-                    "script": {
-                        "script": {
-                            "source": "doc['price'].value * doc['quantity'].value >= params.min_amount",
-                            "params": {
-                                "min_amount": min_amount
-                            }
+                    "range": {
+                        "total_amount": {
+                            "gte": min_amount
                         }
                     }
                 },
                 "sort": [
-                    {
-                        "_script": {
-                            "type": "number",
-                            "script": {
-                                "source": "doc['price'].value * doc['quantity'].value"
-                            },
-                            "order": "desc"
-                        }
-                    }
+                    {"total_amount": {"order": "desc"}}
                 ],
-                "size": size
+                "size": size,
+                "track_total_hits": True,
+                "aggs": {
+                    "value": {
+                        "stats": {"field": "total_amount"}
+                    }
+                }
             }
         )
         
@@ -451,7 +633,7 @@ def get_high_value_transactions(
             source = hit['_source']
             price = float(source.get('price', 0))
             quantity = int(source.get('quantity', 1))
-            total_amount = price * quantity
+            total_amount = _transaction_total(source)
             
             transactions.append({
                 "invoice_no": source.get('invoice_no'),
@@ -467,17 +649,16 @@ def get_high_value_transactions(
                 "customer_gender": source.get('gender')
             })
         
-        total_value = sum(t['total_amount'] for t in transactions)
-        avg_value = total_value / len(transactions) if transactions else 0
+        value = response['aggregations']['value']
         
         return {
             "threshold": min_amount,
             "total_matching": total,
             "transactions_shown": len(transactions),
             "analytics": {
-                "total_value": round(total_value, 2),
-                "average_value": round(avg_value, 2),
-                "highest_transaction": round(transactions[0]['total_amount'], 2) if transactions else 0
+                "total_value": round(value['sum'], 2),
+                "average_value": round(value['avg'] or 0, 2),
+                "highest_transaction": round(value['max'] or 0, 2)
             },
             "transactions": transactions
         }
@@ -491,20 +672,58 @@ def get_high_value_transactions(
         }
 
 
+def _check_month(value: str) -> str:
+    """Validate a YYYY-MM month."""
+    if len(value) != 7 or value[4] != "-":
+        raise ValueError(f"Unrecognized month '{value}', expected YYYY-MM")
+    try:
+        datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise ValueError(f"Unrecognized month '{value}', expected YYYY-MM") from None
+    return value
+
+
 def analyze_shopping_mall_performance(
     shopping_mall: Optional[str] = None,
-    size: int = 50
+    size: int = 50,
+    include_samples: bool = False,
+    category: Optional[str] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    top_n: int = 10
 ) -> Dict[str, Any]:
     """
     Analyze shopping mall performance and customer traffic.
     
+    Answered from the in-memory mall × category × month × payment method revenue
+    cube (see revenue_cube.py), so every mall and category is covered and any
+    slice costs no cluster query until the data changes.
+    
     Args:
         shopping_mall: Specific mall to analyze (None for all malls comparison)
-        size: Sample size for analysis (default: 50)
+        size: Number of sample transactions when include_samples is set (default: 50)
+        include_samples: Also return up to `size` transactions (default: False)
+        category: Restrict to one category (default: all)
+        start_month: First month to include, YYYY-MM (default: all)
+        end_month: Last month to include, YYYY-MM (default: all)
+        top_n: Number of top mall × category segments to return (default: 10)
     
     Returns:
         Dictionary containing mall performance metrics
     """
+    try:
+        for month in (start_month, end_month):
+            if month is not None:
+                _check_month(month)
+        if start_month and end_month and start_month > end_month:
+            raise ValueError("start_month must not be after end_month")
+    except ValueError as e:
+        return {
+            "error": "Invalid month",
+            "message": str(e),
+            "month_range": {"start": start_month, "end": end_month}
+        }
+    
     es = get_elasticsearch_client()
     if not es:
         return {
@@ -513,93 +732,111 @@ def analyze_shopping_mall_performance(
         }
     
     try:
-        if shopping_mall:
-            # Analyze specific mall
-            query = {"term": {"shopping_mall": shopping_mall}}
-        else:
-            # Analyze all malls
-            query = {"match_all": {}}
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
         
-        response = es.search(
-            index="customer_shopping_data.csv",
-            body={
-                "query": query,
-                "size": size,
-                "aggs": {
-                    "malls": {
-                        "terms": {
-                            "field": "shopping_mall",
-                            "size": 20
-                        },
-                        "aggs": {
-                            "revenue": {
-                                "sum": {
-                                    "script": {
-                                        "source": "doc['price'].value * doc['quantity'].value"
-                                    }
-                                }
-                            },
-                            "avg_transaction": {
-                                "avg": {
-                                    "script": {
-                                        "source": "doc['price'].value * doc['quantity'].value"
-                                    }
-                                }
-                            },
-                            "categories": {
-                                "terms": {
-                                    "field": "category",
-                                    "size": 10
-                                }
-                            },
-                            "payment_methods": {
-                                "terms": {
-                                    "field": "payment_method",
-                                    "size": 5
-                                }
-                            },
-                            "avg_customer_age": {
-                                "avg": {"field": "age"}
-                            }
-                        }
-                    }
-                }
-            }
+        cube = get_revenue_cube(es, SHOPPING_INDEX).slice(
+            shopping_mall=shopping_mall,
+            category=category,
+            start_month=start_month,
+            end_month=end_month
         )
+        malls = cube.labels["mall"]
+        categories = cube.labels["category"]
+        payment_methods = cube.labels["payment_method"]
+        
+        by_mall = cube.rollup("mall")
+        by_mall_category = cube.rollup("mall", "category")
+        by_mall_payment = cube.rollup("mall", "payment_method")
         
         mall_stats = []
-        for bucket in response['aggregations']['malls']['buckets']:
+        for m in np.flatnonzero(by_mall["transactions"] > 0):
+            transactions = int(by_mall["transactions"][m])
+            category_counts = by_mall_category["transactions"][m]
+            top_categories = np.argsort(-category_counts, kind="stable")[:5]
             mall_stats.append({
-                "mall_name": bucket['key'],
-                "total_transactions": bucket['doc_count'],
-                "total_revenue": round(bucket['revenue']['value'], 2),
-                "average_transaction_value": round(bucket['avg_transaction']['value'], 2),
-                "average_customer_age": round(bucket['avg_customer_age']['value'], 1),
+                "mall_name": malls[m],
+                "total_transactions": transactions,
+                "total_revenue": round(float(by_mall["revenue"][m]), 2),
+                "average_transaction_value": round(float(by_mall["revenue"][m]) / transactions, 2),
+                "average_customer_age": round(float(by_mall["age_sum"][m]) / transactions, 1),
                 "top_categories": [
-                    {"category": cat['key'], "count": cat['doc_count']}
-                    for cat in bucket['categories']['buckets'][:5]
+                    {
+                        "category": categories[c],
+                        "count": int(category_counts[c]),
+                        "revenue": round(float(by_mall_category["revenue"][m, c]), 2)
+                    }
+                    for c in top_categories if category_counts[c] > 0
                 ],
                 "payment_methods": [
-                    {"method": pm['key'], "count": pm['doc_count']}
-                    for pm in bucket['payment_methods']['buckets']
+                    {"method": payment_methods[p], "count": int(by_mall_payment["transactions"][m, p])}
+                    for p in np.argsort(-by_mall_payment["transactions"][m], kind="stable")
+                    if by_mall_payment["transactions"][m, p] > 0
                 ]
             })
         
         # Sort by revenue
         mall_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
         
-        return {
+        by_month = cube.rollup("month")
+        segment_revenue = by_mall_category["revenue"].ravel()
+        top_segments = np.argsort(-segment_revenue, kind="stable")[:top_n]
+        
+        result = {
             "analysis_type": "specific_mall" if shopping_mall else "all_malls",
             "mall_filter": shopping_mall,
+            "filters_applied": {
+                "category": category,
+                "start_month": start_month,
+                "end_month": end_month
+            },
             "total_malls_analyzed": len(mall_stats),
             "mall_performance": mall_stats,
             "summary": {
                 "highest_revenue_mall": mall_stats[0]['mall_name'] if mall_stats else None,
                 "total_combined_revenue": round(sum(m['total_revenue'] for m in mall_stats), 2),
                 "total_transactions": sum(m['total_transactions'] for m in mall_stats)
+            },
+            "revenue_by_month": [
+                {
+                    "month": month,
+                    "transactions": int(by_month["transactions"][t]),
+                    "revenue": round(float(by_month["revenue"][t]), 2)
+                }
+                for t, month in enumerate(cube.labels["month"])
+            ],
+            "top_segments": [
+                {
+                    "mall": malls[i // len(categories)],
+                    "category": categories[i % len(categories)],
+                    "transactions": int(by_mall_category["transactions"].ravel()[i]),
+                    "revenue": round(float(segment_revenue[i]), 2)
+                }
+                for i in top_segments if segment_revenue[i] > 0
+            ],
+            "cube": {
+                "computed_at": cube.computed_at,
+                "fingerprint": cube.fingerprint
             }
         }
         
+        if include_samples:
+            filters = [{"term": {"shopping_mall": shopping_mall}}] if shopping_mall else []
+            if category:
+                filters.append({"term": {"category": category}})
+            response = es.search(
+                index=SHOPPING_INDEX,
+                body={
+                    "query": {"bool": {"filter": filters}},
+                    "size": size,
+                    "track_total_hits": False
+                }
+            )
+            result["sample_transactions"] = _sample_transactions(response['hits']['hits'])
+        
+        return result
+        
     except Exception as e:
         logger.error(f"Error analyzing shopping mall performance: {str(e)}")
         return {
@@ -614,9 +851,11 @@ def get_payment_method_analytics(
 ) -> Dict[str, Any]:
     """
     Analyze payment method usage patterns and preferences.
+    Aggregation-only: served from the daily rollup when available, no
+    transaction documents are fetched.
     
     Args:
-        size: Sample size for analysis (default: 100)
+        size: Unused; kept for compatibility (default: 100)
     
     Returns:
         Dictionary containing payment method analytics
@@ -629,41 +868,34 @@ def get_payment_method_analytics(
         }
     
     try:
-        response = es.search(
-            index="customer_shopping_data.csv",
-            body={
-                "query": {"match_all": {}},
-                "size": 0,
-                "aggs": {
-                    "payment_methods": {
-                        "terms": {
-                            "field": "payment_method",
-                            "size": 10
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        response = _search_analytics(
+            es,
+            query={"match_all": {}},
+            aggs={
+                "payment_methods": {
+                    "terms": {
+                        "field": "payment_method",
+                        "size": 10
+                    },
+                    "aggs": {
+                        "total_revenue": {
+                            "sum": {"field": "total_amount"}
+                        },
+                        "avg_transaction": {
+                            "avg": {"field": "total_amount"}
                         },
-                        "aggs": {
-                            "total_revenue": {
-                                "sum": {
-                                    "script": {
-                                        "source": "doc['price'].value * doc['quantity'].value"
-                                    }
-                                }
-                            },
-                            "avg_transaction": {
-                                "avg": {
-                                    "script": {
-                                        "source": "doc['price'].value * doc['quantity'].value"
-                                    }
-                                }
-                            },
-                            "gender_distribution": {
-                                "terms": {
-                                    "field": "gender"
-                                }
-                            },
-                            "age_stats": {
-                                "stats": {"field": "age"}
+                        "gender_distribution": {
+                            "terms": {
+                                "field": "gender"
                             }
-                        }
+                        },
+                        "avg_age": {"avg": {"field": "age"}},
+                        "min_age": {"min": {"field": "age"}},
+                        "max_age": {"max": {"field": "age"}}
                     }
                 }
             }
@@ -681,9 +913,9 @@ def get_payment_method_analytics(
                     for g in bucket['gender_distribution']['buckets']
                 ],
                 "customer_age_stats": {
-                    "average": round(bucket['age_stats']['avg'], 1),
-                    "min": bucket['age_stats']['min'],
-                    "max": bucket['age_stats']['max']
+                    "average": round(bucket['avg_age']['value'], 1),
+                    "min": bucket['min_age']['value'],
+                    "max": bucket['max_age']['value']
                 }
             })
         
@@ -704,7 +936,8 @@ def get_payment_method_analytics(
             "payment_methods_count": len(payment_stats),
             "payment_method_analytics": payment_stats,
             "most_popular_method": payment_stats[0]['payment_method'] if payment_stats else None,
-            "highest_revenue_method": max(payment_stats, key=lambda x: x['total_revenue'])['payment_method'] if payment_stats else None
+            "highest_revenue_method": max(payment_stats, key=lambda x: x['total_revenue'])['payment_method'] if payment_stats else None,
+            "data_source": response['data_source']
         }
         
     except Exception as e:
@@ -715,22 +948,59 @@ def get_payment_method_analytics(
         }
 
 
+CALENDAR_INTERVALS = {"day": "day", "week": "week", "month": "month"}
+
+
+def _to_iso_date(value: str) -> str:
+    """Normalize YYYY-MM-DD or DD/MM/YYYY input to YYYY-MM-DD."""
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date '{value}', expected YYYY-MM-DD or DD/MM/YYYY")
+
+
 def search_transactions_by_date_range(
     start_date: str,
     end_date: str,
-    size: int = 50
+    size: int = 50,
+    interval: str = "day"
 ) -> Dict[str, Any]:
     """
     Search transactions within a specific date range.
     
+    Revenue over time comes from a date_histogram on the date-typed invoice_date
+    (see migrations.py), so multi-year ranges are one aggregation with buckets in
+    calendar order. Aggregations run on the daily rollup when available; only the
+    returned transactions are read from the transactions index.
+    
     Args:
         start_date: Start date in format YYYY-MM-DD or DD/MM/YYYY
         end_date: End date in format YYYY-MM-DD or DD/MM/YYYY
         size: Number of results to return (default: 50)
+        interval: Bucket size for sales over time: "day", "week" or "month" (default: "day")
     
     Returns:
         Dictionary containing transactions within the date range
     """
+    if interval not in CALENDAR_INTERVALS:
+        return {
+            "error": "Invalid interval",
+            "message": "interval must be 'day', 'week' or 'month'",
+            "date_range": {"start": start_date, "end": end_date}
+        }
+    
+    try:
+        start_iso = _to_iso_date(start_date)
+        end_iso = _to_iso_date(end_date)
+    except ValueError as e:
+        return {
+            "error": "Invalid date",
+            "message": str(e),
+            "date_range": {"start": start_date, "end": end_date}
+        }
+    
     es = get_elasticsearch_client()
     if not es:
         return {
@@ -739,70 +1009,46 @@ def search_transactions_by_date_range(
         }
     
     try:
-        # Convert date format if needed (YYYY-MM-DD to DD/MM/YYYY)
-        from datetime import datetime
-        
-        # Parse and convert dates
-        try:
-            if '-' in start_date:  # YYYY-MM-DD format
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-                start_formatted = start_dt.strftime("%d/%m/%Y")
-            else:
-                start_formatted = start_date
-                
-            if '-' in end_date:  # YYYY-MM-DD format
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-                end_formatted = end_dt.strftime("%d/%m/%Y")
-            else:
-                end_formatted = end_date
-        except ValueError:
-            # If parsing fails, use original dates
-            start_formatted = start_date
-            end_formatted = end_date
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
         
-        response = es.search(
-            index="customer_shopping_data.csv",
-            body={
-                "query": {
-                    "range": {
-                        "invoice_date": {
-                            "gte": start_formatted,
-                            "lte": end_formatted
-                        }
+        response = _search_analytics(
+            es,
+            query={
+                "range": {
+                    "invoice_date": {
+                        "gte": start_iso,
+                        "lte": end_iso,
+                        "format": "yyyy-MM-dd"
                     }
+                }
+            },
+            sort=[
+                {"invoice_date": {"order": "desc"}}
+            ],
+            rows=size,
+            aggs={
+                "total_revenue": {
+                    "sum": {"field": "total_amount"}
                 },
-                "sort": [
-                    {"invoice_date": {"order": "desc"}}
-                ],
-                "size": size,
-                "aggs": {
-                    "total_revenue": {
-                        "sum": {
-                            "script": {
-                                "source": "doc['price'].value * doc['quantity'].value"
-                            }
-                        }
-                    },
-                    "categories": {
-                        "terms": {
-                            "field": "category",
-                            "size": 10
-                        }
+                "categories": {
+                    "terms": {
+                        "field": "category",
+                        "size": 10
+                    }
+                },
+                "sales_over_time": {
+                    "date_histogram": {
+                        "field": "invoice_date",
+                        "calendar_interval": CALENDAR_INTERVALS[interval],
+                        "format": "yyyy-MM-dd",
+                        "min_doc_count": 0,
+                        "extended_bounds": {"min": start_iso, "max": end_iso}
                     },
-                    "dates": {
-                        "terms": {
-                            "field": "invoice_date",
-                            "size": 365,
-                            "order": {"_key": "asc"}
-                        },
-                        "aggs": {
-                            "daily_revenue": {
-                                "sum": {
-                                    "script": {
-                                        "source": "doc['price'].value * doc['quantity'].value"
-                                    }
-                                }
-                            }
+                    "aggs": {
+                        "revenue": {
+                            "sum": {"field": "total_amount"}
                         }
                     }
                 }
@@ -820,6 +1066,7 @@ def search_transactions_by_date_range(
             },
             "total_transactions": total,
             "transactions_shown": len(hits),
+            "data_source": response['data_source'],
             "analytics": {
                 "total_revenue": round(aggs['total_revenue']['value'], 2),
                 "average_transaction": round(aggs['total_revenue']['value'] / total, 2) if total > 0 else 0,
@@ -827,13 +1074,14 @@ def search_transactions_by_date_range(
                     {"category": bucket['key'], "count": bucket['doc_count']}
                     for bucket in aggs['categories']['buckets']
                 ],
-                "daily_sales": [
+                "interval": interval,
+                "sales_over_time": [
                     {
-                        "date": bucket['key'],
+                        "date": bucket['key_as_string'],
                         "transaction_count": bucket['doc_count'],
-                        "revenue": round(bucket['daily_revenue']['value'], 2)
+                        "revenue": round(bucket['revenue']['value'], 2)
                     }
-                    for bucket in aggs['dates']['buckets']
+                    for bucket in aggs['sales_over_time']['buckets']
                 ]
             },
             "transactions": [
@@ -844,7 +1092,7 @@ def search_transactions_by_date_range(
                     "category": hit['_source'].get('category'),
                     "quantity": hit['_source'].get('quantity'),
                     "price": hit['_source'].get('price'),
-                    "total": round(float(hit['_source'].get('price', 0)) * int(hit['_source'].get('quantity', 1)), 2),
+                    "total": round(_transaction_total(hit['_source']), 2),
                     "payment_method": hit['_source'].get('payment_method'),
                     "shopping_mall": hit['_source'].get('shopping_mall')
                 }
@@ -859,3 +1107,317 @@ def search_transactions_by_date_range(
             "message": str(e),
             "date_range": {"start": start_date, "end": end_date}
         }
+
+
+MAX_EXPORT_SLICES = 8
+
+
+def export_transactions(
+    file_name: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None,
+    slices: int = 1
+) -> Dict[str, Any]:
+    """
+    Export every matching transaction to an NDJSON or Parquet file.
+    
+    Unlike the search tools this is not capped by `size`: results are streamed
+    with a point-in-time and search_after (see export.py) and written as they
+    arrive, so memory stays bounded for any range. Files are only written below
+    SHOPPING_EXPORT_DIR.
+    
+    Args:
+        file_name: File name inside the export directory; .parquet writes Parquet,
+            anything else NDJSON (default: transactions-<UTC timestamp>.ndjson)
+        start_date: First invoice date, YYYY-MM-DD or DD/MM/YYYY (default: no lower bound)
+        end_date: Last invoice date, YYYY-MM-DD or DD/MM/YYYY (default: no upper bound)
+        category: Exact category to export (default: all categories)
+        slices: Parallel point-in-time slices for throughput, 1-8 (default: 1)
+    
+    Returns:
+        Dictionary containing the download path, format, row count and elapsed time
+    """
+    if not 1 <= slices <= MAX_EXPORT_SLICES:
+        return {
+            "error": "Invalid slices",
+            "message": f"slices must be between 1 and {MAX_EXPORT_SLICES}",
+            "slices": slices
+        }
+    
+    file_name = file_name or f"transactions-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.ndjson"
+    try:
+        output_path = resolve_export_path(file_name)
+    except ValueError as e:
+        return {
+            "error": "Invalid file_name",
+            "message": str(e),
+            "file_name": file_name
+        }
+    
+    try:
+        start_iso = _to_iso_date(start_date) if start_date else None
+        end_iso = _to_iso_date(end_date) if end_date else None
+    except ValueError as e:
+        return {
+            "error": "Invalid date",
+            "message": str(e),
+            "date_range": {"start": start_date, "end": end_date}
+        }
+    
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+    
+    try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        result = write_transaction_export(
+            es,
+            output_path,
+            start_date=start_iso,
+            end_date=end_iso,
+            category=category,
+            index=SHOPPING_INDEX,
+            slices=slices
+        )
+        del result["output_path"]
+        return {
+            "download_path": os.path.relpath(output_path, os.path.realpath(EXPORT_DIR)).replace(os.sep, "/"),
+            **result
+        }
+        
+    except Exception as e:
+        logger.error(f"Error exporting transactions: {str(e)}")
+        return {
+            "error": "Export failed",
+            "message": str(e),
+            "file_name": file_name
+        }
+
+
+def get_customer_segments(
+    segment: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    top_n: int = 20
+) -> Dict[str, Any]:
+    """
+    RFM (recency, frequency, monetary) customer segments.
+    
+    Served from the precomputed segmentation (see segmentation.py), which is
+    rebuilt only when the transactions change.
+    
+    Args:
+        segment: Segment to list members of, e.g. "champions" or "at_risk" (default: none)
+        customer_id: Customer to look up (default: none)
+        top_n: Number of segment members to return, highest spend first (default: 20)
+    
+    Returns:
+        Dictionary containing segment sizes and, if requested, members or a customer's segment
+    """
+    if segment is not None and segment not in SEGMENTS:
+        return {
+            "error": "Invalid segment",
+            "message": f"segment must be one of: {', '.join(SEGMENTS)}",
+            "segment": segment
+        }
+    
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+    
+    try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        segmentation = get_rfm_segmentation(es, SHOPPING_INDEX)
+        
+        result = {
+            "total_customers": len(segmentation.customer_ids),
+            "as_of": str(segmentation.as_of),
+            "segments": segmentation.segment_summary(),
+            "computed_at": segmentation.computed_at
+        }
+        
+        if segment is not None:
+            result["segment"] = segment
+            result["members"] = segmentation.members(segment, top_n)
+        
+        if customer_id is not None:
+            record = segmentation.lookup(customer_id)
+            result["customer"] = record if record else {
+                "customer_id": customer_id,
+                "message": "No purchase history found for this customer"
+            }
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error computing customer segments: {str(e)}")
+        return {
+            "error": "Segmentation failed",
+            "message": str(e)
+        }
+
+
+def get_approximate_customer_metrics(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    shopping_mall: Optional[str] = None,
+    category: Optional[str] = None,
+    group_by: Optional[str] = None,
+    top_n: int = 10
+) -> Dict[str, Any]:
+    """
+    Approximate distinct customers, spend quantiles and top customers for any range.
+    
+    Merges the per mall × category × day sketches (HyperLogLog, t-digest and
+    top-k counters, see sketches.py) held in memory, so arbitrary date ranges
+    are answered without querying the cluster.
+    
+    Args:
+        start_date: First day to include, YYYY-MM-DD or DD/MM/YYYY (default: no lower bound)
+        end_date: Last day to include, YYYY-MM-DD or DD/MM/YYYY (default: no upper bound)
+        shopping_mall: Exact mall name (default: all malls)
+        category: Exact category name (default: all categories)
+        group_by: Split results by "mall", "category", "day" or "month" (default: one total)
+        top_n: Number of top customers by spend per group (default: 10)
+    
+    Returns:
+        Dictionary containing one set of approximate metrics per group
+    """
+    if group_by is not None and group_by not in GROUP_BY:
+        return {
+            "error": "Invalid group_by",
+            "message": f"group_by must be one of: {', '.join(GROUP_BY)}",
+            "group_by": group_by
+        }
+    
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+    
+    try:
+        migration_error = _migration_error(es)
+        if migration_error:
+            return migration_error
+        
+        start_iso = _to_iso_date(start_date) if start_date else None
+        end_iso = _to_iso_date(end_date) if end_date else None
+        
+        sketches = get_sales_sketches(es, SHOPPING_INDEX)
+        if sketches is None:
+            return {
+                "error": "Sketches not ready",
+                "message": "Sales sketches are being built in the background; try again shortly"
+            }
+        
+        groups = sketches.query(
+            shopping_mall=shopping_mall,
+            category=category,
+            start_date=start_iso,
+            end_date=end_iso,
+            group_by=group_by,
+            top_n=top_n
+        )
+        
+        return {
+            "groups": groups,
+            "group_by": group_by,
+            "filters_applied": {
+                "start_date": start_iso,
+                "end_date": end_iso,
+                "shopping_mall": shopping_mall,
+                "category": category
+            },
+            "approximate": True,
+            "computed_at": sketches.computed_at
+        }
+        
+    except Exception as e:
+        logger.error(f"Error computing approximate customer metrics: {str(e)}")
+        return {
+            "error": "Sketch query failed",
+            "message": str(e),
+            "filters_applied": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "shopping_mall": shopping_mall,
+                "category": category
+            }
+        }
+
+
+def get_cross_sell_recommendations(
+    category: str,
+    top_n: int = 5,
+    min_customers: int = 5
+) -> Dict[str, Any]:
+    """
+    Categories that buyers of a category also buy, ranked by lift.
+    
+    Read from the precomputed category co-occurrence / lift matrix (see
+    affinity.py), which is rebuilt only when the transactions change.
+    
+    Args:
+        category: Category bought, e.g. "Shoes" (case-insensitive)
+        top_n: Number of categories to recommend (default: 5)
+        min_customers: Minimum customers who bought both categories (default: 5)
+    
+    Returns:
+        Dictionary containing cross-sell categories with shared customers, confidence and lift
+    """
+    es = get_elasticsearch_client()
+    if not es:
+        return {
+            "error": "Elasticsearch client not configured",
+            "message": "Please check ELASTICSEARCH_CLOUD_URL and ELASTICSEARCH_API_KEY env vars"
+        }
+    
+    try:
+        affinity = get_category_affinity(es, SHOPPING_INDEX)
+        if affinity is None:
+            return {
+                "error": "Affinity not ready",
+                "message": "Category affinity is being built in the background; try again shortly"
+            }
+        
+        name = affinity.resolve(category)
+        if name is None:
+            return {
+                "error": "Unknown category",
+                "message": f"category must be one of: {', '.join(affinity.categories)}",
+                "category": category
+            }
+        
+        return {
+            "category": name,
+            "buyers": affinity.buyers(name),
+            "recommendations": affinity.recommendations(name, top_n, min_customers),
+            "basis": {
+                "total_customers": affinity.total_customers,
+                "multi_category_customers": affinity.multi_category_customers,
+                "min_customers": min_customers
+            },
+            "computed_at": affinity.computed_at
+        }
+        
+    except Exception as e:
+        logger.error(f"Error computing cross-sell recommendations: {str(e)}")
+        return {
+            "error": "Cross-sell lookup failed",
+            "message": str(e),
+            "category": category
+        }
@@ -5,28 +5,35 @@ Tests all inventory management functions with the retail_store_inventory index.
 
 import sys
 import os
+import time
+from itertools import islice
 from pathlib import Path
-import importlib.util
 
-# Add the project root to the Python path
-project_root = Path(__file__).parent
-sys.path.insert(0, str(project_root))
+# Add the retail-agents-team directory to the Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root / "retail-agents-team"))
 
-# Load the inventory tools module directly from file
-inventory_tools_path = project_root / "retail-agents-team" / "inventory_agent" / "tools.py"
-spec = importlib.util.spec_from_file_location("inventory_tools", inventory_tools_path)
-inventory_tools = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(inventory_tools)
+# Import the inventory tools as a package module (tools.py uses relative imports)
+from inventory_agent import tools as inventory_tools
+from inventory_agent.columnar import InventoryColumnStore
+from inventory_agent.restock import EXPORT_DIR as RESTOCK_EXPORT_DIR
 
 # Import functions from the module
 check_product_inventory = inventory_tools.check_product_inventory
 search_inventory_by_category = inventory_tools.search_inventory_by_category
 get_low_stock_alerts = inventory_tools.get_low_stock_alerts
+iter_low_stock_alerts = inventory_tools.iter_low_stock_alerts
+export_low_stock_alerts = inventory_tools.export_low_stock_alerts
 get_inventory_by_region = inventory_tools.get_inventory_by_region
 check_demand_forecast = inventory_tools.check_demand_forecast
 get_seasonal_inventory_analysis = inventory_tools.get_seasonal_inventory_analysis
 get_inventory_statistics = inventory_tools.get_inventory_statistics
+check_bulk_inventory = inventory_tools.check_bulk_inventory
+plan_inventory_restock = inventory_tools.plan_inventory_restock
+get_sales_anomalies = inventory_tools.get_sales_anomalies
+get_rebalancing_plan = inventory_tools.get_rebalancing_plan
 get_elasticsearch_client = inventory_tools.get_elasticsearch_client
+_stock_status = inventory_tools._stock_status
 
 def print_section(title):
     """Print a formatted section header."""
@@ -79,6 +86,13 @@ def test_inventory_statistics():
     print("\nRegions:")
     for region in result['regions']:
         print(f"  - {region['region']}: {region['product_count']} products")
+    
+    if "materialized" in result:
+        start = time.perf_counter()
+        cached = get_inventory_statistics()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"\nMaterialized rollup computed at {cached['materialized']['computed_at']}")
+        print(f"  Repeat call: {elapsed_ms:.1f} ms (same totals: {cached['total_inventory'] == result['total_inventory']})")
 
 def test_check_product_inventory():
     """Test checking inventory for a specific product."""
@@ -209,6 +223,18 @@ def test_demand_forecast():
                 for rec in result['restock_recommendations'][:3]:
                     print(f"    Product {rec['product_id']}: Need {rec['shortage']} more units")
                     print(f"      Current: {rec['current_inventory']}, Forecast: {rec['demand_forecast']}")
+        
+        model_result = check_demand_forecast(category=category, size=5, forecast_source="model", horizon_days=7)
+        
+        if "error" in model_result:
+            print(f"✗ Model forecast error: {model_result['error']}")
+        else:
+            print(f"\n✓ Model Forecasts (7 days, history through {model_result['history_through']})")
+            print(f"  Series Needing Restock: {model_result['total_restock_required']} of {model_result['total_matching']}")
+            print(f"  Model Usage: {model_result['model_usage']}")
+            for forecast in model_result['forecasts'][:3]:
+                print(f"    Product {forecast['product_id']} @ {forecast['store_id']}: "
+                      f"{forecast['demand_forecast']} units ({forecast['forecast_model']})")
 
 def test_seasonal_analysis():
     """Test seasonal inventory analysis."""
@@ -232,6 +258,263 @@ def test_seasonal_analysis():
             print(f"    Categories: {len(result['categories'])}")
             break  # Just test one season that has data
 
+def test_snapshot_vs_history():
+    """Test that current stock from the latest snapshot matches the full history."""
+    print_section("Test 8: Latest Snapshot vs. History")
+    
+    category_result = search_inventory_by_category(category="Electronics", size=1)
+    if "error" in category_result or not category_result.get('products'):
+        print("✗ Could not find sample product ID")
+        return
+    
+    product_id = category_result['products'][0]['product_id']
+    snapshot = check_product_inventory(product_id=product_id)
+    history = check_product_inventory(product_id=product_id, history=True)
+    
+    if "error" in snapshot or "error" in history:
+        print(f"✗ Error: {snapshot.get('error') or history.get('error')}")
+        return
+    
+    print(f"Product ID: {product_id}")
+    print(f"  Snapshot: {snapshot['total_inventory']} units from {snapshot['records_scanned']} records")
+    print(f"  History:  {history['total_inventory']} units from {history['records_scanned']} records")
+    if snapshot['total_inventory'] == history['total_inventory']:
+        print("✓ Snapshot matches the latest records in the history")
+    else:
+        print("✗ Snapshot differs from history (snapshot may be refreshing)")
+
+def test_bulk_inventory():
+    """Test checking availability of several products in one call."""
+    print_section("Test 9: Bulk Availability Check")
+    
+    category_result = search_inventory_by_category(category="Electronics", size=3)
+    if "error" in category_result or not category_result.get('products'):
+        print("✗ Could not find sample product IDs")
+        return
+    
+    product_ids = [p['product_id'] for p in category_result['products']] + ["UNKNOWN_PRODUCT"]
+    result = check_bulk_inventory(product_ids=product_ids)
+    
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+        return
+    
+    print(f"✓ Checked {result['total_products']} products")
+    print(f"  All Available: {result['all_available']}")
+    print(f"  Unavailable: {', '.join(result['unavailable_products'])}")
+    for product in result['products']:
+        print(f"    Product {product['product_id']}: "
+              f"{product.get('stock_status', product.get('status'))}")
+
+def test_restock_plan():
+    """Test building a full restock plan with CSV export."""
+    print_section("Test 10: Restock Plan")
+    
+    result = plan_inventory_restock(category="Electronics", top_n=5, file_name="restock_plan_test.csv")
+    
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+        return
+    
+    print(f"✓ Planned {result['rows_analyzed']} rows in {result['elapsed_seconds']}s")
+    print(f"  Rows Short: {result['rows_short']}")
+    print(f"  Rows To Order: {result['rows_to_order']}")
+    print(f"  Total Suggested Order: {result['total_suggested_order']} units")
+    for row in result['top_priorities']:
+        print(f"    #{row['priority_rank']} {row['product_id']} @ {row['store_id']}: "
+              f"cover {row['days_of_cover']} days, order {row['suggested_order']}")
+    print(f"  Exported to: {result['download_path']}")
+    os.remove(os.path.join(RESTOCK_EXPORT_DIR, result['download_path']))
+
+def test_sales_anomalies():
+    """Test detecting abnormal latest-day sales."""
+    print_section("Test 11: Sales Anomalies")
+    
+    result = get_sales_anomalies(top_n=5)
+    
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+        return
+    
+    print(f"✓ Evaluated {result['series_evaluated']} series for {result['date']}")
+    print(f"  Anomalies: {result['total_anomalies']} ({result['spikes']} spikes, {result['drops']} drops)")
+    for anomaly in result['anomalies']:
+        print(f"    {anomaly['direction'].upper()} {anomaly['product_id']} @ {anomaly['store_id']}: "
+              f"{anomaly['units_sold']} sold vs. {anomaly['expected_units']} expected "
+              f"(score {anomaly['robust_score']})")
+
+def test_rebalancing_plan():
+    """Test suggesting transfers between stores."""
+    print_section("Test 12: Inventory Rebalancing")
+    
+    result = get_rebalancing_plan(category="Electronics", top_n=5)
+    
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+        return
+    
+    print(f"✓ {result['total_transfers']} transfers moving {result['units_transferred']} units "
+          f"in {result['elapsed_seconds']}s")
+    print(f"  Shortage Covered: {result['shortage_covered_percent']}% "
+          f"(remaining {result['remaining_shortage']} units)")
+    for transfer in result['transfers']:
+        print(f"    {transfer['product_id']}: {transfer['from_store']} → {transfer['to_store']} "
+              f"({transfer['quantity']} units)")
+
+def test_columnar_engine():
+    """Test the in-memory columnar engine and its incremental refresh."""
+    print_section("Test 13: Columnar Engine")
+    
+    es = get_elasticsearch_client()
+    engine = InventoryColumnStore()
+    loaded = engine.load(es)
+    print(f"✓ Loaded {loaded} rows (watermark {engine.watermark})")
+    print(f"  Product/Store Pairs: {len(engine.latest)}")
+    
+    stats = engine.statistics()
+    cluster_stats = get_inventory_statistics()
+    if "error" in cluster_stats:
+        print(f"✗ Error: {cluster_stats['error']}")
+    elif stats['total_products'] == cluster_stats['total_products']:
+        print(f"✓ Current stock matches Elasticsearch ({stats['total_products']} products)")
+    else:
+        print(f"✗ Current stock differs: {stats['total_products']} vs. {cluster_stats['total_products']} "
+              f"(snapshot may be refreshing)")
+    
+    # The incremental load re-reads the watermark day and must replace, not duplicate, its rows
+    rows_before = engine.row_count
+    reloaded = engine.load(es)
+    print(f"  Incremental load re-read {reloaded} rows of the watermark day")
+    if engine.row_count == rows_before:
+        print(f"✓ Row count unchanged after incremental load ({engine.row_count} rows)")
+    else:
+        print(f"✗ Row count changed: {rows_before} → {engine.row_count} (new data may have arrived)")
+
+def test_stock_status():
+    """Test stock status classification of per-product totals."""
+    print_section("Test 14: Stock Status Classification")
+    
+    cases = [
+        (0, "out_of_stock"),
+        (9, "low_stock"),
+        (10, "moderate_stock"),
+        (49.5, "moderate_stock"),
+        (50, "in_stock")
+    ]
+    for total, expected in cases:
+        status = _stock_status(total)
+        print(f"{'✓' if status == expected else '✗'} {total} units → {status} (expected {expected})")
+    
+    category_result = search_inventory_by_category(category="Electronics", size=1)
+    if "error" in category_result or not category_result.get('products'):
+        print("✗ Could not find sample product ID")
+        return
+    
+    result = check_product_inventory(product_id=category_result['products'][0]['product_id'])
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+    elif result['stock_status'] == _stock_status(result['total_inventory']):
+        print(f"✓ Server-side total of {result['total_inventory']} units classified as {result['stock_status']}")
+    else:
+        print(f"✗ Stock status {result['stock_status']} does not match total {result['total_inventory']}")
+
+def test_low_stock_export():
+    """Test streaming every low stock alert and exporting them to NDJSON."""
+    print_section("Test 15: Low Stock Alert Streaming and Export")
+    
+    summary = get_low_stock_alerts(threshold=10, size=10)
+    if "error" in summary:
+        print(f"✗ Error: {summary['error']}")
+        return
+    
+    levels = [alert['inventory_level'] for alert in islice(iter_low_stock_alerts(threshold=10, page_size=50), 200)]
+    if levels == sorted(levels):
+        print(f"✓ Streamed {len(levels)} alerts, lowest inventory first")
+    else:
+        print("✗ Streamed alerts are not ordered by inventory level")
+    
+    output_path = str(project_root / "low_stock_alerts_test.ndjson")
+    result = export_low_stock_alerts(output_path, threshold=10)
+    if "error" in result:
+        print(f"✗ Error: {result['error']}")
+        return
+    
+    with open(output_path, "r", encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    os.remove(output_path)
+    
+    print(f"✓ Exported {result['total_alerts']} alerts ({lines} lines)")
+    print(f"  Critical: {result['critical_alerts']}, High: {result['high_alerts']}, "
+          f"Low Stock: {result['low_stock_alerts']}")
+    if lines == result['total_alerts'] == summary['total_alerts'] \
+            and result['critical_alerts'] == summary['critical_alerts']:
+        print("✓ Export matches the exact counts of get_low_stock_alerts")
+    else:
+        print(f"✗ Export differs from get_low_stock_alerts ({summary['total_alerts']} alerts)")
+
+def test_regional_inventory_items():
+    """Test that raw regional items are only returned on request."""
+    print_section("Test 16: Regional Inventory Items")
+    
+    for region in ["North", "South", "East", "West"]:
+        compact = get_inventory_by_region(region=region, size=5)
+        if "error" in compact:
+            print(f"✗ Error: {compact['error']}")
+            return
+        if compact['total_results'] > 0:
+            break
+    else:
+        print("ℹ No regional data found")
+        return
+    
+    detailed = get_inventory_by_region(region=region, size=5, include_items=True)
+    if "error" in detailed:
+        print(f"✗ Error: {detailed['error']}")
+        return
+    
+    print(f"Region: {region}")
+    print(f"{'✗' if 'inventory_items' in compact else '✓'} Compact response has no inventory_items")
+    items = detailed.get('inventory_items', [])
+    print(f"{'✓' if 0 < len(items) <= 5 else '✗'} include_items=True returned {len(items)} items (size=5)")
+    if detailed['total_inventory'] == compact['total_inventory']:
+        print(f"✓ Aggregated totals unchanged ({detailed['total_inventory']} units)")
+    else:
+        print(f"✗ Totals differ: {compact['total_inventory']} vs. {detailed['total_inventory']}")
+    for item in items[:3]:
+        print(f"    Product {item['product_id']} @ {item['store_id']}: {item['inventory_level']} units")
+
+def test_seasonal_products():
+    """Test that raw seasonal product records are only returned on request."""
+    print_section("Test 17: Seasonal Product Records")
+    
+    for season in ["Summer", "Winter", "Spring", "Fall"]:
+        compact = get_seasonal_inventory_analysis(seasonality=season, size=5)
+        if "error" in compact:
+            print(f"✗ Error: {compact['error']}")
+            return
+        if compact['total_results'] > 0:
+            break
+    else:
+        print("ℹ No seasonal data found")
+        return
+    
+    detailed = get_seasonal_inventory_analysis(seasonality=season, size=5, include_products=True)
+    if "error" in detailed:
+        print(f"✗ Error: {detailed['error']}")
+        return
+    
+    print(f"Season: {season}")
+    print(f"{'✗' if 'products' in compact else '✓'} Compact response has no products")
+    products = detailed.get('products', [])
+    print(f"{'✓' if 0 < len(products) <= 5 else '✗'} include_products=True returned {len(products)} records (size=5)")
+    if detailed['readiness_score'] == compact['readiness_score']:
+        print(f"✓ Readiness score unchanged ({detailed['readiness_score']}%)")
+    else:
+        print(f"✗ Readiness differs: {compact['readiness_score']}% vs. {detailed['readiness_score']}%")
+    for product in products[:3]:
+        print(f"    Product {product['product_id']} @ {product['store_id']}: "
+              f"{product['inventory_level']} units, forecast {product['demand_forecast']}")
+
 def main():
     """Run all tests."""
     print("\n" + "="*80)
@@ -253,6 +536,16 @@ def main():
         test_regional_inventory()
         test_demand_forecast()
         test_seasonal_analysis()
+        test_snapshot_vs_history()
+        test_bulk_inventory()
+        test_restock_plan()
+        test_sales_anomalies()
+        test_rebalancing_plan()
+        test_columnar_engine()
+        test_stock_status()
+        test_low_stock_export()
+        test_regional_inventory_items()
+        test_seasonal_products()
         
         print("\n" + "="*80)
         print("  ✓ ALL TESTS COMPLETED")
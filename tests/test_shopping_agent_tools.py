@@ -18,8 +18,16 @@ from shopping_agent.tools import (
     get_high_value_transactions,
     analyze_shopping_mall_performance,
     get_payment_method_analytics,
-    search_transactions_by_date_range
+    search_transactions_by_date_range,
+    get_customer_profile,
+    export_transactions,
+    get_customer_segments,
+    get_approximate_customer_metrics,
+    get_cross_sell_recommendations,
+    get_elasticsearch_client
 )
+from shopping_agent.migrations import pending_migrations
+import time
 
 def test_search_by_category():
     """Test searching shopping data by category"""
@@ -54,6 +62,17 @@ def test_search_by_category():
                       f"Qty: {txn['quantity']} | "
                       f"Price: ${txn['price']} | "
                       f"Mall: {txn['shopping_mall']}")
+    
+    # Aggregation-only by default; samples only on request, with identical analytics
+    if "error" not in result:
+        print(f"\n📦 Aggregation-only: {result['results_shown']} transactions returned")
+        sampled = search_shopping_data_by_category(category="Clothing", size=10, include_samples=True)
+        if "error" not in sampled:
+            print(f"   With samples: {sampled['results_shown']} transactions returned")
+            if sampled['analytics'] == result['analytics']:
+                print("✅ Analytics identical with and without samples")
+            else:
+                print("❌ Analytics differ with samples")
 
 
 def test_customer_purchase_history():
@@ -63,7 +82,7 @@ def test_customer_purchase_history():
     print("="*80)
     
     # First, get a customer ID from a search
-    search_result = search_shopping_data_by_category("Clothing", size=1)
+    search_result = search_shopping_data_by_category("Clothing", size=1, include_samples=True)
     
     if "error" not in search_result and search_result['transactions']:
         customer_id = search_result['transactions'][0]['customer_id']
@@ -104,6 +123,16 @@ def test_customer_purchase_history():
                           f"{purchase['category']} | "
                           f"Qty: {purchase['quantity']} | "
                           f"Total: ${purchase['total']}")
+            
+            # Analytics must not depend on the history page size
+            paged = get_customer_purchase_history(customer_id=customer_id, size=1, page=2)
+            if "error" not in paged:
+                print(f"\n📄 Page 2 of {paged['pagination']['total_pages']} (size=1): "
+                      f"{paged['purchases_shown']} purchase(s)")
+                if paged['spending_analytics'] == spending:
+                    print("✅ Lifetime analytics identical across page sizes")
+                else:
+                    print("❌ Lifetime analytics changed with page size")
     else:
         print("⚠️ Could not find a customer ID to test with")
 
@@ -181,6 +210,12 @@ def test_high_value_transactions():
                       f"{txn['category']} | "
                       f"Qty: {txn['quantity']} × ${txn['unit_price']} | "
                       f"{txn['payment_method']}")
+        
+        amounts = [txn['total_amount'] for txn in result['transactions']]
+        if amounts == sorted(amounts, reverse=True) and all(a >= result['threshold'] for a in amounts):
+            print(f"\n✅ Sorted by total_amount, all above threshold")
+        else:
+            print(f"\n❌ total_amount ordering/threshold mismatch (run: python -m shopping_agent.migrations total-amount)")
 
 
 def test_mall_performance():
@@ -214,6 +249,18 @@ def test_mall_performance():
             print(f"      Avg Transaction: ${mall['average_transaction_value']}")
             print(f"      Avg Customer Age: {mall['average_customer_age']}")
             print(f"      Top Categories: {', '.join([c['category'] for c in mall['top_categories'][:3]])}")
+    
+    # Slices are answered from the in-memory revenue cube
+    started = time.perf_counter()
+    sliced = analyze_shopping_mall_performance(category="Shoes", start_month="2022-01", end_month="2022-12", top_n=3)
+    elapsed = (time.perf_counter() - started) * 1000
+    if "error" in sliced:
+        print(f"❌ Error: {sliced['error']}")
+    else:
+        print(f"\n🧊 Shoes in 2022 ({elapsed:.1f} ms, cube {sliced['cube']['fingerprint']}):")
+        print(f"   Revenue: ${sliced['summary']['total_combined_revenue']} across {len(sliced['revenue_by_month'])} months")
+        for segment in sliced['top_segments']:
+            print(f"   {segment['mall']} / {segment['category']}: ${segment['revenue']}")
 
 
 def test_payment_analytics():
@@ -277,10 +324,238 @@ def test_date_range_search():
         for i, cat in enumerate(analytics['top_categories'][:5], 1):
             print(f"   {i}. {cat['category']}: {cat['count']} transactions")
         
-        if analytics['daily_sales']:
+        if analytics['sales_over_time']:
             print(f"\n📅 Daily Sales Sample (showing 5 days):")
-            for i, day in enumerate(analytics['daily_sales'][:5], 1):
+            for i, day in enumerate(analytics['sales_over_time'][:5], 1):
                 print(f"   {i}. {day['date']}: {day['transaction_count']} transactions, ${day['revenue']}")
+    
+    monthly = search_transactions_by_date_range(
+        start_date="2021-01-01",
+        end_date="2022-12-31",
+        size=0,
+        interval="month"
+    )
+    
+    if "error" in monthly:
+        print(f"❌ Error: {monthly['error']}")
+    else:
+        buckets = monthly['analytics']['sales_over_time']
+        print(f"\n📆 Monthly Buckets Across Two Years: {len(buckets)}")
+        for bucket in buckets[:3]:
+            print(f"   {bucket['date']}: {bucket['transaction_count']} transactions, ${bucket['revenue']}")
+
+
+
+def test_customer_profile():
+    """Test the precomputed customer profile lookup"""
+    print("\n" + "="*80)
+    print("TEST 8: Get Customer Profile (Customer 360)")
+    print("="*80)
+    
+    search_result = search_shopping_data_by_category("Shoes", size=1, include_samples=True)
+    
+    if "error" in search_result or not search_result['transactions']:
+        print("⚠️ Could not find a customer ID to test with")
+        return
+    
+    customer_id = search_result['transactions'][0]['customer_id']
+    result = get_customer_profile(customer_id)
+    
+    if "error" in result:
+        print(f"❌ Error: {result['error']}")
+        return
+    
+    print(f"✅ Customer ID: {result['customer_id']} (source: {result['profile_source']})")
+    print(f"   Orders: {result['order_count']} | Lifetime Spend: ${result['lifetime_spend']}")
+    print(f"   First/Last Purchase: {result['first_purchase']} / {result['last_purchase']}")
+    print(f"   Recency: {result['recency_days']} days (as of {result['as_of']})")
+    print(f"   Favorite Category: {result['favorite_category']} | Favorite Mall: {result['favorite_mall']}")
+    
+    # The profile must agree with the exact aggregation over the transactions
+    history = get_customer_purchase_history(customer_id=customer_id, size=1)
+    if "error" not in history:
+        matches = (history['total_purchases'] == result['order_count'] and
+                   history['spending_analytics']['total_spent'] == result['lifetime_spend'])
+        print(f"{'✅' if matches else '❌'} Profile matches purchase history aggregation")
+    
+    # Second lookup is served from the in-process LRU
+    started = time.perf_counter()
+    cached = get_customer_profile(customer_id)
+    print(f"\n⚡ Repeat lookup: {(time.perf_counter() - started) * 1000:.1f} ms "
+          f"(source: {cached.get('profile_source')})")
+
+
+
+def test_export_transactions():
+    """Test streaming transaction export"""
+    print("\n" + "="*80)
+    print("TEST 9: Export Transactions - January 2022 (NDJSON, 2 slices)")
+    print("="*80)
+    
+    import json
+    from shopping_agent.export import EXPORT_DIR
+    
+    result = export_transactions("test-transactions.ndjson", start_date="2022-01-01", end_date="2022-01-31", slices=2)
+    
+    if "error" in result:
+        print(f"❌ Error: {result['error']}")
+        return
+    
+    output_path = os.path.join(EXPORT_DIR, result['download_path'])
+    with open(output_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    os.remove(output_path)
+    print(f"✅ Exported {result['rows_exported']} rows in {result['elapsed_seconds']}s -> {result['download_path']}")
+    
+    expected = search_transactions_by_date_range("2022-01-01", "2022-01-31", size=0)
+    if "error" not in expected:
+        matches = len(rows) == expected['total_transactions'] == len({r['invoice_no'] for r in rows})
+        print(f"{'✅' if matches else '❌'} Row count matches date range search ({expected['total_transactions']})")
+    
+    # Paths outside the export directory are refused before anything is written
+    for file_name in ["/tmp/transactions.ndjson", "../transactions.ndjson", "reports/../../transactions.ndjson"]:
+        rejected = export_transactions(file_name, start_date="2022-01-01", end_date="2022-01-01")
+        print(f"{'✅' if rejected.get('error') == 'Invalid file_name' else '❌'} Rejected {file_name}")
+
+
+
+def test_customer_segments():
+    """Test RFM customer segmentation"""
+    print("\n" + "="*80)
+    print("TEST 10: RFM Customer Segments")
+    print("="*80)
+    
+    result = get_customer_segments(segment="champions", top_n=3)
+    
+    if "error" in result:
+        print(f"❌ Error: {result['error']}")
+        return
+    
+    print(f"✅ {result['total_customers']} customers segmented (as of {result['as_of']})")
+    for row in result['segments']:
+        print(f"   {row['segment']:<20} {row['customers']:>7} customers  "
+              f"{row['revenue_share']:>6}% revenue  avg recency {row['avg_recency_days']} days")
+    
+    print(f"\n🏆 Top Champions:")
+    for member in result['members']:
+        print(f"   {member['customer_id']} | RFM {member['rfm_score']} | ${member['monetary']}")
+    
+    covered = sum(row['customers'] for row in result['segments'])
+    print(f"{'✅' if covered == result['total_customers'] else '❌'} Every customer is in exactly one segment")
+    
+    # Second call is served from memory
+    started = time.perf_counter()
+    get_customer_segments()
+    print(f"\n⚡ Repeat call: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def test_approximate_customer_metrics():
+    """Test sketch-based distinct customers and spend quantiles"""
+    print("\n" + "="*80)
+    print("TEST 11: Approximate Customer Metrics (sketches)")
+    print("="*80)
+    
+    result = get_approximate_customer_metrics(start_date="2022-01-01", end_date="2022-12-31", group_by="mall", top_n=3)
+    
+    if "error" in result:
+        print(f"❌ Error: {result['error']}")
+        return
+    
+    print(f"✅ {len(result['groups'])} malls in 2022")
+    for group in result['groups']:
+        quantiles = group['spend_quantiles']
+        print(f"   {group['mall']:<20} ~{group['distinct_customers']:>6} customers  "
+              f"{group['transactions']:>6} transactions  p50 ${quantiles['p50']}  p95 ${quantiles['p95']}")
+    
+    # Sketch counts are exact and must match the revenue cube
+    mall = result['groups'][0]['mall']
+    exact = analyze_shopping_mall_performance(shopping_mall=mall, start_month="2022-01", end_month="2022-12")
+    if "error" not in exact and exact['mall_performance']:
+        print(f"\n🔍 {mall}: {exact['mall_performance'][0]['total_transactions']} transactions (cube) vs "
+              f"{result['groups'][0]['transactions']} (sketches)")
+    
+    # Arbitrary ranges are merged in memory
+    started = time.perf_counter()
+    get_approximate_customer_metrics(start_date="2022-03-05", end_date="2022-03-19", category="Shoes")
+    print(f"\n⚡ Two-week range: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def test_daily_rollup():
+    """Test that rollup-served analytics agree with the transactions"""
+    print("\n" + "="*80)
+    print("TEST 12: Daily Rollup Query Planner")
+    print("="*80)
+    
+    payments = get_payment_method_analytics()
+    malls = analyze_shopping_mall_performance()
+    
+    if "error" in payments or "error" in malls:
+        print(f"❌ Error: {payments.get('error') or malls.get('error')}")
+        return
+    
+    print(f"✅ Payment analytics served from: {payments['data_source']}")
+    rollup_total = payments['total_transactions_analyzed']
+    cube_total = malls['summary']['total_transactions']
+    print(f"{'✅' if rollup_total == cube_total else '❌'} {rollup_total} transactions (rollup) vs {cube_total} (cube)")
+    
+    # Row-level detail still comes from the transactions
+    result = search_transactions_by_date_range("2022-01-01", "2022-01-31", size=5, interval="week")
+    if "error" not in result:
+        print(f"✅ Date range: {result['total_transactions']} transactions from {result['data_source']}, "
+              f"{result['transactions_shown']} rows shown")
+    
+    started = time.perf_counter()
+    analyze_shopping_trends_by_gender("Female")
+    print(f"\n⚡ Gender analytics: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def test_cross_sell_recommendations():
+    """Test category affinity cross-sell recommendations"""
+    print("\n" + "="*80)
+    print("TEST 13: Cross-Sell Recommendations")
+    print("="*80)
+    
+    result = get_cross_sell_recommendations("Shoes", top_n=3, min_customers=1)
+    
+    if "error" in result:
+        print(f"❌ Error: {result['error']}")
+        return
+    
+    basis = result['basis']
+    print(f"✅ {result['buyers']} Shoes buyers; {basis['multi_category_customers']} of "
+          f"{basis['total_customers']} customers bought more than one category")
+    for row in result['recommendations']:
+        print(f"   {row['category']:<20} {row['customers_both']:>6} shared  "
+              f"confidence {row['confidence']:.2%}  lift {row['lift']}")
+    
+    unknown = get_cross_sell_recommendations("NotACategory")
+    print(f"{'✅' if 'error' in unknown else '❌'} Unknown category rejected")
+    
+    # Second call reads the precomputed matrix
+    started = time.perf_counter()
+    get_cross_sell_recommendations("Clothing")
+    print(f"\n⚡ Repeat call: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+
+def test_migration_status():
+    """Test that the shopping index has the migrations the tools rely on"""
+    print("\n" + "="*80)
+    print("TEST 14: Index Migration Status")
+    print("="*80)
+    
+    es = get_elasticsearch_client()
+    if not es:
+        print("❌ Elasticsearch client not configured")
+        return
+    
+    pending = pending_migrations(es)
+    if pending:
+        print(f"❌ Pending migrations: {', '.join(pending)}")
+        result = get_payment_method_analytics()
+        print(f"{'✅' if result.get('pending_migrations') == pending else '❌'} Tools report: {result.get('message')}")
+    else:
+        print("✅ Index is migrated; tools can rely on total_amount and a date-typed invoice_date")
 
 
 if __name__ == "__main__":
@@ -296,6 +571,13 @@ if __name__ == "__main__":
         test_mall_performance()
         test_payment_analytics()
         test_date_range_search()
+        test_customer_profile()
+        test_export_transactions()
+        test_customer_segments()
+        test_approximate_customer_metrics()
+        test_daily_rollup()
+        test_cross_sell_recommendations()
+        test_migration_status()
         
         print("\n" + "="*80)
         print("✅ ALL TESTS COMPLETED SUCCESSFULLY!")